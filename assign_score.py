@@ -5,7 +5,7 @@ from components import Btn, ImageBtn, Text, Line, Image, Stage
 #game mode. This implements a UI element required by components/Screen.
 #Please refer to components/Screen for documentation on each of the methods.
 class AssignScore:
-	def __init__(self, wrong_notes, early_notes, timing, score, fps):
+	def __init__(self, wrong_notes, early_notes, time_used, score):
 		#Various settings
 		self.stage = Stage()
 
@@ -19,16 +19,10 @@ class AssignScore:
 		self.stage = Stage()
 		self.exit_btn = Btn("Exit", (40, 200), on_click = \
 			self.on_exit_btn_click)
-		expected_dur = 0.0
-		num_notes = 0
-		total_bars = score.get_total_bars()
-		for i in range(total_bars):
-			curr_bar = score.get_bar(i)
-			expected_dur += curr_bar.get_length() * 60.0 * fps \
-			/ curr_bar.get_bpm()
-			num_notes += len(curr_bar.get_treble())
-			num_notes += len(curr_bar.get_bass())
-		used_dur = float(timing)
+		#Expected duration in seconds
+		expected_dur = score.get_duration()
+		num_notes = score.get_note_count()
+		used_dur = float(time_used)
 		pct_time = used_dur / expected_dur * 100
 		pct_early = float(early_notes) / num_notes * 100
 		pct_wrong = float(wrong_notes) / num_notes * 100
@@ -37,9 +31,9 @@ class AssignScore:
 		early_notes_txt = Text("Early Notes: {0:} ({1:.2f}%)"\
 			.format(early_notes, pct_early), (20, 50), centering = "topleft")
 		timing_txt = Text("Time Used: {0:.2f}s ({1:.2f}%)" \
-			.format(used_dur / fps, pct_time), \
+			.format(used_dur, pct_time), \
 			(20, 80), centering = "topleft")
-		expected_time = Text("Expected: {0:.2f}s".format(expected_dur / fps), \
+		expected_time = Text("Expected: {0:.2f}s".format(expected_dur), \
 			(20, 110), centering = "topleft")
 		#cutoff (pct_wrong, pct_early, pct_time)
 		grade_cutoff = [('S', 1.0, 1.0, 110.0), \
@@ -70,10 +64,16 @@ class AssignScore:
 	def draw(self, screen):
 		self.stage.draw(screen)
 
+	def get_dirty_rects(self):
+		return self.stage.get_dirty_rects()
+
 	def handle_click(self, pos):
 		self.stage.handle_click(pos)
 
-	def advance_time(self, fps):
+	def advance_time(self, dt):
+		return True
+
+	def is_idle(self):
 		return True
 
 	def on_exit_btn_click(self, btn, pos):
@@ -0,0 +1,471 @@
+"""
+Headless rendering benchmark for RenderedScore, TrainingScore and GameScore.
+
+Every score in ./scores (and a few generated stress scores) is played from
+start to finish in each mode at a fixed fps using the dummy SDL video driver,
+a stub audio player and an input that never presses anything. The time taken
+by advance_time, draw and every page refresh is recorded per frame and the
+p50/p95/p99 are printed and saved as JSON, so that regressions show up when
+diffing the results of two runs. GameScore is also played at every fps given
+by --timing-fps, and the benchmark exits with status 1 if it doesn't take the
+same time to play a score at each of them, or if any mode stops at the
+most frames it is given (a second longer than the score) without finishing.
+
+BtnInput.poll is also timed against simulated port expanders whose I2C
+transactions take --i2c-latency milliseconds, while buttons are pressed and
+released.
+
+With --replay, input logs recorded with main.py --game score --record log are
+replayed as fast as possible through GameScore on the score they were
+recorded on instead, frame by frame as they were recorded. Their frame times
+and how they were judged (early and wrong notes, time used) are saved, and
+the early and wrong notes are checked against how the recorded game was
+judged. The benchmark exits with status 1 if any of them differ or don't
+finish.
+
+To use
+python benchmark.py [--fps 30] [--out benchmark.json] [--no-stress]
+	[--modes score training game] [--i2c-latency 0.45] [--polls 1000]
+	[--timing-fps 10 30 60] [score files...]
+python benchmark.py --replay log [log...] [--fps 30] [--out benchmark.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+#Render into memory instead of onto the screen, and never open an audio device
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import pygame
+import pitch_table
+from components import Screen
+from music import RenderedScore, NoteImgCache, Score, page_cache
+from training import TrainingScore
+from game import GameScore
+from input import BtnInput, ReplayInput
+from hardware_sim import SimulatedMCP23017
+
+white = (255,255,255)
+
+#Percentiles that are reported for every measurement
+percentiles = [50, 95, 99]
+
+#The classes that are benchmarked, keyed by mode name
+modes = {"score": RenderedScore, "training": TrainingScore, "game": GameScore}
+
+"""
+[StubPlayer] stands in for an AudioPlayer. It recognises every pitch and
+keeps track of what is playing without making any sound, so that audio
+doesn't affect the measurements and no sound files are needed.
+"""
+class StubPlayer:
+	def __init__(self):
+		self.playing = set()
+
+	def has_note(self, pitch):
+		return pitch == pitch_table.REST or pitch in pitch_table.NAMES
+
+	def get_pitches(self):
+		return set(pitch_table.NAMES.keys()) | {pitch_table.REST}
+
+	def prepare(self, pitches):
+		pass
+
+	def play_note(self, pitches):
+		self.playing.update(pitches)
+
+	def stop_note(self, pitches):
+		self.playing.difference_update(pitches)
+
+	def stop_all(self):
+		self.playing = set()
+
+	def finish(self):
+		self.playing = set()
+
+"""
+[StubInput] stands in for a KeyboardInput / BtnInput that never presses
+anything. It has no playable pitches, so every note is treated as correct
+and GameScore plays through the score on its own.
+"""
+class StubInput:
+	def get_playable_pitches(self):
+		return set()
+
+	def poll(self):
+		pass
+
+	def handle_event(self, evt):
+		pass
+
+	def get_events(self):
+		return []
+
+	def get_updates(self):
+		return {}
+
+"""
+[write_stress_scores directory] writes synthetic scores that stress the
+renderer into [directory] and returns their paths. These cover dense chords
+with sharps and ledger lines, very long scores and a change of pace and
+timing in every bar.
+"""
+def write_stress_scores(directory):
+	scores = {}
+	#Semiquaver chords far above and below the staff
+	lines = ["Stress Chords", "120", "4 4", ""]
+	for bar in range(32):
+		for i in range(16):
+			if i % 2 == 0:
+				lines.append("T A5,C#6,E6 0.25")
+				lines.append("B E2,G#2,B2 0.25")
+			else:
+				lines.append("T F3,A3,C#4 0.25")
+				lines.append("B C#4,E4,G#4 0.25")
+		lines.append("")
+	scores["stress_chords.scr"] = lines
+	#Many short pages
+	lines = ["Stress Long", "200", "3 4", ""]
+	names = ["C4", "E4", "G4", "-", "C5", "A#4"]
+	for bar in range(512):
+		for i in range(3):
+			lines.append("T {} 1".format(names[(bar + i) % len(names)]))
+		lines.append("B C3 2")
+		lines.append("B - 1")
+		lines.append("")
+	scores["stress_long.scr"] = lines
+	#A change of pace and timing in every bar
+	lines = ["Stress Changes", "90", "4 4", ""]
+	for bar in range(64):
+		lines.append("CHANGE PACE {}".format(60 + (bar * 37) % 140))
+		if bar % 2 == 0:
+			lines.append("CHANGE TIMING 4 4")
+			lines += ["T D5 1.5", "T F#5 0.5", "T A5 2"]
+			lines += ["B D3,A3 4"]
+		else:
+			lines.append("CHANGE TIMING 3 4")
+			lines += ["T E5 0.75", "T G5 0.25", "T B5 2"]
+			lines += ["B G2 1", "B B2,D3 2"]
+		lines.append("")
+	scores["stress_changes.scr"] = lines
+	paths = []
+	for file_name, lines in scores.items():
+		path = os.path.join(directory, file_name)
+		with open(path, 'w') as file:
+			file.write("\n".join(lines))
+		paths.append(path)
+	return paths
+
+#[summarise samples] returns a dictionary of the count, percentiles and
+#maximum of [samples] (in seconds) in milliseconds
+def summarise(samples):
+	summary = {"count": len(samples)}
+	ordered = sorted(samples)
+	for percentile in percentiles:
+		if len(ordered) == 0:
+			value = 0.0
+		else:
+			#Nearest rank
+			rank = max(0, -(-percentile * len(ordered) // 100) - 1)
+			value = ordered[rank]
+		summary["p{}".format(percentile)] = round(value * 1000, 3)
+	summary["max"] = round(ordered[-1] * 1000, 3) if len(ordered) > 0 \
+		else 0.0
+	return summary
+
+"""
+[timed fn samples] returns a function that calls [fn] and appends the time
+taken (in seconds) to the list [samples]
+"""
+def timed(fn, samples):
+	def wrapper(*args, **kwargs):
+		start = time.perf_counter()
+		result = fn(*args, **kwargs)
+		samples.append(time.perf_counter() - start)
+		return result
+	return wrapper
+
+"""
+[run score mode screen note_imgs player fps key_input] plays [score] from
+start to finish in [mode] (a key of [modes]) at [fps] with [key_input] (a
+StubInput if None), drawing every frame onto [screen], and returns a
+dictionary of the measurements in milliseconds
+"""
+def run(score, mode, screen, note_imgs, player, fps, key_input = None):
+	samples = {"advance_time": [], "draw": [], "page_refresh": [], \
+		"frame": []}
+	#Every run starts with no pages rendered
+	page_cache.clear()
+	if mode == "score":
+		elem = RenderedScore(note_imgs, player, score)
+	else:
+		if key_input == None:
+			key_input = StubInput()
+		elem = modes[mode](note_imgs, player, key_input, score)
+	Screen(elem)
+	elem.refresh_timings = timed(elem.refresh_timings, samples["page_refresh"])
+	#Every mode plays through the score in its duration, with a second to
+	#spare. Runs that are stopped here haven't finished, which fails the
+	#benchmark.
+	max_frames = int(score.get_duration() * fps) + fps
+	replay = isinstance(key_input, ReplayInput)
+	if replay:
+		#A player can take longer than the score
+		max_frames += len(key_input.polls)
+	frames = 0
+	while not elem.has_quit() and frames < max_frames:
+		#Replays are advanced frame by frame like they were recorded
+		dt = key_input.get_next_dt() if replay else 1.0 / fps
+		start = time.perf_counter()
+		elem.advance_time(dt)
+		advanced = time.perf_counter()
+		screen.fill(white)
+		elem.draw(screen)
+		elem.get_dirty_rects()
+		drawn = time.perf_counter()
+		samples["advance_time"].append(advanced - start)
+		samples["draw"].append(drawn - advanced)
+		samples["frame"].append(drawn - start)
+		frames += 1
+	player.stop_all()
+	result = {name: summarise(values) for name, values in samples.items()}
+	result["finished"] = elem.has_quit()
+	if mode == "game":
+		result["early_notes"] = elem.early_notes
+		result["wrong_notes"] = elem.wrong_notes
+		result["time_used"] = round(elem.time_used, 3)
+	return result
+
+"""
+[run_replay path screen note_imgs player fps] replays the input log at [path]
+through GameScore on the score in ./scores that it was recorded on, with the
+frames that were recorded (then at [fps]), and returns the result of [run],
+or None if the score can't be loaded
+"""
+def run_replay(path, screen, note_imgs, player, fps):
+	key_input = ReplayInput(path, frame_time = 1.0 / fps)
+	file_name = key_input.info.get("score")
+	if file_name == None:
+		print("Skipping {}: it wasn't recorded with --game".format(path))
+		return None
+	score = Score(os.path.join("./scores", file_name), note_imgs, player, \
+		use_cache = False)
+	if not score.valid:
+		print("Skipping {}: {}".format(path, " ".join(score.reason.split())))
+		return None
+	result = run(score, "game", screen, note_imgs, player, fps, key_input)
+	result["score"] = file_name
+	#Logs recorded by main.py store how the game was judged live
+	recorded = key_input.info.get("results")
+	if recorded != None:
+		result["recorded"] = recorded
+		result["matches"] = result["finished"] and all(result[name] == \
+			recorded[name] for name in ["early_notes", "wrong_notes"])
+	return result
+
+"""
+[check_timing score screen note_imgs player all_fps] plays [score] through
+GameScore with every note right (with a StubInput) at every fps in [all_fps]
+and returns a dictionary of the time used at each fps and whether they match.
+The playback doesn't depend on the frame rate, so they can only differ by a
+frame of the slowest fps and a step.
+"""
+def check_timing(score, screen, note_imgs, player, all_fps):
+	time_used = {}
+	for fps in all_fps:
+		result = run(score, "game", screen, note_imgs, player, fps)
+		time_used[fps] = result["time_used"] if result["finished"] else None
+	times = list(time_used.values())
+	tolerance = 1.0 / min(all_fps) + 1.0 / 120
+	matches = None not in times and max(times) - min(times) <= tolerance
+	return {"time_used": time_used, "matches": matches}
+
+"""
+[run_poll latency polls] polls a BtnInput reading two SimulatedMCP23017s
+(whose transactions take [latency] seconds) [polls] times, pressing and
+releasing a button every few polls, and returns a dictionary of the poll
+times in milliseconds, the I2C transactions per poll and the number of
+button changes that were reported
+"""
+def run_poll(latency, polls):
+	mcps = [SimulatedMCP23017(address, latency) for address in [0x20, 0x21]]
+	btn_input = BtnInput(mcps)
+	pins = [(mcp, pin) for mcp, pins in zip(mcps, btn_input.pins) \
+		for pin in pins]
+	for mcp in mcps:
+		mcp.transactions = 0
+	samples = []
+	changes = 0
+	for i in range(polls):
+		#Hold each button for 5 polls, longer than the debounce
+		if i % 5 == 0:
+			mcp, pin = pins[(i // 10) % len(pins)]
+			if (i // 5) % 2 == 0:
+				mcp.press(pin)
+			else:
+				mcp.release(pin)
+		start = time.perf_counter()
+		btn_input.poll()
+		samples.append(time.perf_counter() - start)
+		changes += len(btn_input.get_updates())
+	result = {"poll": summarise(samples)}
+	result["transactions_per_poll"] = sum(mcp.transactions for mcp in mcps) \
+		/ float(polls)
+	result["changes"] = changes
+	return result
+
+"""
+[print_results results] prints a table of the frame times in [results] and
+returns the list of failures, which are the runs that stopped at the most
+frames they were given before the score finished
+"""
+def print_results(results):
+	failures = []
+	print("{:24} {:9} {:>34} {:>34} {:>34} {:>9}".format("score", "mode", \
+		"advance_time p50/p95/p99 ms", "draw p50/p95/p99 ms", \
+		"page_refresh p50/p95/p99 ms", "finished"))
+	for file_name, by_mode in results.items():
+		for mode, result in by_mode.items():
+			cols = []
+			for name in ["advance_time", "draw", "page_refresh"]:
+				cols.append("{p50:>10.3f} {p95:>10.3f} {p99:>10.3f}" \
+					.format(**result[name]))
+			print("{:24} {:9} {:>34} {:>34} {:>34} {:>9}".format(file_name, \
+				mode, *cols, str(result["finished"])))
+			if not result["finished"]:
+				failures.append("{} didn't finish in {} mode".format( \
+					file_name, mode))
+	for failure in failures:
+		print(failure)
+	return failures
+
+#[print_timing timing all_fps] prints the time used by every score in
+#[timing] at each fps in [all_fps] and returns the list of failures
+def print_timing(timing, all_fps):
+	failures = []
+	print("{:24} {}".format("score", " ".join("{:>10}".format( \
+		"{} fps".format(fps)) for fps in all_fps)))
+	for file_name, result in timing.items():
+		print("{:24} {}".format(file_name, " ".join("{:>10}".format("-" \
+			if result["time_used"][fps] == None else "{:.3f}".format( \
+			result["time_used"][fps])) for fps in all_fps)))
+		if not result["matches"]:
+			failures.append("{} takes a different time at each fps" \
+				.format(file_name))
+	for failure in failures:
+		print(failure)
+	return failures
+
+#[replay_logs args screen note_imgs player] replays the logs given by
+#--replay, writes their results and returns the list of failures
+def replay_logs(args, screen, note_imgs, player):
+	results = {}
+	for path in args.replay:
+		result = run_replay(path, screen, note_imgs, player, args.fps)
+		if result != None:
+			results[os.path.basename(path)] = {"game": result}
+	failures = print_results(results)
+	print("{:24} {:24} {:>6} {:>6} {:>10} {:>9} {:>8}".format("log", \
+		"score", "early", "wrong", "time used", "finished", "matches"))
+	mismatches = []
+	for file_name, by_mode in results.items():
+		result = by_mode["game"]
+		matches = result.get("matches")
+		if matches == False:
+			mismatches.append("{} was judged differently than when it was \
+recorded".format(file_name))
+		print("{:24} {:24} {:>6} {:>6} {:>10.3f} {:>9} {:>8}".format( \
+			file_name, result["score"], result["early_notes"], \
+			result["wrong_notes"], result["time_used"], \
+			str(result["finished"]), "-" if matches == None else str(matches)))
+	for failure in mismatches:
+		print(failure)
+	failures += mismatches
+	with open(args.out, 'w') as file:
+		json.dump({"fps": args.fps, "percentiles": percentiles, \
+			"replays": results, "failures": failures}, file, indent = 2, \
+			sort_keys = True)
+		file.write("\n")
+	print("Results written to {}".format(args.out))
+	return failures
+
+def main():
+	parser = argparse.ArgumentParser(description = "Headless rendering \
+		benchmark for RenderedScore, TrainingScore and GameScore")
+	parser.add_argument("scores", nargs = "*", help = "score files to \
+		benchmark (every score in ./scores if none are given)")
+	parser.add_argument("--fps", type = int, default = 30)
+	parser.add_argument("--out", default = "benchmark.json", \
+		help = "file that the JSON results are written to")
+	parser.add_argument("--modes", nargs = "+", default = list(modes), \
+		choices = list(modes))
+	parser.add_argument("--no-stress", action = "store_true", \
+		help = "don't benchmark the generated stress scores")
+	parser.add_argument("--i2c-latency", type = float, default = 0.45, \
+		help = "milliseconds taken by every simulated I2C transaction")
+	parser.add_argument("--polls", type = int, default = 1000, \
+		help = "number of times BtnInput is polled")
+	parser.add_argument("--timing-fps", type = int, nargs = "+", \
+		default = [10, 30, 60], help = "frame rates that GameScore has to \
+		take the same time at when every note is played right")
+	parser.add_argument("--replay", nargs = "+", default = [], help = \
+		"input logs to replay through GameScore instead")
+	args = parser.parse_args()
+
+	pygame.init()
+	screen = pygame.display.set_mode((320, 240))
+	note_imgs = NoteImgCache()
+	player = StubPlayer()
+	if len(args.replay) > 0:
+		failures = replay_logs(args, screen, note_imgs, player)
+		pygame.quit()
+		if len(failures) > 0:
+			sys.exit(1)
+		return
+	paths = args.scores
+	if len(paths) == 0:
+		paths = [os.path.join("./scores", file_name) for file_name in \
+			sorted(os.listdir("./scores")) if file_name.endswith(".scr")]
+	stress_dir = tempfile.mkdtemp()
+	try:
+		if not args.no_stress:
+			paths = paths + write_stress_scores(stress_dir)
+		results = {}
+		timing = {}
+		for path in paths:
+			score = Score(path, note_imgs, player, use_cache = False)
+			if not score.valid:
+				print("Skipping {}: {}".format(path, " ".join( \
+					score.reason.split())))
+				continue
+			results[os.path.basename(path)] = {mode: run(score, mode, screen, \
+				note_imgs, player, args.fps) for mode in args.modes}
+			if "game" in args.modes:
+				timing[os.path.basename(path)] = check_timing(score, screen, \
+					note_imgs, player, args.timing_fps)
+	finally:
+		shutil.rmtree(stress_dir)
+	failures = print_results(results)
+	failures += print_timing(timing, args.timing_fps)
+	poll = run_poll(args.i2c_latency / 1000.0, args.polls)
+	print("BtnInput.poll p50/p95/p99 ms {p50:.3f} {p95:.3f} {p99:.3f}, \
+{0:.1f} I2C transactions per poll".format(poll["transactions_per_poll"], \
+		**poll["poll"]))
+	with open(args.out, 'w') as file:
+		json.dump({"fps": args.fps, "percentiles": percentiles, \
+			"results": results, "timing": timing, "failures": failures, \
+			"i2c_latency_ms": args.i2c_latency, "btn_input": poll}, file, \
+			indent = 2, sort_keys = True)
+		file.write("\n")
+	print("Results written to {}".format(args.out))
+	pygame.quit()
+	if len(failures) > 0:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
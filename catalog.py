@@ -0,0 +1,218 @@
+import os
+import json
+import sqlite3
+from collections import OrderedDict
+import score_cache
+import pitch_table
+from music import Score
+from score_loader import load_scores
+
+#Bump this whenever the catalog schema or the checks on scores change, the
+#catalog is rebuilt
+CATALOG_VERSION = 2
+
+#Scores with more bars than this are loaded lazily (see Score), so that only
+#the bars that are being played are kept in memory
+LAZY_BARS = 256
+#The most scores kept loaded by CatalogEntry.load, the least recently loaded
+#one is released first
+MAX_LOADED = 2
+
+"""
+[CatalogEntry] holds the metadata of a single score as stored in the
+catalog. It provides the same query methods as Score so that it can be used
+wherever only metadata is needed (ie ScoreSelect and AssignScore), and
+[load] hydrates the full Score when it is actually needed.
+"""
+class CatalogEntry:
+	"""
+	[__init__ self row note_imgs player loaded] creates a new entry from the
+	catalog [row] (a sqlite3.Row). [note_imgs] and [player] are passed on to
+	the Score when it is loaded. [loaded] is the OrderedDict of entries with a
+	loaded Score shared by every entry of the catalog.
+	"""
+	def __init__(self, row, note_imgs, player, loaded):
+		self.file_name = row["file_name"]
+		self.name = row["name"]
+		self.num_bars = row["bars"]
+		self.beats = row["beats"]
+		self.seconds = row["seconds"]
+		self.note_counts = (row["treble_notes"], row["bass_notes"])
+		#Pitches are stored by name, convert them back to pitch ids
+		self.pitch_range = (pitch_table.to_id(row["lowest"]), \
+			pitch_table.to_id(row["highest"]))
+		self.pitches = set(pitch_table.to_ids(json.loads(row["pitches"])))
+		self.note_imgs = note_imgs
+		self.player = player
+		self.loaded = loaded
+		#The Score loaded by [load], kept so that replaying the score reuses
+		#its note layouts until [MAX_LOADED] other scores have been loaded
+		self.score = None
+
+	#[get_metadata self] returns the metadata of this score as a dictionary
+	def get_metadata(self):
+		return {"name" : self.name}
+
+	#[get_total_bars self] returns the number of bars in this score
+	def get_total_bars(self):
+		return self.num_bars
+
+	#[get_total_beats self] returns the length of this score in crotchets
+	def get_total_beats(self):
+		return self.beats
+
+	#[get_duration self] returns the length of this score in seconds
+	def get_duration(self):
+		return self.seconds
+
+	#[get_note_counts self] returns a tuple of the number of notes in the
+	#treble clef and in the bass clef of this score
+	def get_note_counts(self):
+		return self.note_counts
+
+	#[get_note_count self] returns the total number of notes in this score
+	def get_note_count(self):
+		return sum(self.note_counts)
+
+	#[get_pitches self] returns the set of pitch ids used in this score
+	def get_pitches(self):
+		return set(self.pitches)
+
+	#[get_pitch_range self] returns a tuple of the lowest and highest pitch
+	#used in this score
+	def get_pitch_range(self):
+		return self.pitch_range
+
+	#[get_unplayable_pitches self playable] returns the set of pitches used
+	#in this score that are not in [playable] (ie an input's playable pitches)
+	def get_unplayable_pitches(self, playable):
+		return self.pitches - set(playable)
+
+	#[load self] loads and returns the full Score for this entry, which is
+	#only loaded if it isn't already. Long scores are loaded lazily.
+	def load(self):
+		if self.score == None or not self.score.valid:
+			self.score = Score(self.file_name, self.note_imgs, self.player, \
+				lazy = self.num_bars > LAZY_BARS)
+		self.loaded[self.file_name] = self
+		self.loaded.move_to_end(self.file_name)
+		#Release the scores that were loaded the longest time ago
+		while len(self.loaded) > MAX_LOADED:
+			_, entry = self.loaded.popitem(last = False)
+			entry.score = None
+		return self.score
+
+"""
+[ScoreCatalog] is an on-disk index (a SQLite database) of the metadata of
+every valid score in a directory, so that the score selection screens don't
+need every score fully loaded in memory. Only files that changed since the
+last refresh are parsed again.
+"""
+class ScoreCatalog:
+	"""
+	[__init__ self db_path note_imgs player] opens (or creates) the catalog at
+	[db_path]. [note_imgs] and [player] are used to validate scores.
+	"""
+	def __init__(self, db_path, note_imgs, player):
+		self.note_imgs = note_imgs
+		self.player = player
+		#Entries with a loaded Score (see CatalogEntry.load), keyed by file
+		#name, least recently loaded first
+		self.loaded = OrderedDict()
+		self.db = sqlite3.connect(db_path)
+		self.db.row_factory = sqlite3.Row
+		version = self.db.execute("PRAGMA user_version").fetchone()[0]
+		if version != CATALOG_VERSION:
+			self.db.execute("DROP TABLE IF EXISTS scores")
+		self.db.execute("""CREATE TABLE IF NOT EXISTS scores (
+			file_name TEXT PRIMARY KEY, mtime INTEGER, size INTEGER,
+			hash TEXT, name TEXT, bars INTEGER, beats REAL, seconds REAL,
+			treble_notes INTEGER, bass_notes INTEGER, lowest TEXT,
+			highest TEXT, pitches TEXT, durations TEXT)""")
+		self.db.execute("PRAGMA user_version = {}".format(CATALOG_VERSION))
+		self.db.commit()
+
+	"""
+	[refresh self score_dir processes] brings the catalog up to date with the
+	.scr files in [score_dir]. Files whose mtime and size are unchanged (or
+	whose contents hash to the same value) are kept as is, unless they use
+	pitches or durations that can no longer be played or displayed. The
+	remaining files are loaded using [processes] processes (see
+	score_loader.py) and the entries of deleted or invalid files are removed.
+	"""
+	def refresh(self, score_dir, processes = None):
+		rows = {row["file_name"]: row for row in \
+			self.db.execute("SELECT * FROM scores")}
+		stale = []
+		for file_name in sorted(os.listdir(score_dir)):
+			if not file_name.endswith(".scr"):
+				continue
+			path = os.path.join(score_dir, file_name)
+			row = rows.pop(path, None)
+			if row == None or not self.is_fresh(path, row):
+				stale.append(file_name)
+		#Files that no longer exist
+		for path in rows:
+			self.db.execute("DELETE FROM scores WHERE file_name = ?", (path,))
+		if len(stale) > 0:
+			_, results = load_scores(score_dir, self.note_imgs, self.player, \
+				processes = processes, file_names = stale)
+			for path, score, _ in results:
+				if score.valid:
+					self.add_score(score)
+				else:
+					self.db.execute("DELETE FROM scores WHERE file_name = ?", \
+						(path,))
+		self.db.commit()
+
+	"""
+	[is_fresh self path row] returns whether the catalog [row] is still
+	up to date with the score file at [path], updating the stored mtime if
+	only the mtime of the file changed.
+	"""
+	def is_fresh(self, path, row):
+		for pitch in pitch_table.to_ids(json.loads(row["pitches"])):
+			if not self.player.has_note(pitch):
+				return False
+		for duration in json.loads(row["durations"]):
+			if not self.note_imgs.has_note(duration):
+				return False
+		mtime, size = score_cache.source_key(path)
+		if row["mtime"] == mtime and row["size"] == size:
+			return True
+		if row["size"] != size or row["hash"] != score_cache.file_hash(path):
+			return False
+		self.db.execute("UPDATE scores SET mtime = ? WHERE file_name = ?", \
+			(mtime, path))
+		return True
+
+	#[add_score self score] adds or replaces the entry of the valid [score]
+	def add_score(self, score):
+		mtime, size = score_cache.source_key(score.file_name)
+		treble_notes, bass_notes = score.get_note_counts()
+		lowest, highest = score.get_pitch_range()
+		if lowest != None:
+			lowest = pitch_table.to_name(lowest)
+			highest = pitch_table.to_name(highest)
+		self.db.execute("INSERT OR REPLACE INTO scores VALUES \
+			(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (score.file_name, \
+			mtime, size, score_cache.file_hash(score.file_name), score.name, \
+			score.get_total_bars(), score.get_total_beats(), \
+			score.get_duration(), treble_notes, bass_notes, lowest, highest, \
+			json.dumps(pitch_table.to_names(sorted(score.get_pitches()))), \
+			json.dumps(sorted(score.get_durations()))))
+
+	"""
+	[get_entries self player] returns a CatalogEntry for every score in the
+	catalog, ordered by file name. The entries load their Score with [player]
+	(the player that validates scores if None).
+	"""
+	def get_entries(self, player = None):
+		if player == None:
+			player = self.player
+		return [CatalogEntry(row, self.note_imgs, player, self.loaded) \
+			for row in self.db.execute("SELECT * FROM scores ORDER BY file_name")]
+
+	#[close self] closes the catalog database
+	def close(self):
+		self.db.close()
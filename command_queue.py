@@ -0,0 +1,79 @@
+import time
+import threading
+from collections import deque
+
+"""
+This class passes timestamped commands (ie note on and note off) from the
+frame loop to an audio thread without the frame loop ever waiting on audio.
+The queue holds at most [size] commands. When it is full new play commands
+are dropped, but stop commands are always queued so that notes never get
+stuck. It keeps track of how deep the queue gets, how many commands were
+dropped and how long commands wait before they are carried out.
+"""
+class CommandQueue:
+	#[__init__ self size lag_window] creates an empty queue of at most [size]
+	#commands, which keeps the lag of the last [lag_window] commands
+	def __init__(self, size = 64, lag_window = 256):
+		self.size = size
+		#Appending and popping from a deque is atomic, so no lock is needed
+		self.commands = deque()
+		#Set whenever a command is queued, to wake the audio thread
+		self.ready = threading.Event()
+		self.lags = deque(maxlen = lag_window)
+		self.max_depth = 0
+		self.dropped = 0
+
+	"""
+	[put self command args] queues [command] with the tuple [args] and returns
+	whether it was queued. Only commands other than "play" are queued when
+	the queue is full.
+	"""
+	def put(self, command, args = ()):
+		depth = len(self.commands)
+		if depth >= self.size and command == "play":
+			self.dropped += 1
+			return False
+		self.commands.append((command, args, time.perf_counter()))
+		self.max_depth = max(self.max_depth, depth + 1)
+		self.ready.set()
+		return True
+
+	#[clear self] removes every queued command, ie when they are made
+	#pointless by a stop_all
+	def clear(self):
+		self.commands.clear()
+
+	"""
+	[get_all self] removes and returns every queued command as a list of
+	(command, args, time queued). This is called by the audio thread.
+	"""
+	def get_all(self):
+		self.ready.clear()
+		commands = []
+		while True:
+			try:
+				commands.append(self.commands.popleft())
+			except IndexError:
+				return commands
+
+	#[wait self timeout] blocks the audio thread until a command is queued or
+	#[timeout] seconds pass
+	def wait(self, timeout):
+		self.ready.wait(timeout)
+
+	#[done self queued] records that a command queued at [queued] (see
+	#[get_all]) was carried out
+	def done(self, queued):
+		self.lags.append(time.perf_counter() - queued)
+
+	"""
+	[get_metrics self] returns a dictionary of the current and deepest depth
+	of the queue, the number of dropped commands and the median and maximum
+	time (in milliseconds) that recent commands took to be carried out
+	"""
+	def get_metrics(self):
+		lags = sorted(self.lags)
+		return {"depth": len(self.commands), "max_depth": self.max_depth, \
+			"dropped": self.dropped, "lag_p50_ms": \
+			round(lags[len(lags) // 2] * 1000, 3) if len(lags) > 0 else 0.0, \
+			"lag_max_ms": round(lags[-1] * 1000, 3) if len(lags) > 0 else 0.0}
@@ -1,9 +1,54 @@
 import pygame
+import threading
+from collections import OrderedDict
 
 #Define some colors
 black = (0,0,0)
 white = (255,255,255)
 
+#Held while creating fonts or rendering text, since pages of a score are
+#rendered in a background thread (see music.py)
+font_lock = threading.RLock()
+
+#Fonts shared by every component, keyed by font size
+fonts = {}
+#Rendered text surfaces, keyed by (text, font size, color, bg color), with the
+#least recently used surface at the front
+text_surfs = OrderedDict()
+#The maximum number of rendered text surfaces that are kept
+max_text_surfs = 256
+
+#[get_font size] returns the shared default font of size [size]
+def get_font(size):
+	with font_lock:
+		font = fonts.get(size)
+		if font == None:
+			font = pygame.font.Font(None, size)
+			fonts[size] = font
+		return font
+
+"""
+[render_text text size color bg_color] returns an antialiased surface of
+[text] rendered with the default font of size [size] in [color] on
+[bg_color] (transparent if None). Surfaces are cached and shared, so they
+must not be drawn onto.
+"""
+def render_text(text, size, color, bg_color = None):
+	key = (text, size, color, bg_color)
+	with font_lock:
+		surf = text_surfs.get(key)
+		if surf != None:
+			text_surfs.move_to_end(key)
+			return surf
+		if bg_color == None:
+			surf = get_font(size).render(text, True, color)
+		else:
+			surf = get_font(size).render(text, True, color, bg_color)
+		text_surfs[key] = surf
+		if len(text_surfs) > max_text_surfs:
+			text_surfs.popitem(last = False)
+		return surf
+
 #[Btn] specifies a class that represents a button object drawn on the stage
 class Btn:
 	"""[__init__ self, text, center, on_click, font_size, color, bg_color]
@@ -24,15 +69,27 @@ class Btn:
 		self.bg_color = bg_color
 		self.center = center
 		self.on_click = on_click
-		self.font = pygame.font.Font(None, font_size)
+		self.font_size = font_size
+		self.font = get_font(font_size)
+		self.rect = None
+		#The (text, color, bg color) that [surf] was rendered with
+		self.rendered = None
 
 	#[draw self, screen] draws this button onto the surface [screen]
 	def draw(self, screen):
-		self.surf = self.font.render(self.text, True, self.color \
-			, self.bg_color)
+		#Only render again if the text or colors changed
+		if self.rendered != self.get_state():
+			self.rendered = self.get_state()
+			self.surf = render_text(self.text, self.font_size, self.color, \
+				self.bg_color)
 		self.rect = self.surf.get_rect(center = self.center)
 		screen.blit(self.surf, self.rect)
 
+	#[get_state self] returns what this button looks like, which is used
+	#together with its rect to tell whether it needs to be redrawn
+	def get_state(self):
+		return (self.text, self.color, self.bg_color)
+
 	#[is_clicked self, mouse] returns whether this button has been clicked
 	#if the mouse is clicking at the (x,y) position specified by [mouse]
 	def is_clicked(self, mouse):
@@ -100,6 +157,11 @@ class ImageBtn:
 		self.rect = self.surf.get_rect(center = self.center)
 		screen.blit(self.surf, self.rect)
 
+	#[get_state self] returns what this button looks like, which is used
+	#together with its rect to tell whether it needs to be redrawn
+	def get_state(self):
+		return self.surf
+
 	#[is_clicked self, mouse] returns whether this button has been clicked
 	#if the mouse is clicking at the (x,y) position specified by [mouse]
 	def is_clicked(self, mouse):
@@ -143,17 +205,28 @@ class Text:
 		self.color = color
 		self.center = center
 		self.centering = centering
-		self.font = pygame.font.Font(None, font_size)
+		self.font_size = font_size
+		self.font = get_font(font_size)
+		#The (text, color) that [surf] was rendered with
+		self.rendered = None
 
 	#[draw self, screen] draws this textbox onto the surface [screen]
 	def draw(self, screen):
-		self.surf = self.font.render(self.text, True, self.color)
+		#Only render again if the text or color changed
+		if self.rendered != self.get_state():
+			self.rendered = self.get_state()
+			self.surf = render_text(self.text, self.font_size, self.color)
 		if self.centering == "center":
 			self.rect = self.surf.get_rect(center = self.center)
 		elif self.centering == "topleft":
 			self.rect = self.surf.get_rect(topleft = self.center)
 		screen.blit(self.surf, self.rect)
 
+	#[get_state self] returns what this textbox looks like, which is used
+	#together with its rect to tell whether it needs to be redrawn
+	def get_state(self):
+		return (self.text, self.color)
+
 #The Line class represents a line
 class Line:
 	"""
@@ -181,8 +254,22 @@ class Line:
 
 	#[draw self, screen] draws this line onto the surface [screen]
 	def draw(self, screen):
-		pygame.draw.line(screen, self.color, self.start_pos, self.end_pos, \
-			self.width)
+		self.rect = pygame.draw.line(screen, self.color, self.start_pos, \
+			self.end_pos, self.width)
+
+	#[get_state self] returns what this line looks like, which is used
+	#together with its rect to tell whether it needs to be redrawn
+	def get_state(self):
+		return (self.start_pos, self.end_pos, self.color, self.width)
+
+"""
+[tint surf color] changes the color of the non-transparent pixels on the
+surface [surf] to [color] in place
+"""
+def tint(surf, color):
+	r,g,b = color
+	surf.fill((0,0,0,255), special_flags = pygame.BLEND_RGBA_MULT)
+	surf.fill((r,g,b,0), special_flags = pygame.BLEND_RGBA_ADD)
 
 #The [Image] class represents an image
 class Image:
@@ -195,14 +282,24 @@ class Image:
 	not transformed if [dimen] is None
 	[from_surf] indicates whether we're copying the image from a surface
 	or loading it from a source file
+	[palette] is an object whose [get color] method returns a shared copy of
+	the image tinted [color] (ie a NotePalette, see music.py). If it is not
+	None, [img] and [dimen] are ignored and the image is neither copied nor
+	recolored in place.
 	"""
-	def __init__(self, img, center, dimen = None, from_surf = False):
+	def __init__(self, img, center, dimen = None, from_surf = False, \
+		palette = None):
+		self.center = center
+		self.color = None
+		self.palette = palette
+		if palette != None:
+			self.surf = palette.get(None)
+			self.rect = self.surf.get_rect()
+			return
 		if not from_surf:
 			self.surf = pygame.image.load(img)
 		else:
 			self.surf = img
-		self.center = center
-		self.color = None
 		#Transform image if dimensions specified
 		if dimen != None:
 			self.surf = pygame.transform.scale(self.surf, dimen)
@@ -217,10 +314,13 @@ class Image:
 		#Don't color if already this color
 		if self.color == new_color:
 			return
+		#Swap to the shared tinted surface if we have one
+		if self.palette != None:
+			self.surf = self.palette.get(new_color)
+			self.color = new_color
+			return
 		#Otherwise, color
-		r,g,b = new_color
-		self.surf.fill((0,0,0,255), special_flags = pygame.BLEND_RGBA_MULT)
-		self.surf.fill((r,g,b,0), special_flags = pygame.BLEND_RGBA_ADD)
+		tint(self.surf, new_color)
 		self.color = new_color
 
 	"""
@@ -230,6 +330,61 @@ class Image:
 		self.rect.center = self.center
 		screen.blit(self.surf, self.rect)
 
+	"""
+	[get_state self] returns what this image looks like, which is used
+	together with its rect to tell whether it needs to be redrawn
+	"""
+	def get_state(self):
+		return (self.surf, self.color)
+
+"""
+[DirtyTracker] keeps track of where elements were drawn and what they
+looked like on the previous frame, so that only the regions of the screen
+that changed (dirty rectangles) need to be updated on the display.
+"""
+class DirtyTracker:
+	#[__init__ self] creates a new tracker with nothing drawn
+	def __init__(self):
+		self.prev = {}
+		self.curr = {}
+
+	"""
+	[track self key rect state] records that the element identified by [key]
+	was drawn this frame over the Rect [rect] and looked like [state]
+	"""
+	def track(self, key, rect, state):
+		self.curr[key] = (rect.copy(), state)
+
+	#[track_elt self elt] records that the stage element [elt] was drawn this
+	#frame. Elements that don't implement [get_state] are always dirty.
+	def track_elt(self, elt):
+		if hasattr(elt, "get_state"):
+			state = elt.get_state()
+		else:
+			state = object()
+		self.track(elt, elt.rect, state)
+
+	"""
+	[get_dirty_rects self] returns the list of Rects that changed between the
+	previous frame and this frame (elements that appeared, disappeared, moved
+	or changed) and starts tracking the next frame
+	"""
+	def get_dirty_rects(self):
+		dirty = []
+		for key, (rect, state) in self.curr.items():
+			prev = self.prev.get(key)
+			if prev == None:
+				dirty.append(rect)
+			elif prev[0] != rect or prev[1] != state:
+				dirty.append(prev[0])
+				dirty.append(rect)
+		for key, (rect, _) in self.prev.items():
+			if key not in self.curr:
+				dirty.append(rect)
+		self.prev = self.curr
+		self.curr = {}
+		return dirty
+
 """
 [Stage] specifies a class that represents a stage onto which objects are drawn
 Objects on the stage must implement the following methods:
@@ -244,6 +399,7 @@ class Stage:
 		self.btns = []
 		self.elts = []
 		self.tmp_elts = []
+		self.tracker = DirtyTracker()
 
 	#[add_btn self btn] adds the Btn [btn] onto the stage
 	def add_btn(self, btn):
@@ -272,10 +428,18 @@ class Stage:
 	def draw(self, screen):
 		for tmp_elt in self.tmp_elts:
 			tmp_elt.draw(screen)
+			self.tracker.track_elt(tmp_elt)
 		for elt in self.elts:
 			elt.draw(screen)
+			self.tracker.track_elt(elt)
 		for btn in self.btns:
 			btn.draw(screen)
+			self.tracker.track_elt(btn)
+
+	#[get_dirty_rects self] returns the list of Rects on the screen that
+	#changed since the previous call to [get_dirty_rects]
+	def get_dirty_rects(self):
+		return self.tracker.get_dirty_rects()
 
 	#[handle_click self, mouse] handles a click event from a mouse click
 	#at the (x,y) position specified by [mouse]. It returns True if the event
@@ -296,8 +460,15 @@ instance as [parent_screen] into [elem]
 [draw self screen] which draws the elements within [elem] onto
 the surface [screen]
 [handle_click self pos] which handles a click event at position [pos]
-[advance_time self fps] which is called every frame of the game
+[advance_time self dt] which is called every frame of the game with the
+time in seconds since the previous frame
 [has_quit self] which returns whether [elem] wants to quit
+[elem] may also implement [get_dirty_rects self], which returns the list of
+Rects that changed since the previous call (see [Stage]). The whole screen
+is assumed to have changed if it doesn't.
+[elem] may also implement [is_idle self], which returns whether nothing
+changes (no animation or playback) until the next pygame event. It is
+assumed to always be animating if it doesn't.
 The [Screen] class represents a linked list of [Screen] elements,
 each of which contains an [elem], which is a UI class of the above type.
 When navigating to a new [Screen], the [Screen]'s child and parent
@@ -319,6 +490,8 @@ class Screen:
 		self.elem = elem
 		self.elem.bind_screen(self)
 		self.info = {}
+		#The active Screen when [get_dirty_rects] was last called
+		self.prev_active = None
 
 	"""
 	[draw self screen] renders the active screen and draws it onto 
@@ -331,14 +504,15 @@ class Screen:
 			self.elem.draw(screen)
 
 	"""
-	[advance_time self fps] is called on every frame of the main game loop.
+	[advance_time self dt] is called on every frame of the main game loop
+	with the time [dt] in seconds since the previous frame.
 	This calls the same function in the [elem] of the active screen.
 	"""
-	def advance_time(self, fps):
+	def advance_time(self, dt):
 		if self.child != None:
-			self.child.advance_time(fps)
+			self.child.advance_time(dt)
 		else:
-			self.elem.advance_time(fps)
+			self.elem.advance_time(dt)
 			#If my elem has quit
 			if self.elem.has_quit():
 				if self.parent != None:
@@ -355,6 +529,46 @@ class Screen:
 		else:
 			self.elem.handle_click(pos)
 
+	"""
+	[get_active self] returns the active Screen (the tail of the linked list)
+	"""
+	def get_active(self):
+		if self.child != None:
+			return self.child.get_active()
+		return self
+
+	"""
+	[is_idle self] returns whether the active Screen's [elem] is idle, in
+	which case the main loop can wait for the next event instead of
+	advancing and redrawing every frame
+	"""
+	def is_idle(self):
+		elem = self.get_active().elem
+		return hasattr(elem, "is_idle") and elem.is_idle()
+
+	"""
+	[get_mode self] returns the name of the class of the active Screen's
+	[elem] (ie "TrainingScore")
+	"""
+	def get_mode(self):
+		return type(self.get_active().elem).__name__
+
+	"""
+	[get_dirty_rects self] returns the list of Rects on the screen that
+	changed since the previous call, or None if the whole screen has to be
+	updated (ie when navigating to another Screen)
+	"""
+	def get_dirty_rects(self):
+		active = self.get_active()
+		if not hasattr(active.elem, "get_dirty_rects"):
+			rects = None
+		else:
+			rects = active.elem.get_dirty_rects()
+		if active is not self.prev_active:
+			self.prev_active = active
+			return None
+		return rects
+
 	"""
 	[add_child self elem] adds a child Screen with [elem]
 	"""
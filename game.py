@@ -1,3 +1,4 @@
+import time
 import pygame
 from components import Btn, ImageBtn, Text, Line, Image, Stage
 from music import RenderedScore
@@ -27,12 +28,15 @@ class GameScore(RenderedScore):
 		#Take in key inputs
 		self.key_input = key_input
 		self.playable_pitches = key_input.get_playable_pitches()
+		#Keys pressed before this screen started (ie in the menus) aren't played
+		key_input.get_events()
 		#Set of currently played pitches
 		self.played_pitches = set()
 		#Various parameters
 		self.early_notes = 0
 		self.wrong_notes = 0
-		self.frames_used = 0
+		#Time taken to play the score in seconds
+		self.time_used = 0.0
 		#FSM State
 		self.WAITING = 0
 		self.PLAYING = 1
@@ -49,7 +53,7 @@ class GameScore(RenderedScore):
 		self.quit = True
 		info = self.parent_screen.get_info()
 		#Remove these information from info
-		remove_elems = ["early_notes", "wrong_notes", "frames_used"]
+		remove_elems = ["early_notes", "wrong_notes", "time_used"]
 		for elem in remove_elems:
 			if elem in info:
 				info.pop(elem)
@@ -78,11 +82,21 @@ class GameScore(RenderedScore):
 			if pitch not in self.playable_pitches:
 				self.player.stop_note([pitch])
 
-	#[advance_time self fps] steps through one frame at [fps] frames
-	#per second. This causes the playback to advance according to
-	#[self.advance_rate]
-	def advance_time(self, fps):
-		self.frames_used += 1
+	#[can_advance self] only lets the playback advance while every expected
+	#note is being played
+	def can_advance(self):
+		return super().can_advance() and self.fsm_state == self.PLAYING
+
+	"""
+	[advance_time self dt] advances the game by [dt] seconds (the time taken
+	by the previous frame). The playback only advances according to
+	[self.advance_rate] while the right notes are played. Input events are
+	judged at the time they happened rather than at the end of the frame:
+	the playback starts from when the last right note was pressed, and a
+	note released early stops the playback where it was released.
+	"""
+	def advance_time(self, dt):
+		self.time_used += dt
 		#Consume updates from input
 		#Use input directly when paused
 		#Get current pitches
@@ -90,12 +104,21 @@ class GameScore(RenderedScore):
 			return
 		treble_pitches = self.get_curr_pitches(True)
 		bass_pitches = self.get_curr_pitches(False)
-		expected_pitches = treble_pitches + bass_pitches
+		expected_pitches = set(treble_pitches)
+		expected_pitches.update(bass_pitches)
+		#The next notes don't need a press when they were already right
+		#before this frame's changes (ie a rest or unplayable pitches)
+		was_ready = self.is_ready(expected_pitches)
 
 		self.key_input.poll()
-		updates = self.key_input.get_updates()
-		for pitch, is_pressed in updates.items():
+		now = time.monotonic_ns()
+		#How long ago (in seconds, within this frame) the played pitches last
+		#changed and an expected pitch was first released
+		changed_age = dt
+		released_age = None
+		for pitch, is_pressed, time_ns in self.key_input.get_events():
 			#print("Update: {}, {}".format(pitch, is_pressed))
+			changed_age = min(max(now - time_ns, 0) / 1e9, dt)
 			if is_pressed:
 				self.played_pitches.add(pitch)
 				self.player.play_note([pitch])
@@ -105,6 +128,8 @@ class GameScore(RenderedScore):
 			elif pitch in self.played_pitches:
 				self.played_pitches.remove(pitch)
 				self.player.stop_note([pitch])
+				if pitch in expected_pitches and released_age == None:
+					released_age = changed_age
 			else:
 				self.player.stop_note([pitch])
 		
@@ -132,7 +157,17 @@ class GameScore(RenderedScore):
 			#Play any non playable notes
 			for pitch in unplayable_pitches:
 				self.player.play_note([pitch])
-		elif self.fsm_state == self.PLAYING and len(missing_pitches) != 0:
+			if was_ready:
+				#The playback carries on with the rest of the previous frame
+				super().advance_time(dt)
+			else:
+				#Only the time since the notes were pressed counts, the rest
+				#of the frame where the previous notes ended isn't played
+				self.time_acc = 0.0
+				super().advance_time(changed_age)
+		elif self.fsm_state == self.PLAYING and len(missing_pitches) != 0 \
+		and not self.play_until(dt - released_age if released_age != None \
+		else 0.0):
 			#print("Early Stop!!")
 			self.early_notes += 1
 			self.fsm_state = self.WAITING
@@ -140,14 +175,44 @@ class GameScore(RenderedScore):
 			for pitch in unplayable_pitches:
 				self.player.stop_note([pitch])
 			self.jump_to_next_timing()
-			super().advance_time(fps)
+			#Move onto the next note straight away
+			self.time_acc = 0.0
+			self.step(self.timestep)
 		elif self.fsm_state == self.PLAYING:
-			super().advance_time(fps)
+			super().advance_time(dt)
 		if super().has_quit():
 			info = self.parent_screen.get_info()
 			info["early_notes"] = self.early_notes
 			info["wrong_notes"] = self.wrong_notes
-			info["frames_used"] = self.frames_used
+			info["time_used"] = self.time_used
+
+	#[is_ready self expected_pitches] returns whether every playable pitch in
+	#[expected_pitches] is being played and no other pitch is
+	def is_ready(self, expected_pitches):
+		for pitch in expected_pitches:
+			if pitch in self.playable_pitches and \
+			pitch not in self.played_pitches:
+				return False
+		return self.played_pitches.issubset(expected_pitches)
+
+	#[is_waiting_for_input self] returns whether the playback can't advance
+	#until the player changes the notes that are pressed
+	def is_waiting_for_input(self):
+		if self.has_quit() or self.fsm_state != self.WAITING:
+			return False
+		expected_pitches = set(self.get_curr_pitches(True))
+		expected_pitches.update(self.get_curr_pitches(False))
+		return not self.is_ready(expected_pitches)
+
+	"""
+	[play_until self seconds] advances the playback by [seconds] (the part of
+	the frame before a note was released) and returns whether the notes that
+	were being played ended in that time, in which case the release wasn't
+	early
+	"""
+	def play_until(self, seconds):
+		super().advance_time(seconds)
+		return self.fsm_state != self.PLAYING
 
 	#[has_quit self] queries whether this score has quitted
 	def has_quit(self):
@@ -0,0 +1,240 @@
+import time
+import threading
+
+#MCP23017 registers (with IOCON.BANK = 0, the B register follows the A one)
+GPINTENA = 0x04
+DEFVALA = 0x06
+INTCONA = 0x08
+IOCON = 0x0A
+INTFA = 0x0E
+INTCAPA = 0x10
+GPIOA = 0x12
+
+"""
+This class stands in for an Adafruit_GPIO.MCP230xx.MCP23017 port expander so
+that BtnInput can be tested and benchmarked without the hardware. It provides
+the methods that BtnInput uses and every I2C transaction (a register read or
+write) takes [latency] seconds, like the real bus. Buttons are pressed and
+released with [press] and [release] (from any thread), which pull their pin
+low like the real buttons.
+
+Like Adafruit's class, the registers can be accessed directly through
+[_device] (ie to set up interrupts). The interrupt registers work like the
+real ones and the interrupt output (with INTA and INTB mirrored) can be
+connected to a pin of a SimulatedGPIO with [connect_interrupt].
+"""
+class SimulatedMCP23017:
+	#[__init__ self address latency] creates a new expander at the I2C
+	#[address] whose transactions take [latency] seconds
+	def __init__(self, address = 0x20, latency = 0.0):
+		self.address = address
+		self.latency = latency
+		self._device = self
+		#Level of every pin as a bitmask (bit n is pin n), high when released
+		self.levels = 0xFFFF
+		#Register values by address, for the registers that are stored
+		self.registers = {}
+		for register in [GPINTENA, DEFVALA, INTCONA, IOCON, INTFA, INTCAPA]:
+			self.registers[register] = 0
+			self.registers[register + 1] = 0
+		#The SimulatedGPIO and pin that the interrupt output is connected to
+		self.interrupt_out = None
+		#Number of I2C transactions so far
+		self.transactions = 0
+		self.lock = threading.Lock()
+
+	#[transaction self] waits for one I2C transaction. Sleeping isn't precise
+	#enough for the sub millisecond latencies of the bus, so this spins.
+	def transaction(self):
+		self.transactions += 1
+		end = time.perf_counter() + self.latency
+		while time.perf_counter() < end:
+			pass
+
+	#[setup self pin value] sets the direction of [pin]
+	def setup(self, pin, value):
+		self.transaction()
+
+	#[pullup self pin enabled] enables or disables the pull up of [pin]
+	def pullup(self, pin, enabled):
+		self.transaction()
+
+	#[input self pin] returns whether [pin] is high, reading the GPIO
+	#registers once
+	def input(self, pin):
+		return self.input_pins([pin])[0]
+
+	#[input_pins self pins] returns a list of whether each pin in [pins] is
+	#high, reading the GPIOA and GPIOB registers once
+	def input_pins(self, pins):
+		gpio = self.readList(GPIOA, 2)
+		levels = gpio[0] | (gpio[1] << 8)
+		return [(levels >> pin) & 1 == 1 for pin in pins]
+
+	#[write8 self register value] writes [value] to [register] in one I2C
+	#transaction
+	def write8(self, register, value):
+		self.transaction()
+		with self.lock:
+			if register in self.registers and register not in \
+				[INTFA, INTFA + 1, INTCAPA, INTCAPA + 1]:
+				self.registers[register] = value & 0xFF
+
+	"""
+	[readList self register length] reads [length] consecutive registers
+	starting at [register] in one I2C transaction and returns them as a
+	bytearray. Reading INTCAP or GPIO clears the interrupt.
+	"""
+	def readList(self, register, length):
+		self.transaction()
+		values = bytearray()
+		with self.lock:
+			for address in range(register, register + length):
+				if address in [GPIOA, GPIOA + 1]:
+					values.append((self.levels >> (8 * (address - GPIOA))) & 0xFF)
+				else:
+					values.append(self.registers.get(address, 0))
+			cleared = register < GPIOA + 2 and register + length > INTCAPA
+			if cleared:
+				self.registers[INTFA] = 0
+				self.registers[INTFA + 1] = 0
+		if cleared:
+			self.set_interrupt(False)
+			#Comparing against DEFVAL interrupts again straight away if the
+			#pins still differ
+			self.check_interrupt(0)
+		return values
+
+	#[connect_interrupt self gpio pin] connects the interrupt output to [pin]
+	#of the SimulatedGPIO [gpio]
+	def connect_interrupt(self, gpio, pin):
+		self.interrupt_out = (gpio, pin)
+
+	#[register16 self register] returns the 16 bit value of the A and B
+	#[register]s. Must be called with the lock held.
+	def register16(self, register):
+		return self.registers[register] | (self.registers[register + 1] << 8)
+
+	"""
+	[check_interrupt self changed] raises the interrupt output if any enabled
+	pin in the bitmask [changed] changed (or differs from DEFVAL if it is
+	compared against it) and no interrupt is pending
+	"""
+	def check_interrupt(self, changed):
+		with self.lock:
+			if self.register16(INTFA) != 0:
+				return
+			intcon = self.register16(INTCONA)
+			differs = (self.levels ^ self.register16(DEFVALA)) & intcon
+			flags = ((changed & ~intcon) | differs) & self.register16(GPINTENA)
+			if flags == 0:
+				return
+			self.registers[INTFA] = flags & 0xFF
+			self.registers[INTFA + 1] = flags >> 8
+			self.registers[INTCAPA] = self.levels & 0xFF
+			self.registers[INTCAPA + 1] = self.levels >> 8
+		self.set_interrupt(True)
+
+	#[set_interrupt self active] drives the interrupt output, which is active
+	#low unless IOCON.INTPOL is set
+	def set_interrupt(self, active):
+		if self.interrupt_out != None:
+			gpio, pin = self.interrupt_out
+			active_high = self.registers[IOCON] & 0x02 != 0
+			gpio.set_input(pin, 1 if active == active_high else 0)
+
+	#[set_level self pin high] sets the level of [pin]
+	def set_level(self, pin, high):
+		with self.lock:
+			old = self.levels
+			if high:
+				self.levels |= 1 << pin
+			else:
+				self.levels &= ~(1 << pin)
+			changed = old ^ self.levels
+		if changed != 0:
+			self.check_interrupt(changed)
+
+	#[press self pin] presses the button on [pin], pulling it low
+	def press(self, pin):
+		self.set_level(pin, False)
+
+	#[release self pin] releases the button on [pin], letting it go high
+	def release(self, pin):
+		self.set_level(pin, True)
+
+"""
+This class stands in for the RPi.GPIO module so that the input pins of the
+Pi (ie the interrupt outputs of SimulatedMCP23017s) can be simulated. Inputs
+are driven with [set_input] and edge callbacks are called from the thread
+that drives them.
+"""
+class SimulatedGPIO:
+	BCM = 11
+	BOARD = 10
+	IN = 1
+	OUT = 0
+	PUD_OFF = 20
+	PUD_DOWN = 21
+	PUD_UP = 22
+	RISING = 31
+	FALLING = 32
+	BOTH = 33
+
+	def __init__(self):
+		self.levels = {}
+		#The edge and callbacks of every pin with event detection
+		self.detects = {}
+		self.lock = threading.Lock()
+
+	#[setmode self mode] sets the pin numbering
+	def setmode(self, mode):
+		pass
+
+	#[setup self pin direction pull_up_down] sets up [pin], which idles high
+	#if it is pulled up
+	def setup(self, pin, direction, pull_up_down = PUD_OFF):
+		with self.lock:
+			self.levels.setdefault(pin, 1 if pull_up_down == self.PUD_UP else 0)
+
+	#[input self pin] returns the level of [pin]
+	def input(self, pin):
+		with self.lock:
+			return self.levels.get(pin, 0)
+
+	#[add_event_detect self pin edge callback bouncetime] calls [callback]
+	#with [pin] on every [edge] of [pin]
+	def add_event_detect(self, pin, edge, callback = None, bouncetime = None):
+		with self.lock:
+			self.detects[pin] = (edge, [callback] if callback != None else [])
+
+	#[add_event_callback self pin callback] adds another [callback] to the
+	#event detection of [pin]
+	def add_event_callback(self, pin, callback):
+		with self.lock:
+			self.detects[pin][1].append(callback)
+
+	#[remove_event_detect self pin] stops the event detection of [pin]
+	def remove_event_detect(self, pin):
+		with self.lock:
+			self.detects.pop(pin, None)
+
+	#[cleanup self] resets every pin
+	def cleanup(self):
+		with self.lock:
+			self.levels = {}
+			self.detects = {}
+
+	#[set_input self pin level] drives [pin] to [level] (0 or 1), calling the
+	#callbacks of the pin if that is an edge they detect
+	def set_input(self, pin, level):
+		with self.lock:
+			old = self.levels.get(pin, 0)
+			self.levels[pin] = level
+			edge, callbacks = self.detects.get(pin, (None, []))
+			callbacks = list(callbacks)
+		if old == level or edge == None:
+			return
+		if edge == self.BOTH or edge == (self.RISING if level else self.FALLING):
+			for callback in callbacks:
+				callback(pin)
@@ -1,48 +1,265 @@
-#This is a deprecated library that works with Python 2 and does not
-#require circuitPy
-import Adafruit_GPIO.MCP230xx as MCP230XX # Import Adafruit MCP23017 Library
+import time
+import pickle
+import struct
+import threading
+from collections import deque
 import pygame
+import pitch_table
+#This is a deprecated library that works with Python 2 and does not
+#require circuitPy. It is only needed for the physical buttons.
+try:
+	import Adafruit_GPIO.MCP230xx as MCP230XX # Import Adafruit MCP23017 Library
+	PIN_IN = MCP230XX.GPIO.IN
+except ImportError:
+	MCP230XX = None
+	#The value of Adafruit_GPIO.GPIO.IN
+	PIN_IN = 1
+
+#MCP23017 registers (with IOCON.BANK = 0, the B register follows the A one)
+GPINTENA = 0x04
+INTCONA = 0x08
+IOCON = 0x0A
+INTFA = 0x0E
+#Mirrors INTA and INTB so that either bank drives both
+IOCON_MIRROR = 0x40
+
+#Posted by BtnInput in interrupt mode whenever a button changes, so that the
+#main loop wakes up if it is idle
+BTN_EVENT = pygame.USEREVENT + 1
+
+#The most changes kept by an input while nothing takes them (ie in the
+#menus), older ones are dropped
+MAX_EVENTS = 256
+
+#Input logs written by RecordingInput start with this
+LOG_MAGIC = b"PGIL"
+#Bump this whenever the layout of input logs changes
+LOG_VERSION = 2
+#Every event in an input log is the time since the previous event (in
+#microseconds) and the pitch id, with the top bit set if it was pressed
+LOG_EVENT = struct.Struct("<IB")
+LOG_PRESSED = 0x80
+#Logged instead of a pitch for every poll (ie frame), which is a press of
+#pitch 127
+LOG_POLL = 0xFF
+#Logged instead of a pitch at the end of the log, with the length of the
+#pickled results that follow instead of a time, which is a press of pitch 126
+LOG_RESULTS = 0xFE
+#Pitch ids from this one up can't be logged since their presses are the bytes
+#above (no input maps them, the piano ends at 108)
+LOG_MAX_PITCH = LOG_RESULTS & ~LOG_PRESSED
+
+"""
+[read_log path] returns a tuple of (info, events, polls) of the input log at
+[path] written by RecordingInput. [info] is the dictionary stored in the log,
+with the results given when the log was closed (if any) under "results".
+[events] is the list of (pitch id, pressed, nanoseconds since the start of the
+log) in the order they happened and [polls] is the list of the times of every
+poll in nanoseconds since the start of the log. Raises ValueError if [path]
+isn't an input log.
+"""
+def read_log(path):
+	with open(path, 'rb') as file:
+		if file.read(len(LOG_MAGIC)) != LOG_MAGIC:
+			raise ValueError("{} is not an input log".format(path))
+		length, = struct.unpack("<I", file.read(4))
+		info = pickle.loads(file.read(length))
+		data = file.read()
+	if not isinstance(info, dict) or info.get("version") != LOG_VERSION:
+		raise ValueError("{} is from another version".format(path))
+	events = []
+	polls = []
+	time_ns = 0
+	pos = 0
+	#A log cut short by a crash can end with part of an event
+	while pos + LOG_EVENT.size <= len(data):
+		delta, byte = LOG_EVENT.unpack_from(data, pos)
+		pos += LOG_EVENT.size
+		if byte == LOG_RESULTS:
+			info["results"] = pickle.loads(data[pos:pos + delta])
+			break
+		time_ns += delta * 1000
+		if byte == LOG_POLL:
+			polls.append(time_ns)
+		else:
+			events.append((byte & ~LOG_PRESSED, byte & LOG_PRESSED != 0, \
+				time_ns))
+	return (info, events, polls)
 
 #An input class that provides input through physical buttons using the MCP230XX
 class BtnInput:
 	"""
-	[__init__] saves the bindings from keys to pitches and initialises
-	the state of the input
+	[__init__ self mcps int_pins gpio debounce_ms] saves the bindings from
+	keys to pitches and initialises the state of the input. The buttons are
+	read from the list of port expanders [mcps] (ie SimulatedMCP23017s), or
+	from the MCP23017s at 0x20 and 0x21 if it is None.
+
+	If [int_pins] is None, the buttons are read every time [poll] is called.
+	Otherwise they are read in interrupt mode: the interrupt output of each
+	expander is wired to the pin in [int_pins] of the Pi (BCM numbering) with
+	the same index, [gpio] is the RPi.GPIO module (or a SimulatedGPIO) and a
+	button is ignored for [debounce_ms] milliseconds after it changes.
 	"""
-	def __init__(self):
+	def __init__(self, mcps = None, int_pins = None, gpio = None, \
+		debounce_ms = 20):
 		#2 frames at 30fps (~66ms)
 		self.debounce = 2
 		#I2C addresses where we can find our port expander
 		addresses = [0x20, 0x21]
-		self.mcps = [MCP230XX.MCP23017(address = addr) for addr in addresses]
-		#port mappings
-		self.port_mappings = [{'C4': 4, 'C#4': 8, 'D4': 3, 'D#4': 9, \
+		if mcps == None:
+			mcps = [MCP230XX.MCP23017(address = addr) for addr in addresses]
+		self.mcps = mcps
+		#port mappings (converted to pitch ids below)
+		port_mappings = [{'C4': 4, 'C#4': 8, 'D4': 3, 'D#4': 9, \
 		'E4': 15, 'F4': 14, 'F#4': 10,'G4': 13, 'G#4': 7, 'A4': 12,\
 		'A#4': 6, 'B4': 11},{'C3': 13, 'C#3': 0, 'D3': 12, 'D#3': 1, \
 		'E3': 11, 'F3': 10, 'F#3': 2, 'G3': 9, 'G#3': 15, 'A3': 8,\
 		'A#3': 14, 'B3': 3}]
-		self.LOW = 0
-		self.HIGH = 1
-		#current state
-		self.state = []
+		self.port_mappings = [{pitch_table.to_id(name): pin for name, pin \
+			in mappings.items()} for mappings in port_mappings]
+		#The pitch id of every pin, and the pins to read, of each expander
+		self.pin_pitches = [{pin: pitch for pitch, pin in mappings.items()} \
+			for mappings in self.port_mappings]
+		self.pins = [sorted(mappings.values()) for mappings in \
+			self.port_mappings]
+		#current state, the level of every pin of each expander as a bitmask
+		#(bit n is pin n). Released buttons are high.
+		self.state = [sum(1 << pin for pin in pins) for pins in self.pins]
 		#cooldowns
 		self.cooldown = []
-		self.updates = {}
-		for mcp,mappings in zip(self.mcps, self.port_mappings):
-			state = {}
+		#Changes since the last call to [get_events], as tuples of (pitch id,
+		#pressed, time.monotonic_ns()). Added to by the reader thread in
+		#interrupt mode.
+		self.events = deque(maxlen = MAX_EVENTS)
+		for mcp,pins in zip(self.mcps, self.pins):
 			cooldown = {}
-			for _,pin in mappings.items():
+			for pin in pins:
 				#Setup pin as input
-				mcp.setup(pin, MCP230XX.GPIO.IN)
+				mcp.setup(pin, PIN_IN)
 				mcp.pullup(pin, 1)
-    			#Create initial state and cooldown
-				state[pin] = self.HIGH
+				#Create initial cooldown
 				cooldown[pin] = self.debounce
-			self.state.append(state)
 			self.cooldown.append(cooldown)
+		self.int_pins = int_pins
+		if int_pins != None:
+			self.setup_interrupts(gpio, int(debounce_ms * 1e6))
+
+	"""
+	[setup_interrupts self gpio debounce_ns] makes every expander pull its
+	interrupt output low when a button changes and starts the thread that
+	reads the buttons when that happens (see [read_interrupts]). Buttons are
+	ignored for [debounce_ns] nanoseconds after they change.
+	"""
+	def setup_interrupts(self, gpio, debounce_ns):
+		self.gpio = gpio
+		self.debounce_ns = debounce_ns
+		#Set by the interrupt callbacks to wake the reader
+		self.interrupted = threading.Event()
+		#When each changed pin of each expander is read again (its debounce
+		#ends), in case it settled back
+		self.settling = [{} for mcp in self.mcps]
+		for mcp, pins, int_pin in zip(self.mcps, self.pins, self.int_pins):
+			#Adafruit's MCP23017 has no methods for interrupts, so its
+			#registers are written directly
+			device = mcp._device
+			mask = sum(1 << pin for pin in pins)
+			device.write8(IOCON, IOCON_MIRROR)
+			#Compare against the previous level (interrupt on any change)
+			device.write8(INTCONA, 0)
+			device.write8(INTCONA + 1, 0)
+			device.write8(GPINTENA, mask & 0xFF)
+			device.write8(GPINTENA + 1, mask >> 8)
+			#The output is active low
+			gpio.setup(int_pin, gpio.IN, pull_up_down = gpio.PUD_UP)
+			gpio.add_event_detect(int_pin, gpio.FALLING, \
+				callback = self.interrupt)
+		self.running = True
+		self.reader = threading.Thread(target = self.read_interrupts, \
+			daemon = True)
+		self.reader.start()
+
+	#[interrupt self channel] is called by RPi.GPIO from its own thread when
+	#the interrupt output of an expander falls
+	def interrupt(self, channel):
+		self.interrupted.set()
+
+	"""
+	[read_interrupts self] reads the buttons of each expander whose interrupt
+	output is active, or whose changed buttons have finished debouncing, until
+	[close] is called. Each read is a single I2C transaction of the INTF,
+	INTCAP and GPIO registers. This runs in the reader thread.
+	"""
+	def read_interrupts(self):
+		#Read everything once, in case an interrupt is already pending
+		first = True
+		while self.running:
+			now = time.monotonic_ns()
+			ends = [end for settling in self.settling for end in \
+				settling.values()]
+			#Check the interrupt outputs now and then as well, an edge may
+			#have been missed
+			timeout = (min(ends + [now + int(0.1 * 1e9)]) - now) / 1e9
+			if not first and timeout > 0:
+				self.interrupted.wait(timeout)
+			self.interrupted.clear()
+			now = time.monotonic_ns()
+			changed = False
+			for i, (mcp, int_pin) in enumerate(zip(self.mcps, self.int_pins)):
+				settled = [pin for pin, end in self.settling[i].items() \
+					if end <= now]
+				if not first and len(settled) == 0 and \
+					self.gpio.input(int_pin) != 0:
+					continue
+				for pin in settled:
+					del self.settling[i][pin]
+				regs = mcp._device.readList(INTFA, 6)
+				flags = regs[0] | (regs[1] << 8)
+				captured = regs[2] | (regs[3] << 8)
+				levels = regs[4] | (regs[5] << 8)
+				#The levels when the interrupt happened come first, so that
+				#presses shorter than the read aren't missed
+				if flags != 0:
+					changed |= self.update(i, (self.state[i] & ~flags) | \
+						(captured & flags), now)
+				changed |= self.update(i, levels, now)
+			first = False
+			if changed and pygame.display.get_init():
+				pygame.event.post(pygame.event.Event(BTN_EVENT))
+
+	"""
+	[update self i levels now] updates the state of the buttons of the [i]th
+	expander to the bitmask [levels] read at [now] (in nanoseconds), except
+	for buttons that are still debouncing, and returns whether any of them
+	changed
+	"""
+	def update(self, i, levels, now):
+		changed = (levels ^ self.state[i]) & sum(1 << pin for pin in self.pins[i])
+		updated = False
+		while changed != 0:
+			bit = changed & -changed
+			changed ^= bit
+			pin = bit.bit_length() - 1
+			if pin in self.settling[i]:
+				continue
+			self.state[i] ^= bit
+			self.settling[i][pin] = now + self.debounce_ns
+			#Not because we're active low
+			self.events.append((self.pin_pitches[i][pin], not (levels & bit), \
+				now))
+			updated = True
+		return updated
+
+	#[close self] stops reading the buttons in interrupt mode
+	def close(self):
+		if self.int_pins != None and self.running:
+			self.running = False
+			self.interrupted.set()
+			self.reader.join()
+			for int_pin in self.int_pins:
+				self.gpio.remove_event_detect(int_pin)
 
 	"""
-	[get_playable_pitches self] returns the set of playable pitches that
+	[get_playable_pitches self] returns the set of playable pitch ids that
 	this input maps to
 	"""
 	def get_playable_pitches(self):
@@ -54,32 +271,70 @@ class BtnInput:
 
 	"""
 	[poll self] polls the inputs for updates and updates the state.
-	This needs to be called every game frame.
+	This needs to be called every game frame. The GPIO registers of each
+	expander are read once, and only the pins that changed are looked at.
+	In interrupt mode the buttons are read by the reader thread instead.
 	"""
 	def poll(self):
-		for mcp,mappings,state,cooldown in \
-		zip(self.mcps, self.port_mappings, self.state, self.cooldown):
-			for pitch,pin in mappings.items():
-				#Decrement cooldowns
+		if self.int_pins != None:
+			return
+		now = time.monotonic_ns()
+		for i, (mcp, pins, cooldown) in \
+		enumerate(zip(self.mcps, self.pins, self.cooldown)):
+			#Decrement cooldowns
+			for pin in pins:
 				if cooldown[pin] > 0:
 					cooldown[pin] -= 1
-				#Check for changed pins, update them and push updates
-				if mcp.input(pin) != state[pin] and \
-				cooldown[pin] == 0:
-					state[pin] = mcp.input(pin)
+			levels = 0
+			for pin, high in zip(pins, mcp.input_pins(pins)):
+				if high:
+					levels |= 1 << pin
+			changed = levels ^ self.state[i]
+			#Update changed pins and push updates, lowest pin first
+			while changed != 0:
+				bit = changed & -changed
+				changed ^= bit
+				pin = bit.bit_length() - 1
+				if cooldown[pin] == 0:
+					self.state[i] ^= bit
 					#Not because we're active low
-					self.updates[pitch] = not mcp.input(pin)
+					self.events.append((self.pin_pitches[i][pin], \
+						not (levels & bit), now))
+
+	#[handle_event self evt] is given every pygame event by the main loop.
+	#The buttons don't generate any.
+	def handle_event(self, evt):
+		pass
 
 	#[has_updates self] returns whether this object has any updates
 	def has_updates(self):
-		return len(self.updates) > 1
+		return len(self.events) > 0
+
+	#[is_event_driven self] returns whether changes to this input generate
+	#pygame events, so that the main loop can sleep until the next event.
+	#The buttons need to be polled unless they are in interrupt mode.
+	def is_event_driven(self):
+		return self.int_pins != None
+
+	"""
+	[get_events self] returns the list of changes since the previous call to
+	[get_events] (or [get_updates]) in the order they happened, as tuples of
+	(pitch id, pressed, time.monotonic_ns() of the change)
+	"""
+	def get_events(self):
+		events = []
+		while len(self.events) > 0:
+			events.append(self.events.popleft())
+		return events
 
-	#[get_updates self] returns a dictionary mapping pitches to new state
+	#[get_updates self] returns a dictionary mapping pitch ids to new state
 	#(True = Active, False = Inactive) indicating updates since the
-	#previous call to [get_updates]
+	#previous call to [get_updates]. Only the latest change of each pitch is
+	#kept, see [get_events] for every change.
 	def get_updates(self):
-		updates = self.updates
-		self.updates = {}
+		updates = {}
+		for pitch, pressed, _ in self.get_events():
+			updates[pitch] = pressed
 		return updates
 
 #An input class that provides input through the keyboard
@@ -89,19 +344,24 @@ class KeyboardInput:
 	the state of the input
 	"""
 	def __init__(self):
-		#Bindings from keys to pitches
-		self.port_mappings = {'G3': pygame.K_a, 'G#3': pygame.K_w,\
+		#Bindings from keys to pitches (converted to pitch ids below)
+		port_mappings = {'G3': pygame.K_a, 'G#3': pygame.K_w,\
 		'A3': pygame.K_s, 'A#3': pygame.K_e, 'B3': pygame.K_d, \
 		'C4': pygame.K_f, 'C#4': pygame.K_t, \
 		'D4': pygame.K_g, 'D#4': pygame.K_y,'E4': pygame.K_h, \
 		'F4': pygame.K_j, 'F#4': pygame.K_i, 'G4': pygame.K_k, \
 		'G#4': pygame.K_o, 'A4': pygame.K_l,\
 		'A#4': pygame.K_p, 'B4': pygame.K_SEMICOLON}
-		self.state = pygame.key.get_pressed()
-		self.updates = {}
+		self.port_mappings = {pitch_table.to_id(name): key for name, key \
+			in port_mappings.items()}
+		self.key_pitches = {key: pitch for pitch, key in \
+			self.port_mappings.items()}
+		#Changes since the last call to [get_events], as tuples of (pitch id,
+		#pressed, time.monotonic_ns())
+		self.events = deque(maxlen = MAX_EVENTS)
 
 	"""
-	[get_playable_pitches self] returns the set of playable pitches that
+	[get_playable_pitches self] returns the set of playable pitch ids that
 	this input maps to
 	"""
 	def get_playable_pitches(self):
@@ -112,24 +372,279 @@ class KeyboardInput:
 
 	"""
 	[poll self] polls the inputs for updates and updates the state.
-	This needs to be called every game frame.
+	This needs to be called every game frame. The keys come in as KEYDOWN and
+	KEYUP events through [handle_event], so there is nothing to poll.
+	"""
+	def poll(self):
+		pass
+
+	#[handle_event self evt] is given every pygame event by the main loop,
+	#and records the presses and releases of the bound keys
+	def handle_event(self, evt):
+		if (evt.type == pygame.KEYDOWN or evt.type == pygame.KEYUP) and \
+			evt.key in self.key_pitches:
+			self.events.append((self.key_pitches[evt.key], \
+				evt.type == pygame.KEYDOWN, time.monotonic_ns()))
+
+	#[has_updates self] returns whether this object has any updates
+	def has_updates(self):
+		return len(self.events) > 0
+
+	#[is_event_driven self] returns whether changes to this input generate
+	#pygame events, so that the main loop can sleep until the next event.
+	#Key presses are KEYDOWN and KEYUP events.
+	def is_event_driven(self):
+		return True
+
+	"""
+	[get_events self] returns the list of changes since the previous call to
+	[get_events] (or [get_updates]) in the order they happened, as tuples of
+	(pitch id, pressed, time.monotonic_ns() of the change)
+	"""
+	def get_events(self):
+		events = []
+		while len(self.events) > 0:
+			events.append(self.events.popleft())
+		return events
+
+	#[get_updates self] returns a dictionary mapping pitch ids to new state
+	#(True = Active, False = Inactive) indicating updates since the
+	#previous call to [get_updates]. Only the latest change of each pitch is
+	#kept, see [get_events] for every change.
+	def get_updates(self):
+		updates = {}
+		for pitch, pressed, _ in self.get_events():
+			updates[pitch] = pressed
+		return updates
+
+"""
+An input class that passes on the input of another input class (ie a
+KeyboardInput or BtnInput) unchanged while recording it to an input log, so
+that the session can be replayed with ReplayInput. Every event and poll takes
+5 bytes and is written as it happens. Events are logged at the time they
+happened, followed by the time of the poll that took them, so that a replay
+hands them to the display in the same frames and as long before the end of
+the frame as they were live.
+"""
+class RecordingInput:
+	"""
+	[__init__ self source path info] records the input of [source] to the log
+	at [path]. [info] is a dictionary that is stored in the log as is (ie the
+	score that was played).
+	"""
+	def __init__(self, source, path, info = {}):
+		self.source = source
+		#When the log started (see [start_clock]), and the time of the last
+		#entry in microseconds since then
+		self.start = time.monotonic_ns()
+		self.last_us = 0
+		#Changes taken from [source] by [poll] since the last call to
+		#[get_events]
+		self.events = deque()
+		#Whether [poll] was called since the last call to [get_events]
+		self.polled = False
+		header = dict(info, version = LOG_VERSION, \
+			pitches = sorted(source.get_playable_pitches()))
+		meta = pickle.dumps(header, protocol = pickle.HIGHEST_PROTOCOL)
+		self.file = open(path, 'wb')
+		self.file.write(LOG_MAGIC)
+		self.file.write(struct.pack("<I", len(meta)))
+		self.file.write(meta)
+
+	"""
+	[get_playable_pitches self] returns the set of playable pitch ids that
+	this input maps to
+	"""
+	def get_playable_pitches(self):
+		return self.source.get_playable_pitches()
+
+	"""
+	[start_clock self] starts the log from now instead of from when this was
+	created. Call it when the first frame starts, so that the first poll is
+	logged after the time taken by the first frame.
+	"""
+	def start_clock(self):
+		self.start = time.monotonic_ns()
+
+	"""
+	[poll self] polls the inputs for updates and updates the state.
+	This needs to be called every game frame. The changes of [source] are
+	logged when they happened, then the poll is logged.
+	"""
+	def poll(self):
+		self.source.poll()
+		for pitch, pressed, time_ns in self.source.get_events():
+			if not 0 <= pitch < LOG_MAX_PITCH:
+				raise ValueError("Pitch {} can't be logged".format(pitch))
+			self.write(pitch | (LOG_PRESSED if pressed else 0), time_ns)
+			self.events.append((pitch, pressed, time_ns))
+		#The display judges the changes as of now
+		self.write(LOG_POLL, time.monotonic_ns())
+		self.polled = True
+
+	#[handle_event self evt] is given every pygame event by the main loop
+	def handle_event(self, evt):
+		self.source.handle_event(evt)
+
+	#[has_updates self] returns whether this object has any updates
+	def has_updates(self):
+		return len(self.events) > 0 or self.source.has_updates()
+
+	#[is_event_driven self] returns whether changes to this input generate
+	#pygame events, so that the main loop can sleep until the next event
+	def is_event_driven(self):
+		return self.source.is_event_driven()
+
+	"""
+	[get_events self] returns the list of changes logged by [poll] since the
+	previous call to [get_events] (or [get_updates]) in the order they
+	happened, as tuples of (pitch id, pressed, time.monotonic_ns() of the
+	change). Changes that [source] made after the last poll are left for the
+	next poll, unless nothing was polled since the last call (ie they are
+	discarded when a screen starts), in which case they happened outside of the
+	logged frames and are dropped without being logged.
+	"""
+	def get_events(self):
+		events = []
+		while len(self.events) > 0:
+			events.append(self.events.popleft())
+		if not self.polled:
+			self.source.get_events()
+		self.polled = False
+		return events
+
+	#[write self byte time_ns] logs [byte] (a pitch or LOG_POLL) as happening
+	#at [time_ns]. Anything from before the start is logged at the start.
+	def write(self, byte, time_ns):
+		time_us = max((time_ns - self.start) // 1000, self.last_us)
+		delta = min(time_us - self.last_us, 0xFFFFFFFF)
+		self.file.write(LOG_EVENT.pack(delta, byte))
+		self.last_us += delta
+
+	#[get_updates self] returns a dictionary mapping pitch ids to new state
+	#(True = Active, False = Inactive) indicating updates since the
+	#previous call to [get_updates]. Only the latest change of each pitch is
+	#kept, see [get_events] for every change.
+	def get_updates(self):
+		updates = {}
+		for pitch, pressed, _ in self.get_events():
+			updates[pitch] = pressed
+		return updates
+
+	#[close self results] finishes writing the log, storing the dictionary
+	#[results] (ie how the game was judged) at the end if it isn't None
+	def close(self, results = None):
+		if results != None:
+			data = pickle.dumps(results, protocol = pickle.HIGHEST_PROTOCOL)
+			self.file.write(LOG_EVENT.pack(len(data), LOG_RESULTS))
+			self.file.write(data)
+		self.file.close()
+
+"""
+An input class that replays an input log written by RecordingInput. If
+[frame_time] is None it is replayed in real time, with the first [poll] as
+the first recorded poll. Otherwise it is replayed as fast as it is polled:
+every [poll] moves the log on to the next recorded poll (and by [frame_time]
+seconds once they run out), so that the frames of the recording are replayed
+exactly by advancing the display by [get_next_dt] before each poll. Events
+are timestamped as if they had just been read, as long ago as they happened
+before the poll.
+"""
+class ReplayInput:
+	#[__init__ self path frame_time] reads the input log at [path], see
+	#[read_log] for the errors raised
+	def __init__(self, path, frame_time = None):
+		#The dictionary stored in the log by RecordingInput
+		self.info, self.log, self.polls = read_log(path)
+		self.frame_time = frame_time
+		#Index in [self.log] of the next event to replay, and in [self.polls]
+		#of the next poll
+		self.next = 0
+		self.poll_idx = 0
+		#When the log started (in real time), and how far (in nanoseconds)
+		#it has been replayed
+		self.start = None
+		self.now = 0
+		#Changes since the last call to [get_events], as tuples of (pitch id,
+		#pressed, time.monotonic_ns())
+		self.events = deque()
+
+	"""
+	[get_playable_pitches self] returns the set of playable pitch ids of the
+	input that was recorded
+	"""
+	def get_playable_pitches(self):
+		return set(self.info["pitches"])
+
+	"""
+	[poll self] polls the inputs for updates and updates the state.
+	This needs to be called every game frame. The events of the log up to the
+	current time are replayed.
 	"""
 	def poll(self):
-		new_state = pygame.key.get_pressed()
-		for pitch,key in self.port_mappings.items():
-			if new_state[key] != self.state[key]:
-				self.updates[pitch] = new_state[key]
-		self.state = new_state
+		clock = time.monotonic_ns()
+		if self.frame_time == None:
+			if self.start == None:
+				self.start = clock - (self.polls[0] if len(self.polls) > 0 \
+					else 0)
+			self.now = clock - self.start
+		elif self.poll_idx < len(self.polls):
+			self.now = self.polls[self.poll_idx]
+		else:
+			self.now += int(self.frame_time * 1e9)
+		self.poll_idx += 1
+		while self.next < len(self.log) and self.log[self.next][2] <= self.now:
+			pitch, pressed, time_ns = self.log[self.next]
+			self.events.append((pitch, pressed, clock - (self.now - time_ns)))
+			self.next += 1
+
+	#[handle_event self evt] is given every pygame event by the main loop.
+	#The replayed input doesn't come from events.
+	def handle_event(self, evt):
+		pass
 
 	#[has_updates self] returns whether this object has any updates
 	def has_updates(self):
-		return len(self.updates) > 1
+		return len(self.events) > 0
+
+	#[is_event_driven self] returns whether changes to this input generate
+	#pygame events, so that the main loop can sleep until the next event.
+	#The log only moves on when it is polled.
+	def is_event_driven(self):
+		return False
+
+	"""
+	[get_next_dt self] returns how far (in seconds) the next [poll] moves the
+	log on when it is replayed as fast as possible, which is the time between
+	the polls that were recorded (from the start of the log for the first)
+	"""
+	def get_next_dt(self):
+		if self.poll_idx >= len(self.polls):
+			return self.frame_time
+		previous = self.polls[self.poll_idx - 1] if self.poll_idx > 0 else 0
+		return (self.polls[self.poll_idx] - previous) / 1e9
+
+	#[is_done self] returns whether every event in the log has been replayed
+	def is_done(self):
+		return self.next == len(self.log)
+
+	"""
+	[get_events self] returns the list of changes since the previous call to
+	[get_events] (or [get_updates]) in the order they happened, as tuples of
+	(pitch id, pressed, time.monotonic_ns() of the change)
+	"""
+	def get_events(self):
+		events = []
+		while len(self.events) > 0:
+			events.append(self.events.popleft())
+		return events
 
-	#[get_updates self] returns a dictionary mapping pitches to new state
+	#[get_updates self] returns a dictionary mapping pitch ids to new state
 	#(True = Active, False = Inactive) indicating updates since the
-	#previous call to [get_updates]
+	#previous call to [get_updates]. Only the latest change of each pitch is
+	#kept, see [get_events] for every change.
 	def get_updates(self):
-		updates = self.updates
-		self.updates = {}
-		#print(updates)
+		updates = {}
+		for pitch, pressed, _ in self.get_events():
+			updates[pitch] = pressed
 		return updates
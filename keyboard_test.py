@@ -27,9 +27,10 @@ screen = pygame.display.set_mode(size)
 
 while True:
 	screen.fill((255,255,255))
+	for evt in pygame.event.get():
+		test_input.handle_event(evt)
 	test_input.poll()
 	updates = test_input.get_updates()
-	pygame.event.get()
 	for pitch, is_pressed in updates.items():
 		if is_pressed:
 			player.play_note([pitch])
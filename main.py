@@ -4,14 +4,25 @@ import threading
 import pygame
 import os
 import RPi.GPIO as GPIO
+import pitch_table
 from main_ui import MainUI
 from components import Btn, ImageBtn, Text, Line, Image, Stage, Screen
 from music import NoteImgCache, AudioPlayer, Score
+from sample_bank import SampleBank
+from score_loader import NoteSet
+from catalog import ScoreCatalog
 from piano import PianoMode
 from score_select import ScoreSelect
 from training import TrainingScore
 from game import GameScore
-from input import KeyboardInput, BtnInput
+from input import KeyboardInput, BtnInput, RecordingInput, ReplayInput
+from profiler import FrameProfiler
+#Mix notes in software through a single stream if numpy and sounddevice
+#are available
+try:
+	from mixer import MixerPlayer, sd
+except (ImportError, OSError):
+	MixerPlayer = None
 
 #Declare environment variables to drive output onto PiTFT Screen
 os.putenv('SDL_VIDEODRIVER', 'fbcon')
@@ -23,83 +34,229 @@ os.putenv('SDL_MOUSEDEV', '/dev/input/touchscreen')
 black = (0,0,0)
 white = (255,255,255)
 
-#Setup GPIO
-GPIO.setmode(GPIO.BCM)
+#Flag to check if we're done
+should_quit = False
+#Set framerate
+fps = 30
+#The longest time (in ms) to sleep for while idle, so that quitting through
+#the GPIO button is still noticed
+idle_timeout = 500
+#Pin of the quit button
+quit_pin = 17
+#Specify size of game display
+size = width, height = 320,240
+
+#The most memory (in bytes) used by the samples of the notes
+sample_budget = 16 * 1024 * 1024
+
+#[arg_value flag] returns the command line argument after [flag], or None if
+#[flag] wasn't given
+def arg_value(flag):
+	if flag in sys.argv[:-1]:
+		return sys.argv[sys.argv.index(flag) + 1]
+	return None
 
 #An event listener for the quit button that quits the program
 def quit_game(channel):
 	global should_quit
 	should_quit = True
 
-quit_pin = 17
-#Setup Pin
-GPIO.setup(quit_pin, GPIO.IN, pull_up_down = GPIO.PUD_UP)
-#Setup Callbacks
-GPIO.add_event_detect(quit_pin, GPIO.FALLING, callback = quit_game)
+"""
+[wait_event timeout] blocks until the next pygame event or until [timeout]
+milliseconds have passed and returns the event (NOEVENT if none). pygame 1.9
+can't time out waiting, so it sleeps for a frame and polls instead.
+"""
+def wait_event(timeout):
+	try:
+		return pygame.event.wait(timeout)
+	except TypeError:
+		pygame.time.wait(1000 // fps)
+		return pygame.event.poll()
 
-#Setup pygame stuff
-pygame.init()
+def main():
+	global should_quit
+	#Setup pygame stuff
+	pygame.init()
 
-#Specify size of game display
-size = width, height = 320,240
+	#Generate the display surface
+	screen = pygame.display.set_mode(size)
 
-#Generate the display surface
-screen = pygame.display.set_mode(size)
+	#Obtain scores
+	note_img_cache = NoteImgCache()
+	#Bring the score catalog up to date, only changed scores are parsed again.
+	#This forks worker processes, so it is done before the audio player and
+	#the GPIO callbacks start their threads, against the pitches that have a
+	#sample.
+	sample_pitches = NoteSet(SampleBank("./sound", sample_budget) \
+		.get_pitches() | {pitch_table.REST})
+	catalog = ScoreCatalog("./scores/catalog.db", note_img_cache, \
+		sample_pitches)
+	catalog.refresh("./scores")
 
-#Flag to check if we're done
-should_quit = False
-#Set framerate
-fps = 30
+	player = None
+	if MixerPlayer != None:
+		#Use simpleaudio if the stream can't be opened (ie there is no output
+		#device or it doesn't support the format)
+		try:
+			player = MixerPlayer(budget = sample_budget)
+		except (sd.PortAudioError, OSError, ValueError) as err:
+			print("Could not open the audio stream ({}), using simpleaudio" \
+				.format(err))
+	if player == None:
+		player = AudioPlayer(budget = sample_budget)
+	scores = catalog.get_entries(player)
+
+	#Setup GPIO
+	GPIO.setmode(GPIO.BCM)
+	#Setup Pin
+	GPIO.setup(quit_pin, GPIO.IN, pull_up_down = GPIO.PUD_UP)
+	#Setup Callbacks
+	GPIO.add_event_detect(quit_pin, GPIO.FALLING, callback = quit_game)
+
+	#Play back an input log written with --record instead of the keyboard
+	replay_log = arg_value("--replay")
+	if replay_log != None:
+		key_input = ReplayInput(replay_log)
+	else:
+		key_input = KeyboardInput()
+	#Scores read their own notes in when they are opened
+	player.prepare(key_input.get_playable_pitches())
+
+	#Time every phase of every frame if --profile is given, and show the overlay
+	#from the start if --overlay is also given (F12 toggles it)
+	profiler = FrameProfiler(fps, enabled = "--profile" in sys.argv)
+	if "--overlay" in sys.argv:
+		profiler.toggle_overlay()
+
+	#Go straight into a game of the score named by --game, or of the score that
+	#the replayed log was recorded on
+	game_name = arg_value("--game")
+	if game_name == None and replay_log != None:
+		game_name = key_input.info.get("score")
+	game_entry = None
+	if game_name != None:
+		for entry in scores:
+			if os.path.basename(entry.file_name) == os.path.basename(game_name):
+				game_entry = entry
+		if game_entry == None:
+			print("No score named {}".format(game_name))
 
-#Obtain scores
-note_img_cache = NoteImgCache()
-player = AudioPlayer()
-key_input = KeyboardInput()
-
-scores = []
-for file_name in os.listdir("./scores"):
-	if file_name.endswith(".scr"):
-		score = Score("./scores/" + file_name, note_img_cache, player)
-		if not score.valid:
-			print("{} is invalid. Error: {}".format(file_name, score.reason))
+	#Record the input to the log given by --record, along with the score played
+	record_log = arg_value("--record")
+	if record_log != None:
+		key_input = RecordingInput(key_input, record_log, {"score": \
+			os.path.basename(game_entry.file_name) if game_entry != None \
+			else None})
+	#Input is polled by the active screen while it advances
+	key_input.poll = profiler.wrap("input", key_input.poll)
+
+	#Get a training mode score
+	#main_disp = Screen(TrainingScore(note_img_cache, player, \
+	#	key_input, score = scores[1]))
+	#main_disp = Screen(GameScore(note_img_cache, player, \
+	#	key_input, score = scores[0]))
+	#main_disp = Screen(ScoreSelect(note_img_cache, player, \
+	#	key_input, scores, train_mode = False))
+	game = None
+	if game_entry != None:
+		game = GameScore(note_img_cache, player, key_input, \
+			score = game_entry.load())
+		main_disp = Screen(game)
+	else:
+		main_disp = Screen(MainUI(note_img_cache, player, key_input, scores))
+	#main_disp = Screen(TrainingScore(note_img_cache, player, \
+	#	key_input, score = scores[1]))
+	#Setup button objects
+	#stage = Stage([])
+
+	#Start the pygame clock
+	clock = pygame.time.Clock()
+	#Playback is driven by how much time actually passed, so that dropped frames
+	#don't slow the music down
+	prev_time = time.monotonic()
+	#The first frame of the log starts now as well
+	if record_log != None:
+		key_input.start_clock()
+	while (not main_disp.has_quit() and not should_quit):
+		#Sleep until something happens if nothing is animating, instead of
+		#redrawing the same screen every frame
+		if main_disp.is_idle() and not profiler.show_overlay:
+			evt = wait_event(idle_timeout)
+			#Time spent sleeping doesn't count towards the next frame
+			prev_time = time.monotonic()
+			if evt.type == pygame.NOEVENT:
+				continue
+			#Handle it with the other events of this frame
+			pygame.event.post(evt)
+		#Do stuff
+		profiler.begin_frame()
+		#Draw stage objects
+		#stage.draw(screen)
+		#Timestamp key presses before the display moves forward, so that they
+		#are used straight away. This is part of reading the input.
+		events = pygame.event.get()
+		for evt in events:
+			key_input.handle_event(evt)
+		profiler.mark("input")
+		#Move training display forward
+		now = time.monotonic()
+		main_disp.advance_time(now - prev_time)
+		prev_time = now
+		profiler.mark("advance_time")
+		#A replay is over once the log has run out while the game waits for
+		#notes that will never be pressed
+		if replay_log != None and game != None and key_input.is_done() and \
+		game.is_waiting_for_input():
+			print("The replayed log ended before the score did")
+			should_quit = True
+
+		#Handle clicks
+		for evt in events:
+			#If mouse button pressed down
+			if (evt.type == pygame.MOUSEBUTTONDOWN):
+				main_disp.handle_click(evt.pos)
+			elif (evt.type == pygame.KEYDOWN and evt.key == pygame.K_F12):
+				profiler.toggle_overlay()
+		profiler.mark("events")
+
+		#Draw training display
+		screen.fill(white)
+		main_disp.draw(screen)
+		profiler.draw(screen)
+		profiler.mark("draw")
+
+		#Only update the regions of the display that changed, unless we moved to
+		#another screen
+		dirty_rects = main_disp.get_dirty_rects()
+		if dirty_rects == None:
+			pygame.display.flip()
 		else:
-			scores.append(score)
-
-#Get a training mode score
-#main_disp = Screen(TrainingScore(note_img_cache, player, \
-#	key_input, score = scores[1]))
-#main_disp = Screen(GameScore(note_img_cache, player, \
-#	key_input, score = scores[0]))
-#main_disp = Screen(ScoreSelect(note_img_cache, player, \
-#	key_input, scores, fps, train_mode = False))
-main_disp = Screen(MainUI(note_img_cache, player, key_input, scores, fps))
-#main_disp = Screen(TrainingScore(note_img_cache, player, \
-#	key_input, score = scores[1]))
-#Setup button objects
-#stage = Stage([])
-
-#Start the pygame clock
-clock = pygame.time.Clock()
-while (not main_disp.has_quit() and not should_quit):
-	#Do stuff
-	screen.fill(white)
-	#Draw stage objects
-	#stage.draw(screen)
-	#Move training display forward
-	main_disp.advance_time(fps)
-
-	#Handle clicks
-	for evt in pygame.event.get():
-		#If mouse button pressed down
-		if (evt.type == pygame.MOUSEBUTTONDOWN):
-			main_disp.handle_click(evt.pos)
-
-	#Draw training display
-	main_disp.draw(screen)
-
-	pygame.display.flip()
-	#Wait until the next frame
-	clock.tick(fps)
-
-#Cleanup when done
-GPIO.cleanup()
+			dirty_rects += profiler.get_dirty_rects()
+			if len(dirty_rects) > 0:
+				pygame.display.update(dirty_rects)
+		profiler.mark("flip")
+		#Wait until the next frame
+		clock.tick(fps)
+		profiler.mark("tick")
+		profiler.end_frame(main_disp)
+
+	#Cleanup when done
+	#Report how a game started with --game went
+	info = main_disp.get_info()
+	results = None
+	if "early_notes" in info:
+		results = {name: info[name] for name in ["early_notes", "wrong_notes", \
+			"time_used"]}
+		print("Early notes: {}, wrong notes: {}, time used: {:.1f}s".format( \
+			info["early_notes"], info["wrong_notes"], info["time_used"]))
+	#The results are stored so that replays of the log can be checked against
+	#them
+	if record_log != None:
+		key_input.close(results)
+	profiler.dump("./profile.json", {"audio": player.get_metrics()})
+	player.finish()
+	catalog.close()
+	GPIO.cleanup()
+
+if __name__ == "__main__":
+	main()
@@ -11,8 +11,7 @@ from input import KeyboardInput, BtnInput
 #This implements a UI element required by components/Screen.
 #Please refer to components/Screen for documentation on each of the methods.
 class MainUI:
-	def __init__(self, note_img, player, key_input, scores, fps):
-		self.fps = fps
+	def __init__(self, note_img, player, key_input, scores):
 		self.note_img_cache = note_img
 		self.player = player
 		self.key_input = key_input
@@ -45,20 +44,26 @@ class MainUI:
 	def draw(self, screen):
 		self.stage.draw(screen)
 
+	def get_dirty_rects(self):
+		return self.stage.get_dirty_rects()
+
 	def handle_click(self, pos):
 		self.stage.handle_click(pos)
 
-	def advance_time(self, fps):
+	def advance_time(self, dt):
+		return True
+
+	def is_idle(self):
 		return True
 
 	def on_training_btn_click(self, btn, pos):
 		select = ScoreSelect(self.note_img_cache, self.player, self.key_input, \
-			self.scores, self.fps, True)
+			self.scores, True)
 		self.parent_screen.add_child(select)
 
 	def on_play_btn_click(self, btn, pos):
 		select = ScoreSelect(self.note_img_cache, self.player, self.key_input, \
-			self.scores, self.fps, False)
+			self.scores, False)
 		self.parent_screen.add_child(select)
 
 	def on_piano_btn_click(self, btn, pos):
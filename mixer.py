@@ -0,0 +1,306 @@
+import threading
+from collections import Counter
+import numpy as np
+import sounddevice as sd
+import pitch_table
+from command_queue import CommandQueue
+from sample_bank import SampleBank
+
+#Scales 16 bit samples to [-1, 1]
+sample_scale = np.float32(1.0 / 32768)
+
+#This class represents one of the voices of a MixerPlayer, which plays a
+#single note at a time
+class Voice:
+	__slots__ = ("pitch", "samples", "pos", "release_left", "started")
+
+	def __init__(self):
+		self.free()
+
+	#[free self] stops this voice so that it can play another note
+	def free(self):
+		#The pitch id that is playing, None if this voice is free
+		self.pitch = None
+		self.samples = None
+		#The next frame of [samples] to play
+		self.pos = 0
+		#Frames left until the note is silent once it is released, None if
+		#the note hasn't been released
+		self.release_left = None
+		#Orders voices by when they started playing, to steal the oldest
+		self.started = 0
+
+"""
+This class plays notes like AudioPlayer, but mixes them in software into a
+single output stream (using numpy and sounddevice) instead of opening a
+stream for every note. A fixed pool of [max_voices] voices bounds the number
+of notes that play at once (the oldest note is stolen when they are all
+busy), and stopped notes fade out over [release] seconds instead of being
+cut off. Calls to [play_note], [stop_note] and [stop_all] are queued (see
+CommandQueue) and applied by the audio callback at the start of the next
+block.
+
+Only pitch ids are queued, the audio callback plays the samples loaded ahead
+of time by [prepare]. Pitches that aren't loaded when they are played are
+loaded by a loader thread and start once they are ready, so neither the
+caller nor the callback waits for samples to be read.
+"""
+class MixerPlayer:
+	"""
+	[__init__ self sound_dir max_voices release blocksize budget queue_size]
+	recognises the notes of the 16 bit .wav files in [sound_dir] (see
+	SampleBank, which keeps at most [budget] bytes of samples mapped) and
+	starts the output stream, which asks for [blocksize] frames at a time. At
+	most [queue_size] commands wait for the next block.
+	"""
+	def __init__(self, sound_dir = "./sound", max_voices = 16, \
+		release = 0.05, blocksize = 256, budget = 16 * 1024 * 1024, \
+		queue_size = 64):
+		self.bank = SampleBank(sound_dir, budget)
+		self.pitches = {pitch for pitch in self.bank.get_pitches() \
+			if self.bank.get_info(pitch).sampwidth == 2}
+		#Every note is played through the same stream, so the stream uses the
+		#most common format and the other files are converted to it
+		formats = Counter((self.bank.get_info(pitch).rate, \
+			self.bank.get_info(pitch).channels) for pitch in self.pitches)
+		self.samplerate, self.channels = formats.most_common(1)[0][0] \
+			if len(formats) > 0 else (44100, 2)
+		#Converted samples by pitch id. Only files in another format are
+		#converted, the rest are played straight from the bank.
+		self.converted = {}
+		#Samples of the loaded pitches in the format of the stream, by pitch
+		#id. Replaced as a whole so the audio callback never sees it change.
+		self.loaded = {}
+		self.load_lock = threading.Lock()
+		#Pitches that were played before they were loaded and haven't been
+		#stopped since, which start once the loader thread loads them
+		self.pending = set()
+		self.pending_lock = threading.Lock()
+		self.loads = CommandQueue(queue_size)
+		#Number of pitches that had to be loaded when they were played
+		self.late_loads = 0
+		self.voices = [Voice() for i in range(max_voices)]
+		self.release_frames = max(1, int(release * self.samplerate))
+		self.commands = CommandQueue(queue_size)
+		self.started = 0
+		self.stream = sd.OutputStream(samplerate = self.samplerate, \
+			channels = self.channels, dtype = "float32", \
+			blocksize = blocksize, latency = "low", callback = self.callback)
+		self.stream.start()
+		self.running = True
+		self.loader = threading.Thread(target = self.run_loads, daemon = True)
+		self.loader.start()
+
+	"""
+	[get_samples self pitch] returns the samples of [pitch] as an array of
+	shape (frames, channels) in the format of the stream. Files in the same
+	format are read straight from their memory map.
+	"""
+	def get_samples(self, pitch):
+		if pitch in self.converted:
+			return self.converted[pitch]
+		info = self.bank.get_info(pitch)
+		samples = np.frombuffer(self.bank.get(pitch), dtype = "<i2") \
+			.reshape(-1, info.channels)
+		if info.rate == self.samplerate and info.channels == self.channels:
+			return samples
+		if info.channels != self.channels:
+			#Mix down to mono, then copy to every channel
+			mono = samples.mean(axis = 1)
+			samples = np.repeat(mono[:, None], self.channels, axis = 1)
+		if info.rate != self.samplerate:
+			#Linear interpolation is good enough for piano notes
+			frames = int(len(samples) * self.samplerate / info.rate)
+			times = np.arange(frames) * (info.rate / self.samplerate)
+			samples = np.stack([np.interp(times, np.arange(len(samples)), \
+				samples[:, channel]) for channel in range(self.channels)], \
+				axis = 1)
+		self.converted[pitch] = np.ascontiguousarray(samples, dtype = "<i2")
+		return self.converted[pitch]
+
+	#Stops all notes on deletion (garbage collection)
+	def __del__(self):
+		self.finish()
+
+	#[has_note self pitch] returns whether the pitch id [pitch] is recognised
+	#by this player
+	def has_note(self, pitch):
+		if pitch == pitch_table.REST:
+			return True
+		return pitch in self.pitches
+
+	#[get_pitches self] returns the set of pitch ids recognised by this
+	#player, including rests
+	def get_pitches(self):
+		return self.pitches | {pitch_table.REST}
+
+	#[prepare self pitches] loads the samples of [pitches] ahead of time (ie
+	#the pitches of a score or an input) so that they play promptly. Pitches
+	#that don't fit in the budget of the bank are left out.
+	def prepare(self, pitches):
+		pitches = set(pitches) & self.pitches
+		self.bank.prepare(pitches)
+		for pitch in sorted(pitches):
+			if pitch in self.converted or self.bank.is_mapped(pitch):
+				self.load(pitch)
+
+	"""
+	[load self pitch] reads the samples of [pitch] and adds them to the loaded
+	samples. Samples that the bank has unmapped since they were loaded (to
+	stay within its budget) are unloaded, unless they were converted.
+	"""
+	def load(self, pitch):
+		with self.load_lock:
+			samples = self.get_samples(pitch)
+			loaded = {other: other_samples for other, other_samples in \
+				self.loaded.items() if other in self.converted or \
+				self.bank.is_mapped(other)}
+			loaded[pitch] = samples
+			self.loaded = loaded
+
+	#[run_loads self] loads the pitches that were played before they were
+	#loaded and starts the ones that haven't been stopped since. This runs in
+	#the loader thread.
+	def run_loads(self):
+		while self.running:
+			self.loads.wait(0.1)
+			for _, pitches, queued in self.loads.get_all():
+				for pitch in pitches:
+					if pitch not in self.loaded:
+						self.load(pitch)
+						self.late_loads += 1
+				with self.pending_lock:
+					ready = tuple(pitch for pitch in pitches \
+						if pitch in self.pending)
+					self.pending.difference_update(ready)
+					if len(ready) > 0:
+						self.commands.put("play", ready)
+				self.loads.done(queued)
+
+	#[play_note self pitches] plays the list of pitch ids [pitches],
+	#restarting any of them that are already playing
+	def play_note(self, pitches):
+		loaded = self.loaded
+		pitches = [pitch for pitch in pitches if pitch in self.pitches]
+		unloaded = tuple(pitch for pitch in pitches if pitch not in loaded)
+		if len(unloaded) > 0:
+			with self.pending_lock:
+				self.pending.update(unloaded)
+			self.loads.put("load", unloaded)
+		if len(unloaded) < len(pitches):
+			self.commands.put("play", tuple(pitch for pitch in pitches \
+				if pitch in loaded))
+
+	#[stop_note self pitches] releases the list of pitch ids [pitches]
+	def stop_note(self, pitches):
+		with self.pending_lock:
+			self.pending.difference_update(pitches)
+			self.commands.put("stop", tuple(pitches))
+
+	#[stop_all self] releases all currently playing pitches
+	def stop_all(self):
+		#Notes that haven't started yet are stopped as well
+		with self.pending_lock:
+			self.pending.clear()
+			self.loads.clear()
+			self.commands.clear()
+			self.commands.put("stop_all")
+
+	"""
+	[get_metrics self] returns the metrics of the command queue (see
+	CommandQueue.get_metrics). Commands are carried out at the start of a
+	block, so they are heard [output_latency_ms] after that. [late_loads] is
+	the number of pitches that weren't loaded when they were played.
+	"""
+	def get_metrics(self):
+		metrics = self.commands.get_metrics()
+		metrics["late_loads"] = self.late_loads
+		if self.stream != None:
+			metrics["output_latency_ms"] = round(self.stream.latency * 1000, 3)
+		return metrics
+
+	#[finish self] should be called when the player is no longer needed
+	def finish(self):
+		if getattr(self, "running", False):
+			self.running = False
+			self.loader.join()
+		stream = getattr(self, "stream", None)
+		if stream != None:
+			self.stream = None
+			stream.stop()
+			stream.close()
+
+	#[get_voice self] returns the voice that should play the next note,
+	#stealing the oldest voice if none of them are free
+	def get_voice(self):
+		for voice in self.voices:
+			if voice.pitch == None:
+				return voice
+		#Prefer notes that are already fading out
+		return min(self.voices, key = lambda voice: \
+			(voice.release_left == None, voice.started))
+
+	#[release self voice] starts fading out [voice] if it isn't already
+	def release(self, voice):
+		if voice.pitch != None and voice.release_left == None:
+			voice.release_left = self.release_frames
+
+	#[run_commands self] applies every queued call to play_note, stop_note
+	#and stop_all. This runs in the audio callback.
+	def run_commands(self):
+		for command, args, queued in self.commands.get_all():
+			if command == "stop_all":
+				for voice in self.voices:
+					self.release(voice)
+			elif command == "stop":
+				for voice in self.voices:
+					if voice.pitch in args:
+						self.release(voice)
+			else:
+				loaded = self.loaded
+				for pitch in args:
+					#Unloaded since it was played (ie by another prepare)
+					if pitch in loaded:
+						self.start_note(pitch, loaded[pitch])
+			self.commands.done(queued)
+
+	#[start_note self pitch samples] starts playing [samples] as [pitch],
+	#releasing the pitch if it is already playing
+	def start_note(self, pitch, samples):
+		for voice in self.voices:
+			if voice.pitch == pitch:
+				self.release(voice)
+		voice = self.get_voice()
+		voice.free()
+		voice.pitch = pitch
+		voice.samples = samples
+		self.started += 1
+		voice.started = self.started
+
+	"""
+	[callback self outdata frames time status] is called by sounddevice from
+	its own thread whenever it needs the next [frames] frames, and mixes
+	every active voice into [outdata]
+	"""
+	def callback(self, outdata, frames, time, status):
+		self.run_commands()
+		outdata.fill(0)
+		for voice in self.voices:
+			if voice.pitch == None:
+				continue
+			count = min(frames, len(voice.samples) - voice.pos)
+			if voice.release_left != None:
+				count = min(count, voice.release_left)
+			chunk = voice.samples[voice.pos:voice.pos + count]
+			if voice.release_left == None:
+				outdata[:count] += chunk * sample_scale
+			else:
+				#Fade out linearly over [self.release_frames]
+				envelope = (voice.release_left - np.arange(count, \
+					dtype = np.float32)) * (sample_scale / self.release_frames)
+				outdata[:count] += chunk * envelope[:, None]
+				voice.release_left -= count
+			voice.pos += count
+			if voice.pos >= len(voice.samples) or voice.release_left == 0:
+				voice.free()
+		np.clip(outdata, -1.0, 1.0, out = outdata)
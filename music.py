@@ -1,11 +1,53 @@
 import pygame
-from components import Btn, Text, Line, Image, Stage
+from components import Btn, Text, Line, Image, Stage, DirtyTracker, tint
 import simpleaudio as sa
 import os
+import score_cache
+import pitch_table
+from sample_bank import SampleBank
+from command_queue import CommandQueue
+from collections import OrderedDict, namedtuple
+from itertools import count
+from bisect import bisect_left, bisect_right
+import threading
 
 def float_eq(f1, f2):
 	return abs(f1 - f2) <= 1e-4
 
+#[note_ends notes] returns a tuple of the time (in crotchets from the start
+#of the bar) at which each note in [notes] ends
+def note_ends(notes):
+	ends = []
+	accl = 0
+	for (_, dur) in notes:
+		accl += dur
+		ends.append(accl)
+	return tuple(ends)
+
+"""
+[iter_lines file] yields (byte offset, line) for every line in the binary
+[file], with line endings normalised to a single newline. An extra empty line
+is yielded at the end of the file to make sure the last bar is read.
+"""
+def iter_lines(file):
+	offset = 0
+	for line in file:
+		yield (offset, line.decode().rstrip('\r\n') + '\n')
+		offset += len(line)
+	yield (offset, '\n')
+
+"""
+[parse_note note_split] converts a note line split on spaces (ie
+['T', 'C4,E4', '1']) into a tuple of the clef, the list of pitch names and
+the duration of the note
+"""
+def parse_note(note_split):
+	clef = note_split[0]
+	#Have commas no spaces for multiple notes
+	pitches = note_split[1].split(",")
+	duration = float(note_split[2])
+	return (clef, pitches, duration)
+
 #This class represents a musical bar
 class Bar:
 	"""
@@ -13,21 +55,29 @@ class Bar:
 	with [bpm] beats per minute, [timing] as a tuple of the top and bottom
 	timings, [treble] indicating the notes in the treble clef and [bass]
 	indicating the notes in the bass clef.
-	We use a tuple of a list of notes in plaintext, followed by the duration
-	to represent a note (ie (['C4', 'E4'], 2))
+	We use a tuple of a tuple of pitch ids (see pitch_table.py), followed by
+	the duration to represent a note (ie ((60, 64), 2) for C4 and E4)
+	The time at which every note ends is precomputed for both clefs so that
+	lookups don't need to walk the bar.
 	"""
+	__slots__ = ("bpm", "timing", "treble", "bass", "treble_ends", \
+		"bass_ends", "length")
+
 	def __init__(self, bpm, timing, treble, bass):
 		self.bpm = bpm
 		self.timing = timing
 		self.treble = treble
 		self.bass = bass
+		self.treble_ends = note_ends(treble)
+		self.bass_ends = note_ends(bass)
+		if len(self.treble_ends) > 0:
+			self.length = self.treble_ends[-1]
+		else:
+			self.length = 0
 
 	#[get_length self] returns the length of this bar in crotchets
 	def get_length(self):
-		ans = 0
-		for (_, dur) in self.treble:
-			ans += dur
-		return ans
+		return self.length
 
 	"""
 	[note_at_time self time treble] returns the index of the note at [time] crotchets
@@ -35,16 +85,15 @@ class Bar:
 	if [treble] is True and bass clef otherwise.
 	"""
 	def note_at_time(self, time, treble):
-		accl = 0
 		if treble:
-			notes = self.treble
+			ends = self.treble_ends
 		else:
-			notes = self.bass
-		for (idx,(_, dur)) in zip(range(len(notes)), notes):
-			accl += dur
-			if accl >= time:
-				return idx
-		return len(notes) - 1
+			ends = self.bass_ends
+		#First note that ends at or after [time]
+		idx = bisect_left(ends, time)
+		if idx == len(ends):
+			return len(ends) - 1
+		return idx
 
 	"""
 	[end_duration idx treble] returns the time at which the note at [idx]
@@ -53,14 +102,10 @@ class Bar:
 	of the bar.
 	"""
 	def end_duration(self, idx, treble):
-		accl = 0
 		if treble:
-			notes = self.treble
+			return self.treble_ends[idx]
 		else:
-			notes = self.bass
-		for i in range(idx + 1):
-			accl += notes[i][1]
-		return accl
+			return self.bass_ends[idx]
 
 	"""
 	[get_treble self] returns the list of notes that make up the
@@ -91,6 +136,70 @@ class Bar:
 	def get_timing(self):
 		return self.timing
 
+"""
+The (x, y) offsets of the note images of every duration from the position of
+the note, for normal, flipped and rest notes respectively
+"""
+img_adjustments = {1.0 : [(0, -13), (0, +14), (0, 0)], \
+	2.0: [(0, -13), (0, +14), (0, -2)], \
+	3.0: [(0, -13), (0, +14), (0, -2)], \
+	4.0: [(0, 0), (0, 0), (0, -7)], \
+	1.5: [(0, -13), (0, +14), (0, 0)], \
+	0.5: [(+4, -13), (-4, +14), (0, 0)], \
+	0.75: [(+4, -13), (-4, +14), (0, 0)], \
+	0.25: [(+4, -13), (-4, +14), (0, 0)]}
+
+"""
+The position of a single pitch on the page, with
+[glyph] as a tuple (duration, rest, flip) of the note image (see NoteImgCache)
+[x] and [y] as the center of the note image
+[ledgers] as a tuple of (start x, end x, y) of the ledger lines of the note
+[sharp] as the (x, y) center of its sharp sign, or None if it isn't sharp
+"""
+NoteLayout = namedtuple("NoteLayout", ["glyph", "x", "y", "ledgers", "sharp"])
+
+#Clef adjustments computed by [get_clef_adj], keyed by its arguments
+clef_adjs = {}
+
+"""
+[get_clef_adj treble increment] returns a dictionary of the y axis
+adjustment of every pitch id in the clef given by [treble] (Treble if True,
+Bass if False) where lines on the staff are [increment] pixels apart. Sharps
+have the same adjustment as the natural they are drawn on. The dictionary is
+only built once and must not be modified.
+"""
+def get_clef_adj(treble, increment):
+	clef_adj = clef_adjs.get((treble, increment))
+	if clef_adj != None:
+		return clef_adj
+	clef_adj = {pitch_table.REST : increment * 2}
+	if treble:
+		alphabet = 'F'
+		octave = 3
+		adj = -6 * float(increment) / 2
+	else:
+		alphabet = 'E'
+		octave = 2
+		adj = -2 * float(increment) / 2
+	while octave < 7:
+		clef_adj[pitch_table.to_id(alphabet + str(octave))] = adj
+		alphabet = chr(ord(alphabet) + 1)
+		if alphabet > 'G':
+			alphabet = 'A'
+		if alphabet == 'C':
+			octave += 1
+		adj += float(increment) / 2
+	for pitch, natural in pitch_table.NATURALS.items():
+		if pitch != natural and natural in clef_adj:
+			clef_adj[pitch] = clef_adj[natural]
+	clef_adjs[(treble, increment)] = clef_adj
+	return clef_adj
+
+#[can_draw pitch treble] returns whether the pitch id [pitch] is within the
+#range of the clef given by [treble] (Treble if True, Bass if False)
+def can_draw(pitch, treble):
+	return pitch in get_clef_adj(treble, 1)
+
 #This class represents a musical score
 class Score:
 	"""
@@ -99,36 +208,81 @@ class Score:
 	all notes in the score are indeed playable and able to be rendered.
 	Any issues that occur will be printed to stdout and will contain
 	the line and bar number of the error.
+	If [use_cache] is True, the score is loaded from its compiled cache
+	(see score_cache.py) when the cache is fresh, and the cache is rewritten
+	after the text file has been parsed otherwise.
+	If [lazy] is True, the file is only indexed (and validated) when loading
+	and each bar is parsed from the file when it is first requested, keeping
+	at most [max_cached_bars] parsed bars in memory. Lazy scores do not use
+	the compiled cache.
 	"""
-	def __init__(self, file_name, note_imgs, player):
+	def __init__(self, file_name, note_imgs, player, use_cache = True, \
+		lazy = False, max_cached_bars = 8):
 		self.note_imgs = note_imgs
 		self.player = player
+		self.file_name = file_name
+		#Identifies this version of the score file
+		try:
+			self.key = (file_name,) + score_cache.source_key(file_name)
+		except OSError:
+			self.key = (file_name,)
+		self.lazy = lazy
+		self.max_cached_bars = max_cached_bars
+		#Bars parsed on demand (lazy scores only), least recently used first
+		self.cached_bars = OrderedDict()
+		#Note layouts computed by RenderedScore, keyed by layout parameters
+		self.layouts = {}
+		#Use the compiled cache if it is still fresh
+		if not lazy and use_cache and self.load_cache():
+			return
+		self.parse_file(file_name)
+		if not lazy and use_cache and self.valid:
+			self.save_cache()
+
+	"""
+	[parse_file self file_name] parses the plaintext score file at [file_name]
+	and fills in the bars and metadata of this score. [self.valid] is set to
+	False and [self.reason] is updated if the file is invalid.
+	Lazy scores only record (start offset, end offset, bpm, timing) for every
+	bar in [self.bar_index] instead of building the bars. The pitches,
+	durations and note counts of the score are recorded on the way.
+	"""
+	def parse_file(self, file_name):
 		try:
-			with open(file_name, 'r') as file:
-				lines = file.readlines()
-				#To make sure the last bar is read
-				lines.append('\n')
+			with open(file_name, 'rb') as file:
+				lines = iter_lines(file)
 				self.num_bars = 0
 				self.valid = True
 				self.reason = "File is good"
 				#Read metadata
-				self.name = lines[0].strip()
-				bpm = int(lines[1])
-				timing_split = lines[2].strip().split(' ')
+				self.name = next(lines)[1].strip()
+				bpm = int(next(lines)[1])
+				timing_split = next(lines)[1].strip().split(' ')
 				timing = (int(timing_split[0]), int(timing_split[1]))
+				next(lines)
 				#Read score
-				#Stores a tuple of <note name> (ie 'A4') and duration (ie 1)
-				#A list of lists of tuples (organised by bars)
+				#Stores a tuple of <pitch ids> (ie (69,) for 'A4') and duration
+				#(ie 1). A list of lists of tuples (organised by bars)
 				#Use sharp to store notes, not flat (ie 'A#4')
-				self.bars = []
+				self.bars = None if self.lazy else []
+				self.bar_index = [] if self.lazy else None
+				#Recorded while parsing so that lazy scores can answer these
+				#without parsing their bars again
+				self.pitches = set()
+				self.durations = set()
+				treble_notes = 0
+				bass_notes = 0
 				bar_no = 1
+				bar_start = None
 				bar_treble = []
 				bar_bass = []
 				bar_treble_len = 0
 				bar_bass_len = 0
 				#Requires a newline between every bar
-				for line_no, note in zip(range(4, len(lines)), lines[4:]):
+				for line_no, (offset, note) in zip(count(4), lines):
 					note = note.upper()
+					if bar_start == None:
+						bar_start = offset
 					#Lines that start with # are comments
 					if note.strip().startswith("#"):
 						continue
@@ -143,8 +297,12 @@ class Score:
 							be invalid (wrong timing)".format(bar_no, line_no)
 							return
 						#Add bars to treble and bass, increment bar no
-						bar = Bar(bpm, timing, bar_treble, bar_bass)
-						self.bars.append(bar)
+						if self.lazy:
+							self.bar_index.append((bar_start, offset, bpm, timing))
+						else:
+							bar = Bar(bpm, timing, bar_treble, bar_bass)
+							self.bars.append(bar)
+						bar_start = None
 						bar_treble = []
 						bar_bass = []
 						bar_treble_len = 0
@@ -165,28 +323,41 @@ class Score:
 							self.reason = "Bar {} (line {}) appears to \
 							be invalid".format(bar_no, line_no)
 							return
-						clef = note_split[0]
-						#Have commas no spaces for multiple notes
-						pitches = note_split[1].split(",")
-						for pitch in pitches:
+						clef, names, duration = parse_note(note_split)
+						pitches = pitch_table.to_ids(names)
+						for name, pitch in zip(names, pitches):
 							if not self.player.has_note(pitch):
 								self.valid = False
 								self.reason = "Note {} in Bar {} (line {}) is not \
-								playable".format(pitch, bar_no, line_no)
+								playable".format(name, bar_no, line_no)
+								return
+							if not can_draw(pitch, clef != 'B'):
+								self.valid = False
+								self.reason = "Note {} in Bar {} (line {}) is out \
+								of the range of the {} clef".format(name, bar_no, \
+								line_no, "bass" if clef == 'B' else "treble")
 								return
-						duration = float(note_split[2])
 						if not self.note_imgs.has_note(duration):
 							self.valid = False
 							self.reason = "Duration {0:.2f} in Bar {1:} (line {2:}) \
 							cannot be displayed".format(duration, bar_no, line_no)
 							return
+						self.pitches.update(pitches)
+						self.durations.add(duration)
 						if clef == 'B':
-							bar_bass.append((pitches, duration))
+							#Lazy scores parse the notes again in get_bar
+							if not self.lazy:
+								bar_bass.append((pitches, duration))
 							bar_bass_len += duration
+							bass_notes += 1
 						else:
-							bar_treble.append((pitches, duration))
+							if not self.lazy:
+								bar_treble.append((pitches, duration))
 							bar_treble_len += duration
+							treble_notes += 1
 				self.num_bars = bar_no - 1
+				self.pitches.discard(pitch_table.REST)
+				self.note_counts = (treble_notes, bass_notes)
 		except FileNotFoundError:
 			self.valid = False
 			self.reason = "File not found"
@@ -194,6 +365,87 @@ class Score:
 		#	self.valid = False
 		#	self.reason = "An exception occurred while parsing the file"
 
+	#[__getstate__ self] drops the image cache and audio player (which cannot
+	#be pickled) so that scores can be sent between processes
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state["note_imgs"] = None
+		state["player"] = None
+		state["layouts"] = {}
+		return state
+
+	"""
+	[get_layouts self key] returns the dictionary of note layouts of this
+	score (see RenderedScore.get_bar_layout) computed with the layout
+	parameters [key], keyed by bar number, so that they are only computed
+	once no matter how many times the score is played
+	"""
+	def get_layouts(self, key):
+		return self.layouts.setdefault(key, {})
+
+	"""
+	[parse_bar self bar] parses the bar at index [bar] of a lazy score from
+	the byte range recorded in [self.bar_index]. The file has already been
+	validated by [parse_file] so no checks are done here.
+	"""
+	def parse_bar(self, bar):
+		start, end, bpm, timing = self.bar_index[bar]
+		with open(self.file_name, 'rb') as file:
+			file.seek(start)
+			data = file.read(end - start)
+		treble = []
+		bass = []
+		for note in data.decode().upper().splitlines():
+			if note.strip() == '' or note.strip().startswith("#") \
+			or note.startswith("CHANGE"):
+				continue
+			clef, names, duration = parse_note(note.strip().split(' '))
+			pitches = pitch_table.to_ids(names)
+			if clef == 'B':
+				bass.append((pitches, duration))
+			else:
+				treble.append((pitches, duration))
+		return Bar(bpm, timing, treble, bass)
+
+	"""
+	[load_cache self] loads this score from its compiled cache and returns
+	True if the cache is fresh. The pitches and durations recorded in the cache
+	are checked against [self.player] and [self.note_imgs] again since the
+	available sounds or images may have changed since the cache was written.
+	Returns False if the score needs to be parsed from the text file.
+	"""
+	def load_cache(self):
+		payload = score_cache.load(self.file_name)
+		if payload == None:
+			return False
+		for pitch in payload["pitches"]:
+			if not self.player.has_note(pitch):
+				return False
+		for duration in payload["durations"]:
+			if not self.note_imgs.has_note(duration):
+				return False
+		self.valid = True
+		self.reason = "File is good"
+		self.name = payload["name"]
+		self.num_bars = payload["num_bars"]
+		self.bars = [Bar(bpm, timing, treble, bass) for \
+			(bpm, timing, treble, bass) in payload["bars"]]
+		self.pitches = set(payload["pitches"])
+		self.durations = set(payload["durations"])
+		self.note_counts = (sum(len(bar.get_treble()) for bar in self.bars), \
+			sum(len(bar.get_bass()) for bar in self.bars))
+		return True
+
+	#[save_cache self] writes the bars and metadata of this score into its
+	#compiled cache so that the next load can skip parsing
+	def save_cache(self):
+		bars = []
+		for bar in self.bars:
+			bars.append((bar.get_bpm(), bar.get_timing(), bar.get_treble(), \
+				bar.get_bass()))
+		score_cache.save(self.file_name, {"name" : self.name, \
+			"num_bars" : self.num_bars, "bars" : bars, \
+			"pitches" : self.get_pitches(), "durations" : self.get_durations()})
 
 	#[get_metadata self] returns the metadata of this score as a dictionary
 	def get_metadata(self):
@@ -203,9 +455,201 @@ class Score:
 	def get_total_bars(self):
 		return self.num_bars
 
-	#[get_bar self bar] returns the bar at index [bar] of this score
+	#[get_key self] returns a key that identifies the score file (and its
+	#version) that this score was loaded from
+	def get_key(self):
+		return self.key
+
+	#[get_total_beats self] returns the length of this score in crotchets
+	def get_total_beats(self):
+		return self.get_timeline().get_total_beats()
+
+	#[get_duration self] returns the length of this score in seconds when
+	#played at the written pace, taking every change of pace into account
+	def get_duration(self):
+		return self.get_timeline().get_duration()
+
+	"""
+	[get_bar_header self bar] returns a tuple of the bpm, timing and length
+	(in crotchets) of the bar at index [bar] without parsing the bar if this
+	is a lazy score
+	"""
+	def get_bar_header(self, bar):
+		if not self.lazy:
+			curr_bar = self.bars[bar]
+			return (curr_bar.get_bpm(), curr_bar.get_timing(), \
+				curr_bar.get_length())
+		_, _, bpm, timing = self.bar_index[bar]
+		return (bpm, timing, timing[0] / timing[1] * 4.0)
+
+	#[get_timeline self] returns the Timeline of this score, which is built
+	#the first time it is needed
+	def get_timeline(self):
+		if getattr(self, "timeline", None) == None:
+			self.timeline = Timeline(self)
+		return self.timeline
+
+	#[get_note_counts self] returns a tuple of the number of notes (including
+	#rests) in the treble clef and in the bass clef of this score
+	def get_note_counts(self):
+		return self.note_counts
+
+	#[get_note_count self] returns the total number of notes (including rests)
+	#in both clefs of this score
+	def get_note_count(self):
+		return sum(self.get_note_counts())
+
+	#[get_pitches self] returns the set of pitches used in this score,
+	#excluding rests
+	def get_pitches(self):
+		return set(self.pitches)
+
+	#[get_durations self] returns the set of note durations used in this score
+	def get_durations(self):
+		return set(self.durations)
+
+	#[get_pitch_range self] returns a tuple of the lowest and highest pitch
+	#used in this score, or (None, None) if the score only has rests
+	def get_pitch_range(self):
+		pitches = sorted(self.get_pitches())
+		if len(pitches) == 0:
+			return (None, None)
+		return (pitches[0], pitches[-1])
+
+	#[get_unplayable_pitches self playable] returns the set of pitches used
+	#in this score that are not in [playable] (ie an input's playable pitches)
+	def get_unplayable_pitches(self, playable):
+		return self.get_pitches() - set(playable)
+
+	"""
+	[get_bar self bar] returns the bar at index [bar] of this score. Lazy
+	scores parse the bar on first use and keep the most recently used
+	[self.max_cached_bars] bars.
+	"""
 	def get_bar(self, bar):
-		return self.bars[bar]
+		if not self.lazy:
+			return self.bars[bar]
+		if bar < 0:
+			bar += self.num_bars
+		if bar in self.cached_bars:
+			self.cached_bars.move_to_end(bar)
+			return self.cached_bars[bar]
+		parsed = self.parse_bar(bar)
+		self.cached_bars[bar] = parsed
+		if len(self.cached_bars) > self.max_cached_bars:
+			self.cached_bars.popitem(last = False)
+		return parsed
+
+"""
+This class maps absolute positions in a score (in seconds or in crotchets
+from the start of the score) to a bar index and a timing within that bar
+(in crotchets), and back. Every change of pace and timing is accounted for
+since the start of every bar is precomputed, so lookups are a binary search.
+"""
+class Timeline:
+	#[__init__ self score] builds the timeline of [score]
+	def __init__(self, score):
+		#Start of every bar in crotchets and seconds, with the end of the
+		#score appended
+		self.bar_beats = [0.0]
+		self.bar_seconds = [0.0]
+		self.bar_bpms = []
+		for i in range(score.get_total_bars()):
+			bpm, _, length = score.get_bar_header(i)
+			self.bar_bpms.append(bpm)
+			self.bar_beats.append(self.bar_beats[-1] + length)
+			self.bar_seconds.append(self.bar_seconds[-1] + length * 60.0 / bpm)
+
+	#[get_total_beats self] returns the length of the score in crotchets
+	def get_total_beats(self):
+		return self.bar_beats[-1]
+
+	#[get_duration self] returns the length of the score in seconds
+	def get_duration(self):
+		return self.bar_seconds[-1]
+
+	"""
+	[bar_at_seconds self seconds] returns a tuple of the bar index and the
+	timing within that bar (in crotchets) at [seconds] from the start of the
+	score. Positions outside the score are clamped to its start and end.
+	"""
+	def bar_at_seconds(self, seconds):
+		bar = self.find_bar(self.bar_seconds, seconds)
+		if bar == None:
+			return (0, 0.0)
+		timing = (seconds - self.bar_seconds[bar]) * self.bar_bpms[bar] / 60.0
+		timing = min(timing, self.bar_beats[bar + 1] - self.bar_beats[bar])
+		return (bar, max(timing, 0.0))
+
+	"""
+	[bar_at_beats self beats] returns a tuple of the bar index and the timing
+	within that bar (in crotchets) at [beats] crotchets from the start of the
+	score. Positions outside the score are clamped to its start and end.
+	"""
+	def bar_at_beats(self, beats):
+		bar = self.find_bar(self.bar_beats, beats)
+		if bar == None:
+			return (0, 0.0)
+		beats = min(max(beats, 0.0), self.bar_beats[bar + 1])
+		return (bar, beats - self.bar_beats[bar])
+
+	#[to_seconds self bar timing] returns the number of seconds from the start
+	#of the score at [timing] crotchets into the bar at index [bar]
+	def to_seconds(self, bar, timing):
+		return self.bar_seconds[bar] + timing * 60.0 / self.bar_bpms[bar]
+
+	#[to_beats self bar timing] returns the number of crotchets from the start
+	#of the score at [timing] crotchets into the bar at index [bar]
+	def to_beats(self, bar, timing):
+		return self.bar_beats[bar] + timing
+
+	#[find_bar self starts pos] returns the index of the bar in which [pos]
+	#lies given the bar [starts], or None if there are no bars
+	def find_bar(self, starts, pos):
+		if len(self.bar_bpms) == 0:
+			return None
+		bar = bisect_right(starts, pos) - 1
+		return min(max(bar, 0), len(self.bar_bpms) - 1)
+
+#Size of a rendered page of a score, which is the size of the screen
+page_size = (320, 240)
+
+#This class is a least recently used cache of rendered pages (surfaces)
+#shared by every RenderedScore so that replaying or restarting a score
+#reuses the pages that were already rendered
+class PageCache:
+	#[__init__ self max_pages] creates a cache that holds up to [max_pages]
+	#pages
+	def __init__(self, max_pages):
+		self.max_pages = max_pages
+		self.pages = OrderedDict()
+		#Pages are added from background threads
+		self.lock = threading.Lock()
+
+	#[get self key] returns the page stored with [key], or None if it is
+	#not cached
+	def get(self, key):
+		with self.lock:
+			if key not in self.pages:
+				return None
+			self.pages.move_to_end(key)
+			return self.pages[key]
+
+	#[put self key surf] stores the page [surf] with [key], evicting the
+	#least recently used page if the cache is full
+	def put(self, key, surf):
+		with self.lock:
+			self.pages[key] = surf
+			self.pages.move_to_end(key)
+			if len(self.pages) > self.max_pages:
+				self.pages.popitem(last = False)
+
+	#[clear self] removes every page from the cache
+	def clear(self):
+		with self.lock:
+			self.pages.clear()
+
+page_cache = PageCache(8)
 
 #This class renders all of the notes on the score onto the screen.
 #It also provides playback control and is able to optionally play notes
@@ -215,7 +659,7 @@ class RenderedScore:
 	#using the images from [note_imgs], audio player [player] and score [score]
 	def __init__(self, note_imgs, player, score = None):
 		self.colors = {"yellow": (244, 247, 35), "black": (0,0,0), \
-		"dark_blue": (47, 29, 245)}
+		"dark_blue": (47, 29, 245), "white": (255,255,255)}
 		self.note_imgs = note_imgs
 		self.player = player
 		self.num_bars = 2
@@ -223,6 +667,13 @@ class RenderedScore:
 		self.mark_black = True
 		#Used to notate whether to play notes
 		self.play_notes = True
+		#Playback advances in fixed steps of [timestep] seconds no matter how
+		#long frames take, so that notes change at the same points every time.
+		#[time_acc] is the time that hasn't been stepped through yet, and
+		#frames longer than [max_dt] only count as [max_dt].
+		self.timestep = 1.0 / 120
+		self.max_dt = 0.25
+		self.time_acc = 0.0
 		if score == None:
 			self.score = None
 		else:
@@ -241,6 +692,7 @@ class RenderedScore:
 		self.advance_rate = 1.0
 		#Stage with no elements
 		self.stage = Stage()
+		self.tracker = DirtyTracker()
 		#Keep track of current state
 		#Start at the 0th bar
 		self.curr_bar_idx = 0
@@ -248,6 +700,8 @@ class RenderedScore:
 		self.has_started = False
 		#Grab current bar
 		self.bars = self.get_bars()
+		#Read the notes of the score into memory before they are played
+		self.player.prepare(new_score.get_pitches())
 		#The current timing in the current bar (based on bar timing and bpm)
 		self.curr_timing = 0.0
 		#1.0 for normal, -<sth> for rewind, +<sth> for ffwd, 0 for pause
@@ -264,26 +718,29 @@ class RenderedScore:
 		#Precompute adjustments
 		self.bass_adj = self.get_adj(False)
 		self.treble_adj = self.get_adj(True)
+		#Elements that are the same on every page, these are drawn once
+		#onto [self.staff_surf] which every page is rendered on top of
+		staff_elts = []
 		#Add Treble Lines, Clef and Timing
 		self.treble_lines = []
 		self.treble_clef = Image("img/treble_clef.png", (20, 50), (35, 70))
-		self.stage.add_elt(self.treble_clef)
+		staff_elts.append(self.treble_clef)
 		#30 up to 70
 		for i in range(self.treble_begin - 4 * self.treble_increment, \
 			self.treble_begin + self.treble_increment, self.treble_increment):
 			line = Line((self.left_margin, i), (self.right_margin, i))
 			self.treble_lines.append(line)
-			self.stage.add_elt(line)
+			staff_elts.append(line)
 		#Add Bass Lines, Clef and Timing
 		self.bass_lines = []
 		self.bass_clef = Image("img/bass_clef.png", (25, 135), (35, 35))
-		self.stage.add_elt(self.bass_clef)
+		staff_elts.append(self.bass_clef)
 		#120 up to 160
 		for i in range(self.bass_begin - 4 * self.bass_increment, \
 			self.bass_begin + self.bass_increment, self.bass_increment):
 			line = Line((self.left_margin, i), (self.right_margin, i))
 			self.bass_lines.append(line)
-			self.stage.add_elt(line)
+			staff_elts.append(line)
 		#Add bar lines
 		#Generate bar lines for left and right edges
 		self.bar_lines = [\
@@ -301,7 +758,11 @@ class RenderedScore:
 			self.bar_lines.append(Line((end_x, self.bass_begin \
 			- 4 * self.bass_increment),(end_x,self.bass_begin)))
 		for bar_line in self.bar_lines:
-			self.stage.add_elt(bar_line)
+			staff_elts.append(bar_line)
+		self.staff_surf = pygame.Surface(page_size).convert()
+		self.staff_surf.fill(self.colors["white"])
+		for elt in staff_elts:
+			elt.draw(self.staff_surf)
 		#Draw current position line
 		play_line_pos = self.get_note_horizontal_pos(self.curr_bar_idx, \
 			self.curr_timing) + 5
@@ -309,96 +770,203 @@ class RenderedScore:
 			5 * self.treble_increment), (play_line_pos, self.bass_begin + \
 			self.bass_increment))
 		self.stage.add_elt(self.play_line)
+		#Background thread that renders the next page, if any
+		self.prefetch_thread = None
 		#Grab new timings
 		self.refresh_timings()
 
-	#[refresh_timings self] refreshes all of the bars, timings and bpm
-	#displayed on the stage based on the current timing (self.curr_timing) 
-	#and current bar index (self.curr_bar_idx)
+	"""
+	[refresh_timings self] refreshes the page that is displayed (with all of
+	the bars, timings, bpm and notes) based on the current bar index
+	(self.curr_bar_idx). Pages are rendered once into a surface that is
+	cached in [page_cache], and the next page is rendered in the background
+	while this page is being played.
+	"""
 	def refresh_timings(self):
-		self.stage.clear_tmp_elts()
-		self.bar_numbers = []
-		self.timings = []
-		self.pace_text = []
 		#Grab current bar
 		self.bars = self.get_bars()
+		page = self.curr_bar_idx // self.num_bars
+		self.page_surf = self.get_page_surf(page)
+		self.refresh_notes()
+		self.prefetch_page(page + 1)
+
+	"""
+	[get_timing_elts self page bars] returns the bar numbers, timings and bpm
+	Text elements of page number [page], which contains [bars]
+	"""
+	def get_timing_elts(self, page, bars):
+		elts = []
 		prev_timing = (None, None)
 		prev_pace = None
 		#Render all the bars
-		for bar_idx, bar in zip(range(len(self.bars)), self.bars):
-			bar_timings = []
+		for bar_idx, bar in zip(range(len(bars)), bars):
 			top_timing, bottom_timing = bar.get_timing()
 			curr_pace = bar.get_bpm()
 			start_x = self.get_bar_start_x(bar_idx)
-			bar_idx_norm = self.curr_bar_idx - self.curr_bar_idx % 2
-			bar_num = bar_idx_norm + bar_idx + 1
-			self.bar_numbers.append(Text(str(bar_num), (start_x + 5, \
+			bar_num = page * self.num_bars + bar_idx + 1
+			elts.append(Text(str(bar_num), (start_x + 5, \
 				self.treble_begin - 4 * self.treble_increment - 10), \
 				font_size = 20))
 			if prev_timing != (top_timing, bottom_timing):
 				top_timing = str(top_timing)
 				bottom_timing = str(bottom_timing)
-				bar_timings.append(Text(top_timing, (start_x + 10, 40), \
+				elts.append(Text(top_timing, (start_x + 10, 40), \
 					font_size = 42))
-				bar_timings.append(Text(bottom_timing, (start_x + 10, 62), \
+				elts.append(Text(bottom_timing, (start_x + 10, 62), \
 					font_size = 42))
-				bar_timings.append(Text(top_timing, (start_x + 10, 130), \
+				elts.append(Text(top_timing, (start_x + 10, 130), \
 					font_size = 42))
-				bar_timings.append(Text(bottom_timing, (start_x + 10, 152), \
+				elts.append(Text(bottom_timing, (start_x + 10, 152), \
 					font_size = 42))
 			if prev_pace != curr_pace:
-				self.pace_text.append(Text(self.pace_to_str(curr_pace), \
+				elts.append(Text(self.pace_to_str(curr_pace), \
 					(start_x + 70, self.treble_begin - 4 * \
 					self.treble_increment - 10), font_size = 20))
 			#Add timings
 			prev_timing = bar.get_timing()
 			prev_pace = curr_pace
-			self.timings.append(bar_timings)
-			for timing in bar_timings:
-				self.stage.add_tmp_elt(timing)
-		for bar_number in self.bar_numbers:
-			self.stage.add_tmp_elt(bar_number)
-		for text in self.pace_text:
-			self.stage.add_tmp_elt(text)
-		self.refresh_notes()
+		return elts
 
-	#[refresh_notes self] updates the position of all the notes on the screen
-	#based on self.curr_timing and self.curr_bar_idx
-	def refresh_notes(self):
-		#Draw the notes
-		#Stored by bar in same order as self.bars, then list of pitches for
-		#each note, then a list of Components for each pitch
-		#the note Image is always the last element in the list of Components
-		self.treble_note_imgs = []
-		self.bass_note_imgs = []
-		for bar_idx, bar in zip(range(self.num_bars), self.bars):
-			self.treble_bar_imgs = []
-			self.add_notes_from_clef(bar_idx, bar.get_treble(), True, \
-				self.treble_bar_imgs)
-			self.bass_bar_imgs = []
-			self.add_notes_from_clef(bar_idx, bar.get_bass(), False, \
-				self.bass_bar_imgs)
-			self.treble_note_imgs.append(self.treble_bar_imgs)
-			self.bass_note_imgs.append(self.bass_bar_imgs)
-		for bar in self.treble_note_imgs + self.bass_note_imgs:
+	"""
+	[get_note_components self page bars] returns a tuple of the treble and
+	bass Components of every note in [bars], the bars of page number [page].
+	These are stored by bar in the same order as [bars], then list of pitches
+	for each note, then a list of Components for each pitch. The note Image
+	is always the last element in the list of Components.
+	"""
+	def get_note_components(self, page, bars):
+		treble_note_imgs = []
+		bass_note_imgs = []
+		for bar_idx in range(len(bars)):
+			treble_layout, bass_layout = \
+				self.get_bar_layout(page * self.num_bars + bar_idx, bars)
+			treble_note_imgs.append([[self.get_layout_components(layout) \
+				for layout in note] for note in treble_layout])
+			bass_note_imgs.append([[self.get_layout_components(layout) \
+				for layout in note] for note in bass_layout])
+		return (treble_note_imgs, bass_note_imgs)
+
+	"""
+	[get_layout_key self] returns the parameters that note layouts depend on,
+	which identify the layouts of this RenderedScore in Score.get_layouts
+	"""
+	def get_layout_key(self):
+		return (self.num_bars, self.left_margin, self.start_left_margin, \
+			self.right_margin, self.treble_begin, self.treble_increment, \
+			self.bass_begin, self.bass_increment)
+
+	"""
+	[get_bar_layout self bar_num bars] returns a tuple of the treble and bass
+	layouts of bar number [bar_num] of the score, which is in [bars] (the
+	bars of its page). Each layout is a tuple with a tuple of NoteLayouts
+	(one for each pitch) for every note in the clef. Layouts are computed
+	once and cached on the Score.
+	"""
+	def get_bar_layout(self, bar_num, bars):
+		layouts = self.score.get_layouts(self.get_layout_key())
+		layout = layouts.get(bar_num)
+		if layout == None:
+			bar_idx = bar_num % self.num_bars
+			bar = bars[bar_idx]
+			layout = (self.layout_clef(bar_idx, bar.get_treble(), True, bars), \
+				self.layout_clef(bar_idx, bar.get_bass(), False, bars))
+			layouts[bar_num] = layout
+		return layout
+
+	"""
+	[get_layout_components self layout] returns the list of Components
+	needed to draw the pitch at NoteLayout [layout]. The note Image is always
+	the last element in the list.
+	"""
+	def get_layout_components(self, layout):
+		images = [Line((start_x, y), (end_x, y)) for start_x, end_x, y \
+			in layout.ledgers]
+		if layout.sharp != None:
+			images.append(Text("#", layout.sharp, font_size = 20))
+		duration, is_pause, is_flipped = layout.glyph
+		palette = self.note_imgs.get_palette(duration, rest = is_pause, \
+			flip = is_flipped)
+		images.append(Image(None, (layout.x, layout.y), palette = palette))
+		return images
+
+	"""
+	[render_page self page bars] renders page number [page] (with all of its
+	timings and notes in black) into a new surface and returns it. [bars] are
+	the bars on the page, which are fetched if None. This may be called from
+	a background thread if [bars] are given, since fetching the bars of a
+	lazy score isn't thread safe.
+	"""
+	def render_page(self, page, bars = None):
+		if bars == None:
+			bars = self.get_bars(page)
+		surf = self.staff_surf.copy()
+		for elt in self.get_timing_elts(page, bars):
+			elt.draw(surf)
+		treble_note_imgs, bass_note_imgs = \
+			self.get_note_components(page, bars)
+		for bar in treble_note_imgs + bass_note_imgs:
 			for pitches in bar:
 				for pitch in pitches:
 					for component in pitch:
-						self.stage.add_tmp_elt(component)
+						component.draw(surf)
+		return surf
+
+	#[get_page_key self page] returns the key of page number [page] of this
+	#score in [page_cache]
+	def get_page_key(self, page):
+		return (self.score.get_key(), page, self.colors["black"])
 
 	"""
-	[add_notes_from_clef self bar_idx notes treble append_to] appends [notes]
-	from the bar at [bar_idx] relative to self.curr_bar_idx from the clef
-	indicated by [treble] (Treble if True, Bass if False) to the list
-	[append_to]. Note that this takes into account note flips and chords
-	where all notes point the same direction.
+	[get_page_surf self page] returns the rendered surface of page number
+	[page], waiting for the background thread if it is still rendering and
+	rendering the page now if it isn't cached.
+	"""
+	def get_page_surf(self, page):
+		if self.prefetch_thread != None:
+			self.prefetch_thread.join()
+			self.prefetch_thread = None
+		key = self.get_page_key(page)
+		surf = page_cache.get(key)
+		if surf == None:
+			surf = self.render_page(page)
+			page_cache.put(key, surf)
+		return surf
+
+	#[prefetch_page self page] renders page number [page] into [page_cache]
+	#in a background thread if it exists and isn't cached yet. The bars are
+	#fetched (and parsed, for lazy scores) here on the main thread.
+	def prefetch_page(self, page):
+		if page * self.num_bars >= self.score.get_total_bars():
+			return
+		key = self.get_page_key(page)
+		if page_cache.get(key) != None:
+			return
+		bars = self.get_bars(page)
+		self.prefetch_thread = threading.Thread(target = lambda: \
+			page_cache.put(key, self.render_page(page, bars)), daemon = True)
+		self.prefetch_thread.start()
+
+	#[refresh_notes self] rebuilds the note Components of the current page,
+	#which are only drawn over the rendered page once their color changes
+	def refresh_notes(self):
+		self.treble_note_imgs, self.bass_note_imgs = \
+			self.get_note_components(self.curr_bar_idx // self.num_bars, \
+			self.bars)
+		#Note Images that are not black and need to be drawn every frame
+		self.colored_imgs = set()
+
 	"""
-	def add_notes_from_clef(self, bar_idx, notes, treble, append_to):
+	[layout_clef self bar_idx notes treble bars] returns a tuple with a tuple
+	of NoteLayouts for every note in [notes] from the bar at [bar_idx]
+	(0 to self.num_bars - 1) in [bars] from the clef indicated by [treble]
+	(Treble if True, Bass if False). Note that this takes into account note
+	flips and chords where all notes point the same direction.
+	"""
+	def layout_clef(self, bar_idx, notes, treble, bars):
+		layouts = []
 		curr_dur = 0.0
 		for pitches, duration in notes:
-			note_imgs = []
-			x_pos = self.get_note_horizontal_pos(self.curr_bar_idx + bar_idx, \
-				curr_dur)
+			x_pos = self.get_note_horizontal_pos(bar_idx, curr_dur, bars)
 			#print("x_pos: {}".format(x_pos))
 			should_force_flip = False
 			for pitch in pitches:
@@ -406,11 +974,10 @@ class RenderedScore:
 				if should_flip:
 					should_force_flip = True
 					break
-			for pitch in pitches:
-				note_imgs.append(self.get_note_images(pitch, duration, \
-					x_pos, treble, force_flip = should_force_flip))
-			append_to.append(note_imgs)
+			layouts.append(tuple(self.layout_note(pitch, duration, x_pos, \
+				treble, force_flip = should_force_flip) for pitch in pitches))
 			curr_dur += duration
+		return tuple(layouts)
 
 	#[pace_to_str self pace] converts [pace] to a string based on the 
 	#beats per minute
@@ -426,12 +993,15 @@ class RenderedScore:
 		return "{} {}".format(pace_name, int(pace))
 
 	"""
-	[get_bars self] gets the current bars based on self.curr_bar_idx and
-	self.num_bars
+	[get_bars self page] gets the bars on page number [page], or the current
+	bars based on self.curr_bar_idx and self.num_bars if [page] is None
 	"""
-	def get_bars(self):
+	def get_bars(self, page = None):
 		bars = []
-		bar_idx = self.curr_bar_idx - (self.curr_bar_idx % self.num_bars)
+		if page == None:
+			bar_idx = self.curr_bar_idx - (self.curr_bar_idx % self.num_bars)
+		else:
+			bar_idx = page * self.num_bars
 		for i in range(bar_idx, min(bar_idx + 2, \
 			self.score.get_total_bars())):
 			bars.append(self.score.get_bar(i))
@@ -447,50 +1017,39 @@ class RenderedScore:
 		/ self.num_bars
 
 	"""
-	[get_note_horizontal_pos self bar_idx duration] gets the x position 
+	[get_note_horizontal_pos self bar_idx duration bars] gets the x position 
 	of the note relative to the start of the bar based on the note [duration]
-	and the relative index of the bar [bar_idx] (0 to self.num_bars - 1)
+	and the relative index of the bar [bar_idx] (0 to self.num_bars - 1) in
+	[bars], which are the current bars if [bars] is None
 	"""
-	def get_note_horizontal_pos(self, bar_idx, duration):
+	def get_note_horizontal_pos(self, bar_idx, duration, bars = None):
+		if bars == None:
+			bars = self.bars
 		bar_pos = bar_idx % self.num_bars
 		start_x = self.get_bar_start_x(bar_pos)
 		#print("bar_idx: {}, result: {}".format(bar_idx, start_x))
 		#Consider position occupied by timing
-		if bar_pos == 0 or self.bars[bar_pos].get_timing() \
-		!= self.bars[bar_pos - 1].get_timing():
+		if bar_pos == 0 or bars[bar_pos].get_timing() \
+		!= bars[bar_pos - 1].get_timing():
 			start_x += 20
 		end_x = self.get_bar_start_x(bar_pos + 1)
-		bar_duration = self.bars[bar_pos].get_length()
+		bar_duration = bars[bar_pos].get_length()
 		return start_x + float(end_x - start_x) * duration / bar_duration
 
 	"""
 	[get_adj self treble] gets the y axis adjustment needed based on the
-	pitch of the note for the given clef based on [treble].
+	pitch id of the note for the given clef based on [treble].
 	[treble] indicates the Treble Clef if True and Bass Clef if False.
+	Sharps have the same adjustment as the natural they are drawn on.
 	"""
 	def get_adj(self, treble):
-		clef_adj = {'-' : self.treble_increment * 2}
 		if treble:
-			alphabet = 'F'
-			octave = 3
-			adj = -6 * float(self.treble_increment) / 2
-		else:
-			alphabet = 'E'
-			octave = 2
-			adj = -2 * float(self.bass_increment) / 2
-		while octave < 7:
-			clef_adj[alphabet + str(octave)] = adj
-			alphabet = chr(ord(alphabet) + 1)
-			if alphabet > 'G':
-				alphabet = 'A'
-			if alphabet == 'C':
-				octave += 1
-			adj += float(self.treble_increment) / 2
-		return clef_adj
+			return get_clef_adj(True, self.treble_increment)
+		return get_clef_adj(False, self.bass_increment)
 
 	"""
-	[get_note_images self pitch duration x_pos treble force_flip]
-	returns a list of components needed to draw a particular pitch.
+	[layout_note self pitch duration x_pos treble force_flip]
+	returns the NoteLayout needed to draw a particular pitch.
 	[pitch] refers to the pitch we're currently considering
 	[duration] refers to the duration of the pitch that we're considering
 	[x_pos] refers to the computed horizontal position of this pitch
@@ -501,17 +1060,15 @@ class RenderedScore:
 	Note that this can innately handle sharps, handle chords and draw
 	extra lines if a note is too high or too low.
 	"""
-	def get_note_images(self, pitch, duration, x_pos, treble, force_flip = False):
-		#May have to return additional lines to draw certain notes
-		images = []
+	def layout_note(self, pitch, duration, x_pos, treble, force_flip = False):
+		#May have to draw additional lines for certain notes
+		ledgers = []
 		#Pitch => ie 'A4', duration => ie 1.0
-		is_sharp = pitch.find("#") != -1
-		is_pause = pitch == '-'
+		is_sharp = pitch_table.SHARPS[pitch]
+		is_pause = pitch == pitch_table.REST
 		is_flipped = False
 		if force_flip:
 			is_flipped = True
-		#Remove any sharps
-		pitch = pitch.replace("#", "")
 		duration = round(duration, 3)
 		#Adjust x-axis by 10
 		x_pos += 10
@@ -534,34 +1091,22 @@ class RenderedScore:
 		num_adj_lines = - int(pitch_adj) // int(self.treble_increment)
 		for i in range(num_adj_lines):
 			if treble:
-				images.append(Line((x_pos - 10, self.treble_begin + (i + 1) * \
-					self.treble_increment), (x_pos + 10, self.treble_begin + \
-					(i + 1) * self.treble_increment)))
+				ledgers.append((x_pos - 10, x_pos + 10, self.treble_begin + \
+					(i + 1) * self.treble_increment))
 			else:
-				images.append(Line((x_pos - 10, self.bass_begin + (i + 1) * \
-					self.bass_increment), (x_pos + 10, self.bass_begin + \
-					(i + 1) * self.bass_increment)))
+				ledgers.append((x_pos - 10, x_pos + 10, self.bass_begin + \
+					(i + 1) * self.bass_increment))
 		#Draw extra lines if note is too high
 		num_adj_lines = (int(pitch_adj) - 4 * int(self.treble_increment)) // \
 		int(self.treble_increment)
 		for i in range(num_adj_lines):
 			if treble:
-				images.append(Line((x_pos - 10, self.treble_begin - (i + 5) * \
-					self.treble_increment), (x_pos + 10, self.treble_begin - \
-					(i + 5) * self.treble_increment)))
+				ledgers.append((x_pos - 10, x_pos + 10, self.treble_begin - \
+					(i + 5) * self.treble_increment))
 			else:
-				images.append(Line((x_pos - 10, self.bass_begin - (i + 5) * \
-					self.bass_increment), (x_pos + 10, self.bass_begin - \
-					(i + 5) * self.bass_increment)))
+				ledgers.append((x_pos - 10, x_pos + 10, self.bass_begin - \
+					(i + 5) * self.bass_increment))
 		#Adjust for image
-		img_adjustments = {1.0 : [(0, -13), (0, +14), (0, 0)], \
-		2.0: [(0, -13), (0, +14), (0, -2)], \
-		3.0: [(0, -13), (0, +14), (0, -2)], \
-		4.0: [(0, 0), (0, 0), (0, -7)], \
-		1.5: [(0, -13), (0, +14), (0, 0)], \
-		0.5: [(+4, -13), (-4, +14), (0, 0)], \
-		0.75: [(+4, -13), (-4, +14), (0, 0)], \
-		0.25: [(+4, -13), (-4, +14), (0, 0)]}
 		img_adj = (0, 0)
 		if duration in img_adjustments:
 			if not is_flipped and not is_pause:
@@ -575,16 +1120,12 @@ class RenderedScore:
 		adj[0] += img_adj[0]
 		adj[1] += img_adj[1]
 		#Adjust for sharp
+		sharp = None
 		if is_sharp:
-			images.append(Text("#", (x_pos - 10, adj[1] - img_adj[1]),\
-			 font_size = 20))
+			sharp = (x_pos - 10, adj[1] - img_adj[1])
 			#adj[0] += 10
-		#Grab image and adjust
-		img_surf = self.note_imgs.get_note(duration, rest = is_pause, \
-			flip = is_flipped)
-		images.append(Image(img_surf, (x_pos + adj[0], adj[1]), \
-			from_surf = True))
-		return images
+		return NoteLayout((duration, is_pause, is_flipped), x_pos + adj[0], \
+			adj[1], tuple(ledgers), sharp)
 
 	"""
 	[pitch_adj_flip self pitch treble] adjusts a [pitch] for y position and
@@ -592,8 +1133,6 @@ class RenderedScore:
 	is True if the note is in the Treble Clef and False otherwise.
 	"""
 	def pitch_adj_flip(self, pitch, treble):
-		#Remove any sharps
-		pitch = pitch.replace("#", "")
 		adj = [0,0]
 		is_flipped = False
 		#Adjust for position
@@ -615,10 +1154,27 @@ class RenderedScore:
 		#1.0 for normal, -<sth> for rewind, +<sth> for ffwd, 0 for pause
 		self.advance_rate = new_pace
 
-	#[advance_time self fps] steps through one frame at [fps] frames
-	#per second. This causes the playback to advance according to
-	#[self.advance_rate]
-	def advance_time(self, fps):
+	"""
+	[advance_time self dt] advances the playback by [dt] seconds (the time
+	taken by the previous frame) according to [self.advance_rate]. This is
+	done in steps of [self.timestep] seconds, and time that is left over is
+	carried over to the next call. Steps stop as soon as [can_advance]
+	returns False, the remaining time (at most one frame) is also carried over.
+	"""
+	def advance_time(self, dt):
+		self.time_acc = min(self.time_acc + dt, self.max_dt)
+		while self.time_acc >= self.timestep and self.can_advance():
+			self.time_acc -= self.timestep
+			self.step(self.timestep)
+
+	#[can_advance self] returns whether the playback can advance by another
+	#step. Subclasses override this to hold the playback (ie GameScore waits
+	#for the right notes to be played).
+	def can_advance(self):
+		return self.curr_bar_idx < self.score.get_total_bars()
+
+	#[step self seconds] advances the playback by [seconds] seconds
+	def step(self, seconds):
 		#Check if completed
 		if self.curr_bar_idx >= self.score.get_total_bars():
 			return
@@ -646,7 +1202,7 @@ class RenderedScore:
 			prev_timing = self.curr_timing
 			prev_treble = curr_bar.note_at_time(self.curr_timing, True)
 			prev_bass = curr_bar.note_at_time(self.curr_timing, False)
-			self.curr_timing += float(self.advance_rate) * bpm / 60.0 / fps
+			self.curr_timing += float(self.advance_rate) * bpm / 60.0 * seconds
 			new_treble = curr_bar.note_at_time(self.curr_timing, True)
 			new_bass = curr_bar.note_at_time(self.curr_timing, False)
 			treble = curr_bar.get_treble()
@@ -710,6 +1266,39 @@ class RenderedScore:
 				self.change_timing_note_color(self.curr_timing, \
 					self.colors["dark_blue"], False)
 
+	#[seek self seconds] moves playback to [seconds] from the start of the
+	#score (at the written pace)
+	def seek(self, seconds):
+		bar, timing = self.score.get_timeline().bar_at_seconds(seconds)
+		self.seek_to(bar, timing)
+
+	#[seek_bar self bar] moves playback to the start of the bar at index [bar]
+	def seek_bar(self, bar):
+		self.seek_to(min(max(bar, 0), self.score.get_total_bars() - 1), 0.0)
+
+	"""
+	[seek_to self bar timing] moves playback to [timing] crotchets into the
+	bar at index [bar]. The notes that are playing are stopped and only the
+	page that contains [bar] is rebuilt. The notes at the new position are
+	played on the next call to [advance_time].
+	"""
+	def seek_to(self, bar, timing):
+		if self.curr_bar_idx < self.score.get_total_bars():
+			treble_pitches = self.get_curr_pitches(True)
+			bass_pitches = self.get_curr_pitches(False)
+			if self.play_notes:
+				self.player.stop_all()
+			self.on_note_stop(treble_pitches, True)
+			self.on_note_stop(bass_pitches, False)
+		self.curr_bar_idx = bar
+		self.curr_timing = timing
+		self.time_acc = 0.0
+		self.has_started = False
+		self.refresh_timings()
+		play_line_pos = self.get_note_horizontal_pos(self.curr_bar_idx, \
+			self.curr_timing) + 5
+		self.play_line.change_x(play_line_pos, play_line_pos)
+
 	#[on_note_stop self pitches treble] is called when we transition
 	#between bars or between notes. [pitches] refer to the pitches which
 	#are stopped and [treble] refers to the clef (Treble if True, Bass if False)
@@ -759,11 +1348,11 @@ class RenderedScore:
 		if treble:
 			treble_idx = curr_bar.note_at_time(timing, True)
 			for pitch in self.treble_note_imgs[bar_idx][treble_idx]:
-				pitch[-1].change_color(new_color)
+				self.change_img_color(pitch[-1], new_color)
 		else:
 			bass_idx = curr_bar.note_at_time(timing, False)
 			for pitch in self.bass_note_imgs[bar_idx][bass_idx]:
-				pitch[-1].change_color(new_color)
+				self.change_img_color(pitch[-1], new_color)
 
 	#[change_curr_pitch_color] changes the specified [pitches] to [new_color]
 	#at the current timing defined by self.curr_bar_idx and self.curr_timing
@@ -777,12 +1366,22 @@ class RenderedScore:
 		for pitch, imgs in zip(treble[treble_idx][0], \
 			self.treble_note_imgs[bar_idx][treble_idx]):
 			if pitch in pitches:
-				imgs[-1].change_color(new_color)
+				self.change_img_color(imgs[-1], new_color)
 		bass_idx = curr_bar.note_at_time(timing, False)
 		for pitch, imgs in zip(bass[bass_idx][0], \
 			self.bass_note_imgs[bar_idx][bass_idx]):
 			if pitch in pitches:
-				imgs[-1].change_color(new_color)
+				self.change_img_color(imgs[-1], new_color)
+
+	#[change_img_color self img new_color] changes the color of the note
+	#Image [img] to [new_color], keeping track of the notes that are not black
+	#since those are drawn over the rendered page
+	def change_img_color(self, img, new_color):
+		img.change_color(new_color)
+		if new_color == self.colors["black"]:
+			self.colored_imgs.discard(img)
+		else:
+			self.colored_imgs.add(img)
 
 	#[handle_click self pos] handles a click event at position [pos]
 	def handle_click(self, pos):
@@ -790,12 +1389,55 @@ class RenderedScore:
 
 	#[draw self screen] draws the elements in the score onto [screen]
 	def draw(self, screen):
+		screen.blit(self.page_surf, (0, 0))
+		#A new page surface dirties the whole page
+		self.tracker.track("page", pygame.Rect((0, 0), page_size), \
+			self.page_surf)
+		for img in self.colored_imgs:
+			img.draw(screen)
+			self.tracker.track_elt(img)
 		self.stage.draw(screen)
 
+	#[get_dirty_rects self] returns the list of Rects on the screen that
+	#changed since the previous call to [get_dirty_rects]
+	def get_dirty_rects(self):
+		return self.tracker.get_dirty_rects() + self.stage.get_dirty_rects()
+
 	#[has_quit self] queries whether this score has quitted
 	def has_quit(self):
 		return self.curr_bar_idx >= self.score.get_total_bars()
 
+#The colors that notes are drawn in, which are tinted ahead of time
+note_colors = [(0,0,0), (47, 29, 245), (14, 230, 71), (224, 9, 9)]
+
+"""
+This class holds the tinted copies of a single note image, so that notes
+can change color by swapping to a shared surface instead of recoloring
+their own copy of the image.
+"""
+class NotePalette:
+	#[__init__ self surf colors] creates a new palette for the note image
+	#[surf], tinting it in every color in [colors] ahead of time
+	def __init__(self, surf, colors = []):
+		self.surfs = {None: surf}
+		self.lock = threading.Lock()
+		for color in colors:
+			self.get(color)
+
+	#[get self color] returns the note image tinted [color], or the original
+	#image if [color] is None. Surfaces are shared and must not be drawn onto.
+	def get(self, color):
+		surf = self.surfs.get(color)
+		if surf != None:
+			return surf
+		#Colors that are not tinted ahead of time are only tinted once
+		with self.lock:
+			if color not in self.surfs:
+				surf = self.surfs[None].copy()
+				tint(surf, color)
+				self.surfs[color] = surf
+			return self.surfs[color]
+
 #This class loads all the images from file then caches them in memory
 #and returns the required image surface when requested.
 class NoteImgCache:
@@ -862,12 +1504,19 @@ class NoteImgCache:
 
 		self.notes = {dur: [to_surface(p) for p in \
 		to_flipped_arr(base_path + path)] for (dur,path) in note_path.items()}
+		self.palettes = {dur: [NotePalette(surf, note_colors) for surf in \
+		surfs] for (dur,surfs) in self.notes.items()}
 
 	#[has_note self dur] returns whether we have a corresponding note image
 	#for a note with duration [dur]
 	def has_note(self, dur):
 		return round(dur, 3) in self.notes
 
+	#[get_durations self] returns the set of note durations that we have
+	#note images for
+	def get_durations(self):
+		return set(self.notes.keys())
+
 	#[get_note self dur rest flip] returns a note surface based on the
 	#[dur] of the note and whether it is a [flip] note or a [rest] note.
 	def get_note(self, dur, rest = False, flip = False):
@@ -879,59 +1528,122 @@ class NoteImgCache:
 		else:
 			return self.notes.get(round(dur, 3), fail)[0]
 
-#This class is in charge of caching note wav files as well
-#as playing the relevant notes
+	#[get_palette self dur rest flip] returns the NotePalette of the note
+	#image returned by [get_note] with the same arguments
+	def get_palette(self, dur, rest = False, flip = False):
+		fail = [None, None, None]
+		if rest:
+			return self.palettes.get(round(dur, 3), fail)[2]
+		elif flip:
+			return self.palettes.get(round(dur, 3), fail)[1]
+		else:
+			return self.palettes.get(round(dur, 3), fail)[0]
+
+"""
+This class is in charge of loading note wav files (see SampleBank) as well as
+playing the relevant notes. Starting and stopping notes can be slow, so it is
+done by a worker thread: [play_note], [stop_note] and [stop_all] only queue a
+command (see CommandQueue) and return straight away.
+"""
 class AudioPlayer:
 	"""
-	Caches all the notes from the "sound/" directory that end in
-	.wav and adds them to the recognised pitches
+	[__init__ self sound_dir budget queue_size] recognises the notes of all
+	the .wav files in [sound_dir] (see SampleBank). Only their headers are read
+	here, their samples are memory mapped when they are prepared or played,
+	with at most [budget] bytes of samples mapped at a time. At most
+	[queue_size] commands wait for the worker thread.
 	"""
-	def __init__(self):
-		self.note_wav = {}
+	def __init__(self, sound_dir = "./sound", budget = 16 * 1024 * 1024, \
+		queue_size = 64):
+		self.bank = SampleBank(sound_dir, budget)
+		#The play objects of the playing pitches, only used by the worker
 		self.playing = {}
-		#Load all the sound files into wave objects (cached)
-		sound_dir = "./sound"
-		for file_name in os.listdir(sound_dir):
-			if file_name.endswith(".wav"):
-				ext_pos = file_name.find(".wav")
-				note_name = file_name[:ext_pos]
-				wav_obj = sa.WaveObject.from_wave_file(sound_dir + "/" + file_name)
-				self.note_wav[note_name] = wav_obj
+		self.commands = CommandQueue(queue_size)
+		self.running = True
+		self.worker = threading.Thread(target = self.run, daemon = True)
+		self.worker.start()
 
 	#Stops all notes on deletion (garbage collection)
 	def __del__(self):
 		sa.stop_all()
 
-	#[has_note self pitch] returns whether [pitch] is recognised by this
-	#player
+	#[has_note self pitch] returns whether the pitch id [pitch] is recognised
+	#by this player
 	def has_note(self, pitch):
-		if pitch == '-':
+		if pitch == pitch_table.REST:
 			return True
-		return pitch in self.note_wav
+		return self.bank.has_pitch(pitch)
+
+	#[get_pitches self] returns the set of pitch ids recognised by this player,
+	#including the rest
+	def get_pitches(self):
+		return self.bank.get_pitches() | {pitch_table.REST}
+
+	#[prepare self pitches] reads the samples of [pitches] into memory ahead of
+	#time (ie the pitches of a score or an input) so that they play promptly
+	def prepare(self, pitches):
+		self.bank.prepare(pitches)
 
 	#[play_note self pitches] plays each pitch in [pitches]. This
 	#stops and restarts a pitch that is already playing
-	#Example: player.play_note(['C4', 'E4', 'G4'])
+	#Example: player.play_note([60, 64, 67]) (C4, E4 and G4)
 	def play_note(self, pitches):
-		for pitch in pitches:
-			if pitch in self.playing:
-				self.stop_note(pitch)
-			if pitch in self.note_wav:
-				self.playing[pitch] = self.note_wav[pitch].play()
+		self.commands.put("play", tuple(pitches))
 
 	#[stop_note self pitches] stops each pitch in [pitches]
-	#Example: player.stop_note(['C4', 'E4', 'G4'])
+	#Example: player.stop_note([60, 64, 67]) (C4, E4 and G4)
 	def stop_note(self, pitches):
-		for pitch in pitches:
-			if pitch in self.playing:
-				self.playing.pop(pitch).stop()
+		self.commands.put("stop", tuple(pitches))
 
 	#[stop_all self] stops all currently playing pitches
 	def stop_all(self):
-		sa.stop_all()
-		self.playing = {}
+		#Notes that haven't started yet are stopped as well
+		self.commands.clear()
+		self.commands.put("stop_all")
+
+	#[get_metrics self] returns the metrics of the command queue (see
+	#CommandQueue.get_metrics)
+	def get_metrics(self):
+		return self.commands.get_metrics()
 
 	#[finish self] should be called when the audioplayer is no longer needed
 	def finish(self):
+		self.running = False
+		self.commands.clear()
+		self.commands.put("stop_all")
+		if self.worker.is_alive():
+			self.worker.join()
 		sa.stop_all()
-		self.playing = {}
\ No newline at end of file
+		self.playing = {}
+
+	#[run self] carries out the queued commands until [finish] is called.
+	#This runs in the worker thread.
+	def run(self):
+		while self.running:
+			self.commands.wait(0.5)
+			for command, pitches, queued in self.commands.get_all():
+				if command == "play":
+					self.start_notes(pitches)
+				elif command == "stop":
+					self.stop_notes(pitches)
+				else:
+					sa.stop_all()
+					self.playing = {}
+				self.commands.done(queued)
+
+	#[start_notes self pitches] plays each pitch in [pitches], restarting
+	#any that are already playing
+	def start_notes(self, pitches):
+		for pitch in pitches:
+			if pitch in self.playing:
+				self.stop_notes([pitch])
+			if self.bank.has_pitch(pitch):
+				info = self.bank.get_info(pitch)
+				self.playing[pitch] = sa.play_buffer(self.bank.get(pitch), \
+					info.channels, info.sampwidth, info.rate)
+
+	#[stop_notes self pitches] stops each pitch in [pitches]
+	def stop_notes(self, pitches):
+		for pitch in pitches:
+			if pitch in self.playing:
+				self.playing.pop(pitch).stop()
@@ -1,5 +1,6 @@
 import pygame
 from components import Btn, ImageBtn, Text, Line, Image, Stage
+import pitch_table
 
 #This enables the user to play the game like a normal piano
 #This simply implements the UI elem required by components/Screen
@@ -9,6 +10,8 @@ class PianoMode:
 		self.player = player
 		self.key_input = key_input
 		self.playable_pitches = key_input.get_playable_pitches()
+		#Keys pressed before this screen started (ie in the menus) aren't played
+		key_input.get_events()
 		#Set of currently played pitches
 		self.played_pitches = set()
 		#Various parameters
@@ -25,12 +28,12 @@ class PianoMode:
 	def on_exit_btn_click(self, btn, pos):
 		self.quit = True
 
-	def advance_time(self, fps):
+	def advance_time(self, dt):
 		#Consume updates from input
 		#print(self.key_input)
 		self.key_input.poll()
-		updates = self.key_input.get_updates()
-		for pitch, is_pressed in updates.items():
+		events = self.key_input.get_events()
+		for pitch, is_pressed, _ in events:
 			#print("Update: {}, {}".format(pitch, is_pressed))
 			if is_pressed:
 				self.played_pitches.add(pitch)
@@ -38,13 +41,18 @@ class PianoMode:
 			elif pitch in self.played_pitches:
 				self.played_pitches.remove(pitch)
 				self.player.stop_note([pitch])
-		if (len(updates) > 0):
+		if (len(events) > 0):
 			notes_played = ""
 			for pitch in self.played_pitches:
-				notes_played += pitch
+				notes_played += pitch_table.to_name(pitch)
 				notes_played += " "
 			self.notes_played_txt.text = notes_played
 
+	#Notes only change when keys are pressed, which wakes the main loop if the
+	#input is event driven
+	def is_idle(self):
+		return self.key_input.is_event_driven()
+
 	def bind_screen(self, parent_screen):
 		self.parent_screen = parent_screen
 
@@ -52,6 +60,9 @@ class PianoMode:
 		#print("Drawing")
 		self.stage.draw(screen)
 
+	def get_dirty_rects(self):
+		return self.stage.get_dirty_rects()
+
 	def handle_click(self, pos):
 		self.stage.handle_click(pos)
 
@@ -0,0 +1,54 @@
+#Pitches are passed around as small integers (MIDI note numbers, ie 60 for
+#'C4') and only converted to names (ie 'C#4') for display and file I/O.
+
+#The id of a rest ('-' in score files)
+REST = -1
+
+#Semitones of each natural note above C
+note_semitones = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+#Names of the 12 semitones, using sharps instead of flats
+semitone_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', \
+	'A#', 'B']
+
+#Tables shared by every module, built once below
+#Name of every pitch id
+NAMES = {REST: '-'}
+#Id of every pitch name
+IDS = {'-': REST}
+#Whether every pitch id is a sharp
+SHARPS = {REST: False}
+#The natural pitch id that every pitch id is drawn on (ie 'C#4' => 'C4')
+NATURALS = {REST: REST}
+
+for _id in range(128):
+	_name = semitone_names[_id % 12] + str(_id // 12 - 1)
+	NAMES[_id] = _name
+	IDS[_name] = _id
+	SHARPS[_id] = _name.find("#") != -1
+	NATURALS[_id] = _id - 1 if SHARPS[_id] else _id
+
+#[to_id name] returns the pitch id of the pitch [name] (ie 'C#4'), or None
+#if [name] is not a valid pitch
+def to_id(name):
+	return IDS.get(name)
+
+#[to_ids names] returns a tuple of the pitch ids of each name in [names]
+def to_ids(names):
+	return tuple(IDS.get(name) for name in names)
+
+#[to_name pitch] returns the name (ie 'C#4') of the pitch id [pitch]
+def to_name(pitch):
+	return NAMES[pitch]
+
+#[to_names pitches] returns a list of the names of each id in [pitches]
+def to_names(pitches):
+	return [NAMES[pitch] for pitch in pitches]
+
+#[is_sharp pitch] returns whether the pitch id [pitch] is a sharp
+def is_sharp(pitch):
+	return SHARPS[pitch]
+
+#[natural pitch] returns the id of the natural pitch that the pitch id
+#[pitch] is drawn on (ie 'C#4' => 'C4')
+def natural(pitch):
+	return NATURALS[pitch]
@@ -0,0 +1,209 @@
+"""
+Preprocesses the note samples into a single bank file that SampleBank maps at
+startup instead of the .wav files.
+
+Every sample in the source directory (.wav, or .mp3 if ffmpeg is installed)
+is decoded, converted to one sample rate and number of channels, trimmed so
+that it starts at the onset of the note, faded in over the few samples kept
+before the onset and normalised to the same peak level. Samples are processed
+in parallel, one process per core. The bank records the hash of every source
+file, samples whose source hasn't changed are copied from the previous bank
+instead of being processed again, and SampleBank ignores the bank once any
+source changes. With --every n only every nth semitone is kept, SampleBank
+synthesises the rest.
+
+To use
+python preprocess_samples.py [--source ./sound] [--out ./sound/samples.bank]
+	[--rate 44100] [--channels 2] [--peak 0.3] [--every 1] [--processes N]
+	[--force]
+"""
+import os
+import sys
+import time
+import wave
+import argparse
+import subprocess
+from multiprocessing import Pool
+import numpy as np
+import score_cache
+import pitch_table
+import sample_bank
+
+#Samples quieter than this fraction of the peak are silence before the onset
+onset_threshold = 0.01
+#Time (in seconds) kept before the onset so that the attack isn't clipped
+pre_roll = 0.002
+
+"""
+[decode path rate channels] returns the samples of the .wav or .mp3 file at
+[path] as a float array of shape (frames, channels) in [-1, 1], converted to
+[rate] and [channels]. Returns None if the file can't be decoded.
+"""
+def decode(path, rate, channels):
+	if path.endswith(".mp3"):
+		#ffmpeg converts the format as well
+		try:
+			data = subprocess.run(["ffmpeg", "-v", "error", "-i", path, "-f", \
+				"s16le", "-ac", str(channels), "-ar", str(rate), "-"], \
+				stdout = subprocess.PIPE, check = True).stdout
+		except (OSError, subprocess.CalledProcessError):
+			return None
+		return np.frombuffer(data, dtype = "<i2").reshape(-1, channels) / 32768.0
+	with wave.open(path, 'rb') as file:
+		width = file.getsampwidth()
+		file_rate = file.getframerate()
+		file_channels = file.getnchannels()
+		data = file.readframes(file.getnframes())
+	if width == 1:
+		samples = (np.frombuffer(data, dtype = "u1") - 128.0) / 128.0
+	elif width == 2:
+		samples = np.frombuffer(data, dtype = "<i2") / 32768.0
+	elif width == 3:
+		#Pad every sample to 32 bits
+		raw = np.frombuffer(data, dtype = "u1").reshape(-1, 3)
+		padded = np.zeros((len(raw), 4), dtype = "u1")
+		padded[:, 1:] = raw
+		samples = padded.view("<i4").reshape(-1) / 2147483648.0
+	elif width == 4:
+		samples = np.frombuffer(data, dtype = "<i4") / 2147483648.0
+	else:
+		return None
+	samples = samples.reshape(-1, file_channels)
+	if file_channels != channels:
+		#Mix down to mono, then copy to every channel
+		samples = np.repeat(samples.mean(axis = 1)[:, None], channels, axis = 1)
+	if file_rate != rate:
+		frames = int(len(samples) * rate / file_rate)
+		times = np.arange(frames) * (file_rate / rate)
+		samples = np.stack([np.interp(times, np.arange(len(samples)), \
+			samples[:, channel]) for channel in range(channels)], axis = 1)
+	return samples
+
+"""
+[trim_onset samples rate] returns [samples] without the silence before the
+onset of the note, keeping [pre_roll] seconds before it which are faded in
+"""
+def trim_onset(samples, rate):
+	levels = np.abs(samples).max(axis = 1)
+	loud = np.nonzero(levels >= levels.max() * onset_threshold)[0]
+	if len(loud) == 0:
+		return samples
+	start = max(0, loud[0] - int(pre_roll * rate))
+	samples = samples[start:].copy()
+	fade = loud[0] - start
+	if fade > 0:
+		samples[:fade] *= np.linspace(0.0, 1.0, fade, endpoint = False)[:, None]
+	return samples
+
+"""
+[process job] processes the sample described by the tuple [job] of (path,
+rate, channels, peak) and returns a tuple of (pitch name, 16 bit samples as
+bytes, milliseconds trimmed, gain applied), or a tuple of (pitch name, None,
+0, 0) if it couldn't be decoded
+"""
+def process(job):
+	path, rate, channels, peak = job
+	name = os.path.splitext(os.path.basename(path))[0]
+	samples = decode(path, rate, channels)
+	if samples is None or len(samples) == 0:
+		return (name, None, 0, 0)
+	frames = len(samples)
+	samples = trim_onset(samples, rate)
+	trimmed = (frames - len(samples)) * 1000.0 / rate
+	loudest = np.abs(samples).max()
+	gain = peak / loudest if loudest > 0 else 1.0
+	samples = np.clip(np.round(samples * gain * 32767), -32768, 32767)
+	return (name, samples.astype("<i2").tobytes(), trimmed, gain)
+
+"""
+[read_previous path header] returns a dictionary of the samples (by pitch
+name) in the previous bank at [path], which has the header [header]
+"""
+def read_previous(path, header):
+	notes = {}
+	with open(path, 'rb') as file:
+		for name, (offset, length) in header["notes"].items():
+			file.seek(offset)
+			notes[name] = file.read(length)
+	return notes
+
+def main():
+	parser = argparse.ArgumentParser(description = "Preprocesses the note \
+		samples into a single bank file")
+	parser.add_argument("--source", default = "./sound", help = "directory \
+		of the samples, named after their pitch (ie C4.wav)")
+	parser.add_argument("--out", default = os.path.join("./sound", \
+		sample_bank.BANK_FILE), help = "bank file to write, which SampleBank \
+		only reads from the sound directory")
+	parser.add_argument("--rate", type = int, default = 44100)
+	parser.add_argument("--channels", type = int, default = 2)
+	parser.add_argument("--peak", type = float, default = 0.3, help = \
+		"peak level of every sample, leaving headroom for chords")
+	parser.add_argument("--every", type = int, default = 1, help = "only \
+		keep every nth semitone from the lowest sample, the rest are \
+		synthesised by SampleBank")
+	parser.add_argument("--processes", type = int, default = None)
+	parser.add_argument("--force", action = "store_true", help = \
+		"process every sample even if its source is unchanged")
+	args = parser.parse_args()
+
+	start = time.perf_counter()
+	sources = {}
+	for file_name in sorted(os.listdir(args.source)):
+		if sample_bank.is_source(file_name):
+			path = os.path.join(args.source, file_name)
+			mtime, size = score_cache.source_key(path)
+			sources[file_name] = (mtime, size, score_cache.file_hash(path))
+	settings = {"source_dir": args.source, "rate": args.rate, \
+		"channels": args.channels, "sampwidth": 2, "peak": args.peak}
+	#Every source is recorded so that the bank goes out of date when any of
+	#them change, but only the kept ones are processed
+	names = [os.path.splitext(file_name)[0] for file_name in sources]
+	lowest = min([pitch_table.to_id(name) for name in names] or [0])
+	kept = {file_name for file_name, name in zip(sources, names) if \
+		(pitch_table.to_id(name) - lowest) % args.every == 0}
+	#Reuse the samples of sources whose hash is unchanged
+	previous = {}
+	header = sample_bank.read_bank_header(args.out)
+	if header != None and not args.force and all(header.get(key) == value \
+		for key, value in settings.items()):
+		hashes = {file_name: sha for file_name, (_, _, sha) in \
+			header["sources"].items()}
+		notes = read_previous(args.out, header)
+		for file_name in kept:
+			name = os.path.splitext(file_name)[0]
+			if hashes.get(file_name) == sources[file_name][2] and \
+				name in notes:
+				previous[name] = notes[name]
+	jobs = [(os.path.join(args.source, file_name), args.rate, args.channels, \
+		args.peak) for file_name in sorted(kept) if \
+		os.path.splitext(file_name)[0] not in previous]
+	processes = min(args.processes or os.cpu_count() or 1, max(len(jobs), 1))
+	if processes <= 1:
+		results = [process(job) for job in jobs]
+	else:
+		with Pool(processes) as pool:
+			results = pool.map(process, jobs)
+
+	notes = dict(previous)
+	for name, samples, trimmed, gain in results:
+		if samples == None:
+			print("  {} could not be decoded, skipping".format(name))
+			continue
+		print("  {:4} trimmed {:6.1f}ms gain {:5.2f}".format(name, trimmed, gain))
+		notes[name] = samples
+	if len(notes) == 0:
+		print("No samples found in {}".format(args.source))
+		sys.exit(1)
+	#Names with the same pitch (ie A#4 and Bb4) keep the first one
+	by_pitch = {}
+	for name in sorted(notes):
+		by_pitch.setdefault(pitch_table.to_id(name), name)
+	ordered = [(name, notes[name]) for _, name in sorted(by_pitch.items())]
+	sample_bank.write_bank(args.out, dict(settings, sources = sources), ordered)
+	print("Wrote {} samples ({} reused, {:.1f}MB) to {} in {:.1f}s using {} \
+process(es)".format(len(ordered), len(previous), os.path.getsize(args.out) / \
+		(1024 * 1024), args.out, time.perf_counter() - start, processes))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,195 @@
+import json
+import time
+import pygame
+from collections import deque
+from components import get_font, font_lock
+
+#The phases of a frame of the main loop, in the order they happen
+phases = ["input", "advance_time", "events", "draw", "flip", "tick"]
+
+"""
+This class times every phase of every frame of the main loop (see [phases]).
+Each frame is attributed to the mode (the class of the active Screen's
+element) that was running. The most recent frames are kept so that a
+histogram of each phase can be written to a file on exit, and an overlay
+with the FPS and the slowest phase can be drawn on the screen. All methods
+return immediately when the profiler is disabled.
+"""
+class FrameProfiler:
+	"""
+	[__init__ self fps enabled window] creates a new profiler for a main loop
+	that runs at [fps] frames per second, which only records anything if
+	[enabled] is True. The last [window] frames are kept for the histogram.
+	"""
+	def __init__(self, fps, enabled = False, window = 1800):
+		self.enabled = enabled
+		self.budget = 1.0 / fps
+		self.frames = deque(maxlen = window)
+		self.show_overlay = False
+		#Time spent in the current frame, by phase
+		self.curr = dict.fromkeys(phases, 0.0)
+		#Time spent in nested phases (ie input polled during advance_time)
+		#since the last call to [mark]
+		self.nested = 0.0
+		self.last_mark = None
+		#Overlay text and when it was last updated
+		self.overlay_surf = None
+		self.overlay_rect = pygame.Rect(0, 0, 0, 0)
+		self.overlay_time = 0.0
+		#Whether the overlay region has to be updated on the display
+		self.overlay_dirty = False
+
+	#[begin_frame self] starts timing a new frame
+	def begin_frame(self):
+		if not self.enabled:
+			return
+		self.curr = dict.fromkeys(phases, 0.0)
+		self.nested = 0.0
+		self.last_mark = time.perf_counter()
+
+	"""
+	[mark self phase] attributes the time since the previous mark (or the
+	start of the frame) to [phase], excluding any time attributed to nested
+	phases in between
+	"""
+	def mark(self, phase):
+		if not self.enabled:
+			return
+		now = time.perf_counter()
+		self.curr[phase] += now - self.last_mark - self.nested
+		self.nested = 0.0
+		self.last_mark = now
+
+	"""
+	[wrap self phase fn] returns a function that calls [fn] and attributes the
+	time it takes to [phase], which can be used to time calls that happen in
+	the middle of another phase (ie polling the input in advance_time)
+	"""
+	def wrap(self, phase, fn):
+		def wrapper(*args, **kwargs):
+			if not self.enabled:
+				return fn(*args, **kwargs)
+			start = time.perf_counter()
+			result = fn(*args, **kwargs)
+			elapsed = time.perf_counter() - start
+			self.curr[phase] += elapsed
+			self.nested += elapsed
+			return result
+		return wrapper
+
+	#[end_frame self screen] finishes timing the current frame, which was
+	#spent in the mode of the Screen [screen] (see Screen.get_mode)
+	def end_frame(self, screen):
+		if not self.enabled:
+			return
+		self.frames.append((screen.get_mode(), self.curr))
+
+	#[toggle_overlay self] shows the overlay if it is hidden and hides it
+	#otherwise. This does nothing if the profiler is disabled.
+	def toggle_overlay(self):
+		if not self.enabled:
+			return
+		self.show_overlay = not self.show_overlay
+		self.overlay_time = 0.0
+		self.overlay_dirty = True
+
+	"""
+	[get_stats self seconds] returns a tuple of the frames per second and the
+	name and average time of the slowest phase over the last [seconds] of
+	frames
+	"""
+	def get_stats(self, seconds):
+		totals = dict.fromkeys(phases, 0.0)
+		elapsed = 0.0
+		count = 0
+		for _, frame in reversed(self.frames):
+			if elapsed >= seconds:
+				break
+			for phase, value in frame.items():
+				totals[phase] += value
+			elapsed += sum(frame.values())
+			count += 1
+		if count == 0:
+			return (0.0, None, 0.0)
+		#Waiting in clock.tick is slack, not work
+		worst = max([phase for phase in phases if phase != "tick"], \
+			key = lambda phase: totals[phase])
+		return (count / elapsed, worst, totals[worst] / count)
+
+	"""
+	[draw self screen] draws the overlay in the top left corner of [screen]
+	if it is shown. Its text is only updated a few times per second so that
+	it stays readable.
+	"""
+	def draw(self, screen):
+		if not self.enabled or not self.show_overlay:
+			return
+		now = time.perf_counter()
+		if now - self.overlay_time >= 0.5:
+			self.overlay_time = now
+			fps, worst, worst_time = self.get_stats(1.0)
+			text = "{:.1f} fps".format(fps)
+			if worst != None:
+				text += " {} {:.1f}ms".format(worst, worst_time * 1000)
+			with font_lock:
+				self.overlay_surf = get_font(16).render(text, True, \
+					(255,255,255), (0,0,0))
+			#Clear the previous text as well
+			self.overlay_rect = self.overlay_rect.union( \
+				self.overlay_surf.get_rect())
+			self.overlay_dirty = True
+		screen.blit(self.overlay_surf, (0, 0))
+
+	"""
+	[get_dirty_rects self] returns the list of Rects on the screen that the
+	overlay changed since the previous call
+	"""
+	def get_dirty_rects(self):
+		if not self.enabled:
+			return []
+		#The overlay is drawn over the screen every frame, so it also has to
+		#be updated whenever the screen below it is
+		if self.show_overlay or self.overlay_dirty:
+			self.overlay_dirty = False
+			rect = self.overlay_rect
+			if not self.show_overlay:
+				self.overlay_rect = pygame.Rect(0, 0, 0, 0)
+			return [rect]
+		return []
+
+	"""
+	[get_histogram self] returns a dictionary of the recorded frames by mode,
+	with the number of frames, the number of frames over budget and a
+	histogram of every phase (the number of frames by whole milliseconds)
+	"""
+	def get_histogram(self):
+		modes = {}
+		for mode, frame in self.frames:
+			if mode not in modes:
+				modes[mode] = {"frames": 0, "over_budget": 0, \
+					"phases": {phase: {} for phase in phases + ["work"]}}
+			stats = modes[mode]
+			stats["frames"] += 1
+			work = sum(frame.values()) - frame["tick"]
+			if work > self.budget:
+				stats["over_budget"] += 1
+			for phase, value in list(frame.items()) + [("work", work)]:
+				bucket = int(value * 1000)
+				histogram = stats["phases"][phase]
+				histogram[bucket] = histogram.get(bucket, 0) + 1
+		return modes
+
+	"""
+	[dump self file_name extra] writes the histogram (see [get_histogram]) of
+	the recorded frames to [file_name] as JSON, along with the dictionary
+	[extra] of other measurements (ie the audio metrics), if the profiler is
+	enabled
+	"""
+	def dump(self, file_name, extra = None):
+		if not self.enabled:
+			return
+		with open(file_name, 'w') as file:
+			json.dump(dict(extra or {}, budget_ms = round(self.budget * 1000, \
+				3), modes = self.get_histogram()), file, indent = 2, \
+				sort_keys = True)
+			file.write("\n")
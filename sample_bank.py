@@ -0,0 +1,334 @@
+import os
+import mmap
+import pickle
+import struct
+import threading
+from collections import OrderedDict, namedtuple
+import score_cache
+import pitch_table
+#Missing pitches are only synthesised if numpy is installed
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#The preprocessed samples written by preprocess_samples.py live in the sound
+#directory under this name
+BANK_FILE = "samples.bank"
+#Bump this whenever the layout of the bank file changes
+BANK_VERSION = 1
+#Marks the start of every bank file so that stray files are rejected early
+BANK_MAGIC = b"PGSB"
+
+#Where the samples of a .wav file are and how they are stored. [offset] and
+#[length] are the position and size (in bytes) of the data chunk in the file.
+SampleInfo = namedtuple("SampleInfo", ["path", "offset", "length", \
+	"channels", "sampwidth", "rate"])
+
+#The furthest (in semitones) a sample is shifted to synthesise a pitch
+MAX_SHIFT = 12
+#The playback rate that shifts a sample by each number of semitones
+pitch_ratios = {shift: 2 ** (shift / 12.0) for shift in \
+	range(-MAX_SHIFT, MAX_SHIFT + 1)}
+
+#WAVE_FORMAT_PCM and WAVE_FORMAT_EXTENSIBLE
+pcm_formats = {0x0001, 0xFFFE}
+
+"""
+[read_wav_header path] returns the SampleInfo of the PCM .wav file at
+[path], reading only its headers, or None if it isn't a PCM .wav file
+"""
+def read_wav_header(path):
+	size = os.path.getsize(path)
+	fmt = None
+	with open(path, 'rb') as file:
+		riff = file.read(12)
+		if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+			return None
+		pos = 12
+		while pos + 8 <= size:
+			file.seek(pos)
+			chunk_id, chunk_size = struct.unpack("<4sI", file.read(8))
+			pos += 8
+			if chunk_id == b"fmt " and chunk_size >= 16:
+				fmt = struct.unpack("<HHIIHH", file.read(16))
+			elif chunk_id == b"data":
+				if fmt == None or fmt[0] not in pcm_formats:
+					return None
+				_, channels, rate, _, block_align, bits = fmt
+				#Some files claim more data than they have
+				length = min(chunk_size, size - pos)
+				length -= length % block_align
+				return SampleInfo(path, pos, length, channels, bits // 8, rate)
+			#Chunks are padded to an even size
+			pos += chunk_size + (chunk_size & 1)
+	return None
+
+"""
+[write_bank path header notes] writes a bank file to [path]. [header] is a
+dictionary that is stored as is, and [notes] is a list of (pitch name, samples)
+where samples are bytes of PCM in the format given by the "channels",
+"sampwidth" and "rate" of [header]. The samples are stored one after another
+(aligned to the page size) so that the whole file can be mapped at once.
+"""
+def write_bank(path, header, notes):
+	header = dict(header, version = BANK_VERSION, notes = {})
+	#Offsets are from the start of the samples, which follow the header
+	offset = 0
+	for name, samples in notes:
+		header["notes"][name] = (offset, len(samples))
+		offset += len(samples)
+		offset += -offset % mmap.PAGESIZE
+	meta = pickle.dumps(header, protocol = pickle.HIGHEST_PROTOCOL)
+	start = data_start(len(meta))
+	#Write to a temporary file first so a crash never leaves a half written
+	#bank behind
+	tmp_path = path + ".tmp"
+	with open(tmp_path, 'wb') as file:
+		file.write(BANK_MAGIC)
+		file.write(struct.pack("<I", len(meta)))
+		file.write(meta)
+		for name, samples in notes:
+			file.seek(start + header["notes"][name][0])
+			file.write(samples)
+	os.replace(tmp_path, path)
+
+#[data_start length] returns the offset of the samples in a bank file with a
+#header of [length] bytes, which is the start of the next page
+def data_start(length):
+	start = len(BANK_MAGIC) + 4 + length
+	return start + (-start % mmap.PAGESIZE)
+
+"""
+[read_bank_header path] returns the header (a dictionary, see [write_bank])
+of the bank file at [path] with the offsets of the samples from the start of
+the file, or None if there is no valid bank file there
+"""
+def read_bank_header(path):
+	try:
+		with open(path, 'rb') as file:
+			if file.read(len(BANK_MAGIC)) != BANK_MAGIC:
+				return None
+			length, = struct.unpack("<I", file.read(4))
+			header = pickle.loads(file.read(length))
+	except (OSError, EOFError, struct.error, pickle.UnpicklingError, \
+		AttributeError, ImportError):
+		return None
+	if not isinstance(header, dict) or header.get("version") != BANK_VERSION:
+		return None
+	start = data_start(length)
+	header["notes"] = {name: (start + offset, size) for \
+		name, (offset, size) in header["notes"].items()}
+	return header
+
+"""
+[is_fresh header] returns whether the bank with [header] was made from the
+current source files, which must be the same files with the same contents.
+Like score caches, sources whose mtime or size changed are hashed again.
+"""
+def is_fresh(header):
+	source_dir = header["source_dir"]
+	try:
+		file_names = {file_name for file_name in os.listdir(source_dir) \
+			if is_source(file_name)}
+	except OSError:
+		return False
+	if file_names != set(header["sources"]):
+		return False
+	for file_name, (mtime, size, sha) in header["sources"].items():
+		path = os.path.join(source_dir, file_name)
+		if score_cache.source_key(path) == (mtime, size):
+			continue
+		if os.path.getsize(path) != size or score_cache.file_hash(path) != sha:
+			return False
+	return True
+
+#[is_source file_name] returns whether [file_name] is a sample that can be
+#preprocessed into a bank
+def is_source(file_name):
+	name, ext = os.path.splitext(file_name)
+	return ext in (".wav", ".mp3") and pitch_table.to_id(name) != None
+
+"""
+[resample samples channels ratio] returns the 16 bit [samples] (bytes like)
+with [channels] channels played back [ratio] times faster, which shifts their
+pitch by the same ratio. Uses linear interpolation.
+"""
+def resample(samples, channels, ratio):
+	src = np.frombuffer(samples, dtype = "<i2").reshape(-1, channels)
+	frames = int((len(src) - 1) / ratio) + 1
+	positions = np.arange(frames) * ratio
+	before = positions.astype(np.int64)
+	after = np.minimum(before + 1, len(src) - 1)
+	frac = (positions - before)[:, None]
+	out = src[before] * (1.0 - frac) + src[after] * frac
+	return np.round(out).astype("<i2").tobytes()
+
+"""
+This class indexes the samples in a directory by pitch, reading only their
+headers, and memory maps them when they are needed. The samples are read from
+the bank file written by preprocess_samples.py if it is up to date, and from
+the .wav files otherwise. The pages of the mapped samples are only read from
+disk when they are played or paged in by [prepare]. At most [budget] bytes of
+samples are kept mapped, the least recently used samples are unmapped to stay
+within it.
+
+Pitches without a sample of their own are synthesised (if numpy is installed)
+by resampling the nearest 16 bit sample that is at most [max_shift] semitones
+away. They are synthesised the first time they are needed and kept within the
+budget like mapped samples.
+"""
+class SampleBank:
+	"""
+	[__init__ self sound_dir budget max_shift] indexes the samples in
+	[sound_dir] (the bank file, or every .wav file named after a pitch, ie
+	C4.wav), keeping at most [budget] bytes of samples mapped at a time.
+	Missing pitches up to [max_shift] semitones from a sample are synthesised.
+	"""
+	def __init__(self, sound_dir = "./sound", budget = 16 * 1024 * 1024, \
+		max_shift = MAX_SHIFT):
+		self.budget = budget
+		self.infos = {}
+		bank_path = os.path.join(sound_dir, BANK_FILE)
+		header = read_bank_header(bank_path)
+		if header != None and is_fresh(header):
+			for name, (offset, length) in header["notes"].items():
+				self.infos[pitch_table.to_id(name)] = SampleInfo(bank_path, \
+					offset, length, header["channels"], header["sampwidth"], \
+					header["rate"])
+		else:
+			if header != None:
+				print("{} is out of date, run preprocess_samples.py".format( \
+					bank_path))
+			self.index_wavs(sound_dir)
+		#The recorded pitch and shift (in semitones) of every synthesised pitch
+		self.shifts = {}
+		if np != None:
+			self.find_shifts(min(max_shift, MAX_SHIFT))
+		#Mapped samples by pitch id, from least to most recently used
+		self.mapped = OrderedDict()
+		self.mapped_bytes = 0
+		#Samples are mapped from both the main thread and the audio thread
+		self.lock = threading.RLock()
+
+	#[index_wavs self sound_dir] indexes the .wav files in [sound_dir] that
+	#are named after a pitch
+	def index_wavs(self, sound_dir):
+		for file_name in os.listdir(sound_dir):
+			if not file_name.endswith(".wav"):
+				continue
+			pitch = pitch_table.to_id(file_name[:file_name.find(".wav")])
+			if pitch == None:
+				continue
+			info = read_wav_header(os.path.join(sound_dir, file_name))
+			if info != None:
+				self.infos[pitch] = info
+
+	"""
+	[find_shifts self max_shift] finds the nearest 16 bit sample (the lower one
+	on a tie) to every pitch without a sample, up to [max_shift] semitones
+	away, and indexes the pitch as a synthesised sample
+	"""
+	def find_shifts(self, max_shift):
+		recorded = sorted(pitch for pitch, info in self.infos.items() \
+			if info.sampwidth == 2)
+		if len(recorded) == 0:
+			return
+		for pitch in range(128):
+			if pitch in self.infos:
+				continue
+			nearest = min(recorded, key = lambda source: \
+				(abs(pitch - source), source))
+			shift = pitch - nearest
+			if abs(shift) > max_shift:
+				continue
+			info = self.infos[nearest]
+			frame_size = info.channels * info.sampwidth
+			frames = int((info.length // frame_size - 1) / \
+				pitch_ratios[shift]) + 1
+			self.shifts[pitch] = (nearest, shift)
+			self.infos[pitch] = info._replace(path = None, offset = None, \
+				length = frames * frame_size)
+
+	#[has_pitch self pitch] returns whether there is a sample for [pitch],
+	#recorded or synthesised
+	def has_pitch(self, pitch):
+		return pitch in self.infos
+
+	#[get_pitches self] returns the set of pitch ids that have a sample,
+	#recorded or synthesised
+	def get_pitches(self):
+		return set(self.infos.keys())
+
+	#[get_info self pitch] returns the SampleInfo of [pitch]. The samples of a
+	#synthesised pitch aren't in a file, so their path and offset are None.
+	def get_info(self, pitch):
+		return self.infos[pitch]
+
+	"""
+	[get self pitch] returns a memoryview of the samples of [pitch], mapping
+	(or synthesising) them if they aren't mapped yet. The view stays valid
+	after the samples are evicted from the bank.
+	"""
+	def get(self, pitch):
+		with self.lock:
+			if pitch in self.mapped:
+				self.mapped.move_to_end(pitch)
+				return self.mapped[pitch][1]
+			info = self.infos[pitch]
+			if pitch in self.shifts:
+				source, shift = self.shifts[pitch]
+				view = memoryview(resample(self.get(source), info.channels, \
+					pitch_ratios[shift]))
+				self.mapped[pitch] = (None, view)
+				self.mapped_bytes += info.length
+				self.evict()
+				return view
+			#Only map the pages that hold the samples
+			start = info.offset - info.offset % mmap.ALLOCATIONGRANULARITY
+			with open(info.path, 'rb') as file:
+				mapping = mmap.mmap(file.fileno(), info.offset - start + \
+					info.length, access = mmap.ACCESS_READ, offset = start)
+			view = memoryview(mapping)[info.offset - start:]
+			self.mapped[pitch] = (mapping, view)
+			self.mapped_bytes += info.length
+			self.evict()
+			return view
+
+	"""
+	[prepare self pitches] maps (or synthesises) the samples of every pitch in
+	[pitches] that has a sample and reads them into memory, so that playing
+	them doesn't wait for the disk. Pitches that don't fit in the budget are
+	left out.
+	"""
+	def prepare(self, pitches):
+		total = 0
+		for pitch in sorted(pitches):
+			if pitch not in self.infos:
+				continue
+			total += self.infos[pitch].length
+			if total > self.budget:
+				break
+			view = self.get(pitch)
+			#Touch every page
+			for i in range(0, len(view), mmap.PAGESIZE):
+				view[i]
+
+	#[evict self] unmaps the least recently used samples until the mapped
+	#samples fit in the budget. The most recently used sample is always kept.
+	def evict(self):
+		while self.mapped_bytes > self.budget and len(self.mapped) > 1:
+			#Samples that are still playing are unmapped once they finish
+			pitch, _ = self.mapped.popitem(last = False)
+			self.mapped_bytes -= self.infos[pitch].length
+
+	#[is_mapped self pitch] returns whether the samples of [pitch] are mapped
+	#(or synthesised) and within the budget
+	def is_mapped(self, pitch):
+		with self.lock:
+			return pitch in self.mapped
+
+	#[get_mapped_bytes self] returns the number of bytes of samples mapped
+	def get_mapped_bytes(self):
+		with self.lock:
+			return self.mapped_bytes
@@ -0,0 +1,82 @@
+import os
+import pickle
+import hashlib
+
+#Compiled score caches live next to their source file with this extension
+CACHE_EXT = ".cache"
+#Bump this whenever the layout of the cached payload or the checks on scores
+#change
+CACHE_VERSION = 3
+#Marks the start of every cache file so that stray files are rejected early
+CACHE_MAGIC = b"PGSC"
+
+#[cache_path file_name] returns the path of the compiled cache that belongs
+#to the score file at [file_name]
+def cache_path(file_name):
+	return file_name + CACHE_EXT
+
+#[source_key file_name] returns a tuple (mtime, size) of the score file at
+#[file_name] which is used to cheaply check whether a cache is still fresh
+def source_key(file_name):
+	stat = os.stat(file_name)
+	return (stat.st_mtime_ns, stat.st_size)
+
+#[file_hash file_name] returns the sha1 hex digest of the file at [file_name]
+def file_hash(file_name):
+	sha = hashlib.sha1()
+	with open(file_name, 'rb') as file:
+		for chunk in iter(lambda: file.read(65536), b""):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+"""
+[load file_name] returns the cached payload (a dictionary) of the score file
+at [file_name] if a compiled cache exists and is still fresh, and None
+otherwise. The cache is fresh if the mtime and size of the source file are
+unchanged, or if they changed but the contents hash to the same value (ie
+the file was only touched or copied). In the latter case the cache is
+rewritten with the new mtime so that we don't rehash on the next boot.
+"""
+def load(file_name):
+	try:
+		mtime, size = source_key(file_name)
+		with open(cache_path(file_name), 'rb') as file:
+			if file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+				return None
+			payload = pickle.load(file)
+	except (OSError, EOFError, pickle.UnpicklingError, \
+		AttributeError, ImportError):
+		return None
+	if not isinstance(payload, dict) or \
+	payload.get("version") != CACHE_VERSION:
+		return None
+	if payload["mtime"] == mtime and payload["size"] == size:
+		return payload
+	if payload["size"] != size or payload["hash"] != file_hash(file_name):
+		return None
+	#Contents are unchanged, only refresh the key
+	payload["mtime"] = mtime
+	save(file_name, payload)
+	return payload
+
+"""
+[save file_name payload] writes [payload] (a dictionary) as the compiled
+cache of the score file at [file_name], keyed on the current mtime, size and
+hash of that file. Failures (ie a read only filesystem) are ignored since
+the cache is only an optimisation.
+"""
+def save(file_name, payload):
+	try:
+		if "hash" not in payload:
+			payload["mtime"], payload["size"] = source_key(file_name)
+			payload["hash"] = file_hash(file_name)
+		payload["version"] = CACHE_VERSION
+		#Write to a temporary file first so a crash never leaves a
+		#half written cache behind
+		tmp_path = cache_path(file_name) + ".tmp"
+		with open(tmp_path, 'wb') as file:
+			file.write(CACHE_MAGIC)
+			pickle.dump(payload, file, protocol = pickle.HIGHEST_PROTOCOL)
+		os.replace(tmp_path, cache_path(file_name))
+	except OSError:
+		pass
@@ -0,0 +1,100 @@
+import os
+import time
+from multiprocessing import Pool
+from music import Score
+
+"""
+[NoteSet] stands in for a NoteImgCache or AudioPlayer when validating
+scores in worker processes, since neither of those can be pickled, or before
+the audio player is started. It only implements [has_note], which is all
+that Score needs for validation, and [get_pitches] like AudioPlayer.
+"""
+class NoteSet:
+	"""
+	[__init__ self notes round_to] creates a new NoteSet containing [notes].
+	If [round_to] is not None, notes are numbers that are rounded to
+	[round_to] decimal places before being compared (like NoteImgCache).
+	"""
+	def __init__(self, notes, round_to = None):
+		self.round_to = round_to
+		self.notes = frozenset(notes)
+
+	#[get_pitches self] returns the set of notes in this set
+	def get_pitches(self):
+		return set(self.notes)
+
+	#[has_note self note] returns whether [note] is in this set
+	def has_note(self, note):
+		if self.round_to != None:
+			note = round(note, self.round_to)
+		return note in self.notes
+
+#[load_score job] loads a single score described by the tuple [job] of
+#(file name, duration set, pitch set, use cache) and returns a tuple of
+#(file name, score, seconds taken to load)
+def load_score(job):
+	file_name, durations, pitches, use_cache = job
+	start = time.perf_counter()
+	score = Score(file_name, durations, pitches, use_cache = use_cache)
+	return (file_name, score, time.perf_counter() - start)
+
+"""
+[load_scores score_dir note_imgs player processes use_cache report file_names]
+loads every .scr file in [score_dir] (or only the files in [file_names] if it
+is not None) using a pool of [processes] worker processes
+(one per core if None, in this process if 1) and returns a tuple of
+(valid scores, results), where results is a list of (file name, score,
+seconds) for every file, including the invalid ones. The returned scores are
+bound to [note_imgs] and [player]. If [report] is True, an aggregated report
+of the load is printed once all files have been loaded.
+"""
+def load_scores(score_dir, note_imgs, player, processes = None, \
+	use_cache = True, report = True, file_names = None):
+	durations = NoteSet(note_imgs.get_durations(), round_to = 3)
+	pitches = NoteSet(player.get_pitches())
+	if file_names == None:
+		file_names = os.listdir(score_dir)
+	jobs = []
+	for file_name in sorted(file_names):
+		if file_name.endswith(".scr"):
+			jobs.append((os.path.join(score_dir, file_name), durations, \
+				pitches, use_cache))
+	if processes == None:
+		processes = os.cpu_count() or 1
+	processes = min(processes, len(jobs))
+	start = time.perf_counter()
+	if processes <= 1:
+		results = [load_score(job) for job in jobs]
+	else:
+		with Pool(processes) as pool:
+			results = pool.map(load_score, jobs)
+	elapsed = time.perf_counter() - start
+	scores = []
+	for _, score, _ in results:
+		#Rebind what was dropped when the score was pickled
+		score.note_imgs = note_imgs
+		score.player = player
+		if score.valid:
+			scores.append(score)
+	if report:
+		print_report(results, elapsed, max(processes, 1))
+	return (scores, results)
+
+"""
+[print_report results elapsed processes] prints the per file load times in
+[results] (as returned by [load_scores]), slowest first, followed by every
+invalid file and the reason it is invalid. [elapsed] is the total time taken
+and [processes] the number of processes used.
+"""
+def print_report(results, elapsed, processes):
+	invalid = [(file_name, score) for file_name, score, _ in results \
+		if not score.valid]
+	print("Loaded {} scores ({} invalid) in {:.1f}ms using {} process(es)" \
+		.format(len(results), len(invalid), elapsed * 1000, processes))
+	for file_name, score, seconds in sorted(results, \
+		key = lambda result: result[2], reverse = True):
+		print("  {:8.2f}ms {}{}".format(seconds * 1000, \
+			os.path.basename(file_name), "" if score.valid else " (invalid)"))
+	for file_name, score in invalid:
+		print("{} is invalid. Error: {}".format(os.path.basename(file_name), \
+			" ".join(score.reason.split())))
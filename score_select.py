@@ -1,4 +1,5 @@
 import pygame
+import pitch_table
 from components import Btn, ImageBtn, Text, Line, Image, Stage
 from training import TrainingScore
 from game import GameScore
@@ -9,7 +10,7 @@ from assign_score import AssignScore
 #Please refer to components/Screen for documentation on each of the methods.
 class ScoreSelect:
 	def __init__(self, note_img_cache, player, key_input, scores \
-		, fps, train_mode = True):
+		, train_mode = True):
 		#Various settings
 		self.stage = Stage()
 		self.scores_per_page = 4
@@ -19,8 +20,8 @@ class ScoreSelect:
 		self.img_cache = note_img_cache
 		self.player = player
 		self.key_input = key_input
+		self.playable_pitches = key_input.get_playable_pitches()
 		self.train_mode = train_mode
-		self.fps = fps
 
 		self.colors = {}
 		self.colors["blue"] = (39, 117, 242)
@@ -45,6 +46,9 @@ class ScoreSelect:
 		self.stage.add_btn(self.up_btn)
 		self.stage.add_btn(self.down_btn)
 		self.stage.add_btn(self.select_btn)
+		#Lists the pitches of the selected score that can't be played on the
+		#input, which are played automatically
+		self.unplayable_txt = Text("", (120, 160), font_size = 16)
 		self.refresh_scores()
 
 	def bind_screen(self, parent_screen):
@@ -53,6 +57,9 @@ class ScoreSelect:
 	def draw(self, screen):
 		self.stage.draw(screen)
 
+	def get_dirty_rects(self):
+		return self.stage.get_dirty_rects()
+
 	def handle_click(self, pos):
 		self.stage.handle_click(pos)
 
@@ -76,17 +83,38 @@ class ScoreSelect:
 				score_btn.color = self.colors["blue"]
 			self.score_to_idx[score_name] = i
 			self.score_btns[i] = score_btn
+		self.refresh_unplayable()
+
+	#[refresh_unplayable self] shows the pitches of the selected score that
+	#can't be played on the input, if there are any
+	def refresh_unplayable(self):
+		self.stage.remove_elt(self.unplayable_txt)
+		if self.sel_idx == -1:
+			return
+		unplayable = self.scores[self.sel_idx].get_unplayable_pitches( \
+			self.playable_pitches)
+		if len(unplayable) == 0:
+			return
+		names = pitch_table.to_names(sorted(unplayable))
+		if len(names) > 4:
+			names = names[:4] + ["+{}".format(len(names) - 4)]
+		self.unplayable_txt.text = "Not on the keys: {}".format(" ".join(names))
+		self.stage.add_elt(self.unplayable_txt)
 
-	def advance_time(self, fps):
+	def advance_time(self, dt):
 		if self.return_from_mode:
 			self.return_from_mode = False
 			info = self.parent_screen.get_info()
 			if "early_notes" in info:
 				score_disp = AssignScore(info.pop("wrong_notes"), \
-					info.pop("early_notes"), info.pop("frames_used"), \
-					self.scores[self.sel_idx], fps)
+					info.pop("early_notes"), info.pop("time_used"), \
+					self.scores[self.sel_idx])
 				self.parent_screen.add_child(score_disp)
 
+	#Idle unless we just returned from a mode and may need to show its results
+	def is_idle(self):
+		return not self.return_from_mode
+
 	def on_exit_btn_click(self, btn, pos):
 		self.quit = True
 
@@ -104,7 +132,12 @@ class ScoreSelect:
 
 	def on_select_btn_click(self, btn, pos):
 		if self.sel_idx != -1:
-			score = self.scores[self.sel_idx]
+			#Only load the full score once it has been selected
+			score = self.scores[self.sel_idx].load()
+			if not score.valid:
+				print("{} is invalid. Error: {}".format(score.file_name, \
+					score.reason))
+				return
 			if self.train_mode:
 				train = TrainingScore(self.img_cache, self.player, \
 					self.key_input, score = score)
@@ -124,6 +157,7 @@ class ScoreSelect:
 			self.score_btns[self.sel_idx].color = self.colors["black"]
 		self.sel_idx = btn_idx
 		self.score_btns[self.sel_idx].color = self.colors["blue"]
+		self.refresh_unplayable()
 
 	def has_quit(self):
 		return self.quit
\ No newline at end of file
@@ -19,6 +19,8 @@ class TrainingScore(RenderedScore):
 		#Take in key inputs
 		self.key_input = key_input
 		self.playable_pitches = key_input.get_playable_pitches()
+		#Keys pressed before this screen started (ie in the menus) aren't played
+		key_input.get_events()
 		self.quit = False
 		self.paused = False
 		self.playback_rate_idx = 4
@@ -35,10 +37,13 @@ class TrainingScore(RenderedScore):
 		self.ffwd_btn = ImageBtn('./img/fast_forward.png', (160, 200), \
 			on_click = self.on_ffwd_btn_click, dimen = (20, 20))
 		self.pace_txt = Text("1.0x Pace", (240, 200), font_size = 20)
+		self.restart_btn = Btn("|<", (295, 200), on_click = \
+			self.on_restart_btn_click, font_size = 24)
 		self.stage.add_btn(self.play_btn)
 		self.stage.add_btn(self.exit_btn)
 		self.stage.add_btn(self.slow_btn)
 		self.stage.add_btn(self.ffwd_btn)
+		self.stage.add_btn(self.restart_btn)
 		self.stage.add_elt(self.pace_txt)
 
 	"""
@@ -64,6 +69,13 @@ class TrainingScore(RenderedScore):
 	def on_exit_btn_click(self, btn, pos):
 		self.quit = True
 
+	"""
+	[on_restart_btn_click self btn pos] is called when the restart button is
+	clicked. This restarts playback from the first bar on the current page.
+	"""
+	def on_restart_btn_click(self, btn, pos):
+		self.seek_bar(self.curr_bar_idx - self.curr_bar_idx % self.num_bars)
+
 	"""
 	[on_ffwd_btn_click self btn pos] is called when the faster
 	button is clicked
@@ -103,17 +115,15 @@ class TrainingScore(RenderedScore):
 			if pitch in self.played_pitches:
 				self.played_pitches.remove(pitch)
 
-	#[advance_time self fps] steps through one frame at [fps] frames
-	#per second. This causes the playback to advance according to
-	#[self.advance_rate]
-	def advance_time(self, fps):
+	#[advance_time self dt] advances the playback by [dt] seconds (the time
+	#taken by the previous frame) according to [self.advance_rate]
+	def advance_time(self, dt):
 		if not self.paused:
-			super().advance_time(fps)
+			super().advance_time(dt)
 		#Consume updates from input
 		#Use input directly when paused
 		self.key_input.poll()
-		updates = self.key_input.get_updates()
-		for pitch, is_pressed in updates.items():
+		for pitch, is_pressed, _ in self.key_input.get_events():
 			#print("Update: {}, {}".format(pitch, is_pressed))
 			if is_pressed:
 				self.played_pitches.add(pitch)
@@ -130,7 +140,7 @@ class TrainingScore(RenderedScore):
 		bass_pitches = self.get_curr_pitches(False)
 		corr_pitches = set()
 		wrong_pitches = set()
-		for pitch in treble_pitches + bass_pitches:
+		for pitch in set(treble_pitches).union(bass_pitches):
 			if pitch not in self.playable_pitches:
 				corr_pitches.add(pitch)
 			elif pitch in self.played_pitches:
@@ -140,6 +150,11 @@ class TrainingScore(RenderedScore):
 		self.change_curr_pitch_color(corr_pitches, self.colors['green'])
 		self.change_curr_pitch_color(wrong_pitches, self.colors['red'])
 
+	#[is_idle self] returns whether nothing changes until the next event,
+	#which is the case while paused if the input wakes the main loop
+	def is_idle(self):
+		return self.paused and self.key_input.is_event_driven()
+
 	#[has_quit self] queries whether this score has quitted
 	def has_quit(self):
 		if super().has_quit():